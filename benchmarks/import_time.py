@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+'''
+    This script measures how long it takes to start up Mystiks, by timing a few
+    imports in fresh interpreters. It is meant to be run by hand (or in CI)
+    whenever startup is touched:
+
+        python benchmarks/import_time.py --runs 20
+'''
+from argparse import ArgumentParser
+from statistics import median
+from subprocess import run
+from sys import executable
+from time import perf_counter
+
+
+STATEMENTS = {
+    'CLI': 'import mystiks',
+    'Searcher': 'import mystiks.searcher',
+    'Finding registry': 'from mystiks.findings import get_registry; get_registry()',
+    'All findings': 'from mystiks.findings import FINDINGS',
+}
+
+
+def time_statement(statement, runs):
+    timings = []
+
+    for _ in range(runs):
+        started_at = perf_counter()
+        run([executable, '-c', statement], check=True)
+        timings.append(perf_counter() - started_at)
+
+    return timings
+
+
+def main():
+    parser = ArgumentParser(description='Measures how long it takes to import Mystiks')
+    parser.add_argument('-r', '--runs', type=int, default=10, help='The amount of times to run each import (Default: 10)')
+    arguments = parser.parse_args()
+
+    # We time an empty interpreter first, so that its startup can be told
+    # apart from the imports themselves.
+    baseline = median(time_statement('pass', arguments.runs))
+    print(f'[i] Interpreter startup: {baseline * 1000:.1f}ms')
+
+    for name, statement in STATEMENTS.items():
+        timings = time_statement(statement, arguments.runs)
+        print(f'[i] {name}: {(median(timings) - baseline) * 1000:.1f}ms (median of {arguments.runs}, best {(min(timings) - baseline) * 1000:.1f}ms)')
+
+
+if __name__ == '__main__':
+    main()
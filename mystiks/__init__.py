@@ -1,13 +1,17 @@
 #!/usr/bin/env python3
 from argparse import ArgumentParser
-from json import dumps as to_json
+from contextlib import ExitStack
+from importlib.util import find_spec
 from pathlib import Path
-from shutil import Error as CopyError, copytree, rmtree
+from shutil import Error as CopyError, copytree
 from sys import exit
 from time import time
 
+from .manifests import COMPRESSIONS, get_zstd, load_manifest
 from .utilities import unit_size_to_bytes
-from .searcher import build_manifest
+
+
+__all__ = ['load_manifest', 'main']
 
 
 def main():
@@ -18,8 +22,15 @@ def main():
     parser.add_argument('-l', '--limit', default='500MB', help='The maximum size a searchable file can be (Default: 500MB)')
     parser.add_argument('-t', '--threads', type=int, help='The amount of threads to use for searching (Default: Count of CPU cores)')
     parser.add_argument('-c', '--context', type=int, default=128, help='The amount of context to capture (Default: 128 bytes)')
-    parser.add_argument('-f', '--formats', default='HTML,JSON', help='A comma-seperated list of formats to output (Default: HTML,JSON)')
-    parser.add_argument('-u', '--utf16', action='store_true', help='Whether to search for UTF-16 strings (Default: Ignore UTF-16)')
+    parser.add_argument('-f', '--formats', default='HTML,JSON', help='A comma-seperated list of formats to output: HTML, JSON, SQLITE or MSGPACK (Default: HTML,JSON)')
+    parser.add_argument('-z', '--compression', default='none', choices=COMPRESSIONS, help='How to compress the MessagePack manifest (Default: none)')
+    parser.add_argument('-m', '--mmap-threshold', default='64MB', help='The size above which files are memory-mapped instead of read (Default: 64MB)')
+    parser.add_argument('-k', '--chunk-size', help='When set, files above the limit are scanned in chunks of this size instead of being skipped (Default: Skip)')
+    parser.add_argument('-p', '--processes', type=int, default=0, help='The amount of processes to use for filtering and scoring matches (Default: 0, score in-process)')
+    parser.add_argument('-g', '--gitignore', action='store_true', help='Whether to skip files matched by .gitignore and .ignore files (Default: Scan ignored files)')
+    parser.add_argument('--cache', help='A file to cache matches in, so that unchanged files are skipped on the next search (Default: No cache)')
+    parser.add_argument('--rebuild-cache', action='store_true', help='Whether to ignore the contents of the cache and rebuild it from scratch (Default: Use the cache)')
+    parser.add_argument('-u', '--utf16', action='store_true', help='Whether to search for UTF-16 strings inside of other files (Default: Only UTF-16 files)')
     arguments = parser.parse_args()
 
     # We start out by making sure that the target path exists.
@@ -33,77 +44,105 @@ def main():
     output_formats = [output_format.upper() for output_format in arguments.formats.split(',')]
 
     if not output_formats:
-        print('[-] You must specify at least one format: HTML,JSON')
+        print('[-] You must specify at least one format: HTML,JSON,SQLITE,MSGPACK')
         exit()
 
     for output_format in output_formats:
-        if output_format not in ('HTML', 'JSON'):
+        if output_format not in ('HTML', 'JSON', 'SQLITE', 'MSGPACK'):
             print('[-] You specified an invalid output format:', output_format)
             exit()
 
+    # The binary manifest relies on optional packages, so we make sure that
+    # they are installed before searching.
+    if 'MSGPACK' in output_formats:
+        if find_spec('msgpack') is None:
+            print('[-] To output MessagePack, please install msgpack: pip install msgpack')
+            exit()
+
+        if arguments.compression == 'zstd':
+            try:
+                get_zstd()
+            except ImportError:
+                print('[-] To compress with Zstandard, please install zstandard: pip install zstandard')
+                exit()
+
     max_file_size = unit_size_to_bytes(arguments.limit)
-    file_name_map = None
-    delete_after = False
+    mmap_threshold = unit_size_to_bytes(arguments.mmap_threshold)
+    chunk_size = unit_size_to_bytes(arguments.chunk_size) if arguments.chunk_size else None
+    contents = None
 
+    # Burp exports are streamed straight into the search, one request (or
+    # response) at a time, rather than being unpacked onto the disk first.
     if target_path.is_file() and target_path.suffix.lower() == '.xml':
-        try:
-            from bs4 import BeautifulSoup
-            from .burp import is_burp_xml, extract_requests
+        from .burp import is_burp_xml, iterate_requests
 
-            file_size = target_path.stat().st_size
+        if is_burp_xml(target_path):
+            contents = iterate_requests(target_path)
 
-            if file_size < max_file_size:
-                with open(target_path, 'r') as file:
-                    soup = BeautifulSoup(file.read(), features='xml')
+    output_path = Path(arguments.output or 'Mystiks-{}'.format(round(time())))
+    output_path.mkdir(exist_ok=True)
 
-                if is_burp_xml(soup):
-                    target_path, file_name_map = extract_requests(soup)
-                    delete_after = True
-            else:
-                print('[-] The supplied file is too big:', file_size, '>', max_file_size)
-                exit()
-        except ImportError:
-            print('[-] To extract requests from Burp XML, please install BeautifulSoup4 (and LXML): pip install beautifulsoup4 lxml')
+    # This is where the majority of work happens. The searcher is imported
+    # here, so that the CLI starts (and fails on bad arguments) quickly.
+    from .searcher import build_manifest
+    from .writers import HTMLManifestWriter, JSONManifestWriter, MessagePackManifestWriter, SQLiteManifestWriter
 
-    # This is where the majority of work happens.
     print('[i] Searching for findings, this may take a while:', target_path)
 
-    manifest = build_manifest(
-        path=target_path,
-        desired_context=arguments.context,
-        max_file_size=max_file_size,
-        max_threads=arguments.threads,
-        manifest_name=arguments.name,
-        include_utf16=arguments.utf16,
-        file_name_map=file_name_map
-    )
-
-    output_path = Path(arguments.output or 'Mystiks-{}'.format(round(time())))
-    output_path.mkdir(exist_ok=True)
+    # Each format is written out while the findings are being scored, so the
+    # report never has to be held in memory as a whole.
+    with ExitStack() as stack:
+        writers = []
+
+        if 'HTML' in output_formats:
+            # Sometimes this can fail, even though it actually worked. To
+            # account for this, we just ignore all errors.
+            try:
+                copytree(Path(__file__).parent / 'report', output_path, dirs_exist_ok=True)
+            except CopyError:
+                pass
+
+            writers.append(stack.enter_context(HTMLManifestWriter(output_path / 'scripts')))
+        if 'JSON' in output_formats:
+            writers.append(stack.enter_context(JSONManifestWriter(output_path / 'report.json', indent=' ' * 4)))
+        if 'SQLITE' in output_formats:
+            writers.append(stack.enter_context(SQLiteManifestWriter(output_path / 'report.sqlite')))
+        if 'MSGPACK' in output_formats:
+            compression = None if arguments.compression == 'none' else arguments.compression
+            suffix = {None: '', 'gzip': '.gz', 'zstd': '.zst'}[compression]
+            writers.append(stack.enter_context(MessagePackManifestWriter(output_path / f'report.msgpack{suffix}', compression)))
+
+        manifest = build_manifest(
+            path=target_path,
+            desired_context=arguments.context,
+            max_file_size=max_file_size,
+            max_threads=arguments.threads,
+            manifest_name=arguments.name,
+            include_utf16=arguments.utf16,
+            contents=contents,
+            mmap_threshold=mmap_threshold,
+            chunk_size=chunk_size,
+            scoring_workers=arguments.processes,
+            use_ignore_files=arguments.gitignore,
+            cache_path=arguments.cache,
+            rebuild_cache=arguments.rebuild_cache,
+            writers=writers
+        )
 
     if 'HTML' in output_formats:
-        # Sometimes this can fail, even though it actually worked. To account
-        # for this, we just ignore all errors.
-        try:
-            copytree(Path(__file__).parent / 'report', output_path, dirs_exist_ok=True)
-        except CopyError:
-            pass
-
-        with open(output_path / 'scripts/data.js', 'w') as file:
-            file.write('window.manifest=' + to_json(manifest, separators=(',', ':')))
-
         print('[+] An HTML copy of the report has been saved to:', output_path.resolve())
     if 'JSON' in output_formats:
-        with open(output_path / 'report.json', 'w') as file:
-            file.write(to_json(manifest, indent=' ' * 4))
-
         print('[+] A JSON copy of the report has been saved to:', output_path.resolve())
-
-    if delete_after:
-        rmtree(target_path)
+    if 'SQLITE' in output_formats:
+        print('[+] A SQLite copy of the report has been saved to:', output_path.resolve())
+    if 'MSGPACK' in output_formats:
+        print('[+] A MessagePack copy of the report has been saved to:', output_path.resolve())
 
     print('[+] All operations have finished!')
-    print('[i] Findings discovered:', len(manifest['findings']))
+    print('[i] Findings discovered:', len(manifest['sorting']))
     print('[i] Files scanned:', manifest['metadata']['totalFilesScanned'])
     print('[i] Directories scanned:', manifest['metadata']['totalDirectoriesScanned'])
+    print('[i] Duplicate files skipped:', manifest['metadata']['totalDuplicateFiles'])
+    print('[i] Files by class:', ', '.join(f'{name}={count}' for name, count in manifest['metadata']['fileClasses'].items()))
     print('[i] Scanning took:', manifest['metadata']['completedAt'] - manifest['metadata']['startedAt'], 'second(s)')
+    print('[i] Scoring took:', manifest['metadata']['scoringTime'], 'second(s)')
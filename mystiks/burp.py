@@ -1,31 +1,58 @@
 #!/usr/bin/env python3
 from base64 import standard_b64decode
-from secrets import token_hex
-from pathlib import Path
-from tempfile import mkdtemp
+from xml.etree.ElementTree import ParseError, iterparse
 
 
-def is_burp_xml(soup):
-    items = soup.find('items')
+def is_burp_xml(path):
+    '''
+        This function checks whether the given file is a Burp export, which is
+        told apart by the version on its root element. Only the start of the
+        file is ever parsed.
+    '''
+    try:
+        for _, element in iterparse(path, events=('start',)):
+            return element.tag == 'items' and 'burpVersion' in element.attrib
+    except ParseError:
+        pass
 
-    if not items:
-        return False
+    return False
 
-    return items.has_attr('burpVersion')
 
+def decode_body(element):
+    # Burp marks whether each body was Base64 encoded, which it is by default.
+    if element.get('base64', 'true') == 'true':
+        return standard_b64decode(element.text)
 
-def extract_requests(soup):
-    temporary_folder = Path(mkdtemp())
-    file_name_map = {}
+    return element.text.encode()
 
-    for item in soup.find_all('item'):
-        alias = token_hex(16)
-        file_name_map[alias] = item.find('url').string
 
-        with open(temporary_folder / (alias + '-request'), 'wb') as file:
-            file.write(standard_b64decode(item.find('request').string))
+def iterate_requests(path):
+    '''
+        This function streams the requests and responses out of a Burp export,
+        yielding the name and contents of each one. Items are parsed one at a
+        time and discarded once they have been yielded, so even huge exports
+        are read with a bounded amount of memory.
 
-        with open(temporary_folder / (alias + '-response'), 'wb') as file:
-            file.write(standard_b64decode(item.find('response').string))
+        Each body is named by its URL. Since the same URL is often requested
+        more than once, repeats are numbered in the order that they appear.
+    '''
+    events = iterparse(path, events=('start', 'end'))
+    _, root = next(events)
+    url_counts = {}
 
-    return temporary_folder, file_name_map
+    for event, element in events:
+        if event != 'end' or element.tag != 'item':
+            continue
+
+        url = element.findtext('url', '')
+        url_counts[url] = url_counts.get(url, 0) + 1
+        url_name = url if url_counts[url] == 1 else f'{url} (#{url_counts[url]})'
+
+        for tag, direction in (('request', 'Request ->'), ('response', 'Response <-')):
+            body = element.find(tag)
+
+            if body is not None and body.text:
+                yield f'{direction} {url_name}', decode_body(body)
+
+        # We throw away every item that has been handled so far.
+        root.clear()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_all_start_methods, get_context
+
+
+# Search matches live in the Rust core and can't be pickled, so a snapshot of
+# their attributes is what gets sent to worker processes.
+MatchSnapshot = namedtuple('MatchSnapshot', (
+    'uuid',
+    'file_name',
+    'pattern',
+    'pattern_tag',
+    'encoding',
+    'groups',
+    'capture',
+    'relative_capture_start',
+    'relative_capture_end',
+    'capture_start',
+    'capture_end',
+    'context',
+    'context_start',
+    'context_end',
+    'segment',
+    'segment_start',
+    'segment_end',
+    'relative_context_start',
+    'relative_context_end',
+))
+
+
+def take_snapshot(match, segment):
+    '''
+        This function takes a snapshot of a match, along with the segment its
+        context was cut from. Nearby matches should be given the same segment
+        object, so that it is only pickled once for all of them.
+    '''
+    return MatchSnapshot(
+        uuid=match.uuid,
+        file_name=match.file_name,
+        pattern=match.pattern,
+        pattern_tag=match.pattern_tag,
+        encoding=match.encoding,
+        groups=match.groups,
+        capture=match.capture,
+        relative_capture_start=match.relative_capture_start,
+        relative_capture_end=match.relative_capture_end,
+        capture_start=match.capture_start,
+        capture_end=match.capture_end,
+        context=match.context,
+        context_start=match.context_start,
+        context_end=match.context_end,
+        segment=segment,
+        segment_start=match.segment_start,
+        segment_end=match.segment_end,
+        relative_context_start=match.relative_context_start,
+        relative_context_end=match.relative_context_end
+    )
+
+
+def is_free_threaded():
+    '''
+        This function checks whether Python is running without the GIL, in
+        which case filters can run on threads instead of processes.
+    '''
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+def create_executor(max_workers):
+    '''
+        This function creates the pool that shards are scored in. Workers are
+        never forked from this process, since the core's scanning threads are
+        still running, and a fork could inherit locks which they hold.
+    '''
+    if is_free_threaded():
+        return ThreadPoolExecutor(max_workers=max_workers)
+
+    start_method = 'forkserver' if 'forkserver' in get_all_start_methods() else 'spawn'
+
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context(start_method))
+
+
+def run_filters(finding, matches):
+    '''
+        This function runs a shard of matches through their finding's filter,
+        and returns whether each one should be kept. Filters which fail are
+        reported by their finding's name.
+    '''
+    try:
+        return [not should_filter for should_filter in finding.get_batch_filters(matches)]
+    except Exception as error:
+        raise RuntimeError(f'Failed to filter the finding: {finding.name}') from error
@@ -1,8 +1,14 @@
 #!/usr/bin/env python3
 from math import log2
+from os import environ
 from pathlib import Path
 from importlib import import_module
-from re import finditer, match as match_regex
+from functools import lru_cache
+from re import compile as RegEx
+
+from ..mystiks_core import batch_shannon_entropy, batch_relative_shannon_entropy, \
+    batch_sequence_rating, batch_character_counts
+from ..patterns import PatternRegistry
 
 
 class Finding:
@@ -12,6 +18,38 @@ class Finding:
     def get_indicators(this, context, capture, capture_start, capture_end, groups):
         return [('Capture matches pattern', 1)]
 
+    @classmethod
+    def get_batch_filters(this, matches):
+        '''
+            This function gets whether each match in a batch should be
+            filtered out. Findings which rely on heavier metrics in their
+            filter can override it to calculate them in one go.
+        '''
+        filter_function = getattr(this, 'should_filter_match', None)
+
+        if not filter_function:
+            return [False] * len(matches)
+
+        return [bool(filter_function(match)) for match in matches]
+
+    @classmethod
+    def get_batch_indicators(this, matches):
+        '''
+            This function gets the indicators for a whole batch of matches at
+            once, which all belong to this finding. Findings which rely on
+            heavier metrics can override it to calculate them in one go.
+        '''
+        # The context is always UTF-8, even when the match was found in UTF-16
+        # text, so the capture's position within it is given separately from
+        # its position in the file.
+        return [this.get_indicators(
+            context=match.context,
+            capture=match.capture,
+            capture_start=match.relative_capture_start,
+            capture_end=match.relative_capture_end,
+            groups=match.groups
+        ) for match in matches]
+
 
 class SecretFinding(Finding):
     @classmethod
@@ -106,8 +144,18 @@ def build_pronouncable_regex():
     return r'(?i)^{1}?{1}?({0}+{1}{1}?)*{0}*$'.format(vowel_regex, consonant_regex)
 
 
+# These regexes are used by the helpers below for every capture, so they are
+# compiled once, up front.
+_PRONOUNCEABLE_REGEX = RegEx(build_pronouncable_regex())
+_WORD_REGEX = RegEx(r'(?:([A-Z]?[a-z]{2,}))|(?:([a-z]?[A-Z]{2,}))')
+_CHARACTER_CLASS_REGEX = RegEx(r'(?i)([a-z]+)|([0-9]+)|([^a-z0-9]+)')
+
+
+@lru_cache(maxsize=4096)
 def check_pronounceable_by_regex(string):
-    return match_regex(build_pronouncable_regex(), string) != None
+    # The same words come up again and again across captures, and the
+    # pronounceable regex backtracks a lot, so its results are memoized.
+    return _PRONOUNCEABLE_REGEX.match(string) != None
 
 
 def check_pronounceable_by_repetition(string, max_vowel_repetitions=3, max_consonant_repetitions=4):
@@ -134,7 +182,7 @@ def check_pronounceable_by_repetition(string, max_vowel_repetitions=3, max_conso
 def get_pronounceable_rating(string):
     pronouncable = 0
 
-    for match in finditer(r'(?:([A-Z]?[a-z]{2,}))|(?:([a-z]?[A-Z]{2,}))', string):
+    for match in _WORD_REGEX.finditer(string):
         factor = 0
 
         if check_pronounceable_by_repetition(match.group(0)):
@@ -153,7 +201,7 @@ def get_character_counts(string):
     number_count = 0
     symbol_count = 0
 
-    for match in finditer(r'(?i)([a-z]+)|([0-9]+)|([^a-z0-9]+)', string):
+    for match in _CHARACTER_CLASS_REGEX.finditer(string):
         letters, numbers, symbols = match.group(1, 2, 3)
 
         if letters:
@@ -166,16 +214,161 @@ def get_character_counts(string):
     return letter_count, number_count, symbol_count
 
 
-# We automatically build out a list of available findings.
-FINDINGS = []
+def get_batch_shannon_entropy(strings):
+    '''
+        This function calculates the Shannon entropy of many strings (or byte
+        strings) at once, natively. Empty strings have an entropy of zero.
+    '''
+    return batch_shannon_entropy(list(strings))
+
+
+def get_batch_relative_shannon_entropy(strings):
+    '''
+        This function calculates the relative Shannon entropy of many strings
+        at once. Strings with fewer than two distinct characters are given a
+        relative entropy of zero.
+    '''
+    return batch_relative_shannon_entropy(list(strings))
+
+
+def get_batch_sequence_rating(strings, max_distance=1):
+    '''
+        This function calculates the sequence rating of many strings at once.
+        Strings shorter than two characters are given a rating of zero.
+    '''
+    return batch_sequence_rating(list(strings), max_distance)
+
+
+def get_batch_character_counts(strings):
+    '''
+        This function counts the letters, numbers and symbols of many strings
+        at once, returning a tuple of the three for each of them.
+    '''
+    return batch_character_counts(list(strings))
+
+
+def get_index_path():
+    '''
+        This function gets where the finding index is cached, which is kept
+        outside of the package in case it is installed read-only.
+    '''
+    cache_path = environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(cache_path) / 'mystiks' / 'findings.json'
+
+
+def get_module_stamps():
+    '''
+        This function gets the size and modification time of every finding
+        module, which is how a cached index is known to be up to date.
+    '''
+    stamps = {}
+
+    for file in Path(__file__).parent.glob('*.py'):
+        # We skip any files that my be internally used by Python.
+        if file.name.startswith('__'):
+            continue
+
+        stat = file.stat()
+        stamps[file.stem] = [stat.st_size, stat.st_mtime_ns]
+
+    return stamps
+
+
+def load_module_findings(module_name):
+    return getattr(import_module(f'mystiks.findings.{module_name}'), 'FINDINGS', None) or []
+
+
+def build_index(sources):
+    '''
+        This function imports every finding module and indexes the patterns of
+        their findings, so that later runs don't have to import them.
+    '''
+    entries = []
+
+    for module_name in sorted(sources['modules']):
+        module_findings = load_module_findings(module_name)
+
+        for entry in PatternRegistry.from_findings(module_findings).entries:
+            entry['module'] = module_name
+            entries.append(entry)
+
+    return PatternRegistry(entries, sources)
+
+
+@lru_cache(maxsize=None)
+def get_registry(index_path=None):
+    '''
+        This function gets a pattern registry of every available finding. It
+        is loaded from the cached index when that is up to date, and otherwise
+        the index is rebuilt (and saved, when possible).
+    '''
+    index_path = Path(index_path or get_index_path())
+    sources = {
+        'directory': str(Path(__file__).parent),
+        'modules': get_module_stamps()
+    }
+
+    try:
+        registry = PatternRegistry.load(index_path)
+    except (OSError, ValueError, KeyError):
+        registry = None
+
+    if registry is None or registry.sources != sources:
+        registry = build_index(sources)
+
+        # The index is only a cache, so if it can't be saved, we carry on.
+        try:
+            index_path.parent.mkdir(parents=True, exist_ok=True)
+            registry.save(index_path)
+        except OSError:
+            pass
+
+    return registry
+
+
+@lru_cache(maxsize=None)
+def get_finding(name):
+    '''
+        This function gets a finding by its name, only importing the module it
+        was indexed from.
+    '''
+    for entry in get_registry().entries:
+        if entry['name'] != name:
+            continue
+
+        for finding in load_module_findings(entry['module']):
+            if finding.name == name:
+                return finding
+
+    # If the finding has moved since it was indexed, we fall back to looking
+    # through every finding.
+    for finding in load_findings():
+        if finding.name == name:
+            return finding
+
+    raise KeyError(f'The finding does not exist: {name}')
+
+
+def load_findings():
+    '''
+        This function imports every finding module and builds out the full
+        list of findings, which is kept as FINDINGS once it has been built.
+    '''
+    if 'FINDINGS' not in globals():
+        findings = []
+
+        for module_name in sorted(get_module_stamps()):
+            findings.extend(load_module_findings(module_name))
+
+        globals()['FINDINGS'] = findings
+
+    return globals()['FINDINGS']
 
-for file in Path(__file__).parent.glob('*.py'):
-    # We skip any files that my be internally used by Python.
-    if file.name.startswith('__'):
-        continue
 
-    # We extend out the findings list with our types.
-    module_findings = getattr(import_module(f'mystiks.findings.{file.stem}'), 'FINDINGS', None)
+def __getattr__(name):
+    # The full list of findings is only built when it is asked for, since
+    # doing so imports every finding module.
+    if name == 'FINDINGS':
+        return load_findings()
 
-    if module_findings:
-        FINDINGS.extend(module_findings)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
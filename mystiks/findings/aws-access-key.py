@@ -14,6 +14,10 @@ class AmazonAccessKeyID(SecretFinding):
         r'A[SK]IA[A-Z2-7]{16}'
     ]
 
+    keywords = [
+        ['AKIA', 'ASIA']
+    ]
+
     ideal_rating = 3
 
     @classmethod
@@ -14,6 +14,10 @@ class DigitalOceanToken(SecretFinding):
         r'dop_v([0-9\._]+)_[a-f0-9]{64}'
     ]
 
+    keywords = [
+        ['dop_v']
+    ]
+
     ideal_rating = 3
 
     @classmethod
@@ -120,6 +120,10 @@ class EMail(SecretFinding):
         r'(?i)([a-z0-9\-\+\.]{2,})@(([a-z0-9\-\.]+)\.([a-z]{2,}))',
     ]
 
+    keywords = [
+        ['@']
+    ]
+
     ideal_rating = 3
 
     @classmethod
@@ -13,6 +13,10 @@ class GoogleToken(SecretFinding):
         r'AIza[A-Za-z0-9\-_]{35}'
     ]
 
+    keywords = [
+        ['AIza']
+    ]
+
     ideal_rating = 2
 
 
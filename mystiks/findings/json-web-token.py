@@ -4,9 +4,7 @@ from json import loads as from_json
 from json.decoder import JSONDecodeError
 from binascii import Error as BinError
 
-from . import SecretFinding, get_pronounceable_rating, \
-    get_shannon_entropy, get_sequence_rating, get_character_counts, \
-    get_relative_shannon_entropy
+from . import SecretFinding, get_sequence_rating, get_batch_sequence_rating
 
 
 class JSONWebToken(SecretFinding):
@@ -23,11 +21,22 @@ class JSONWebToken(SecretFinding):
     ideal_rating = 6
 
     @classmethod
-    def should_filter_match(this, match):
-        capture = match.capture.decode()
+    def get_batch_filters(this, matches):
+        # We calculate the sequence rating for the whole batch at once.
+        sequence_ratings = get_batch_sequence_rating([match.capture.decode() for match in matches])
+
+        return [this.should_filter_match(
+            match,
+            sequence_rating=sequence_rating
+        ) for match, sequence_rating in zip(matches, sequence_ratings)]
+
+    @classmethod
+    def should_filter_match(this, match, sequence_rating=None):
+        if sequence_rating is None:
+            sequence_rating = get_sequence_rating(match.capture.decode())
 
         # If the match appears to be some kind of sequence, we skip it.
-        if get_sequence_rating(capture) > 0.5:
+        if sequence_rating > 0.5:
             return True
 
         # We try to decode the header section first.
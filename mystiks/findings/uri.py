@@ -22,6 +22,13 @@ class URI(SecretFinding):
         r'(?i)^(?:(?:[a-z0-9]+)?://)?(?:(?:[a-z0-9\-]+\.){1,}[a-z0-9\-]+)(?:/[a-z0-9\-\+_\.%/?:&=\[\]{}#]*)?$'
     ]
 
+    # The second pattern may omit the protocol, so it has no fixed literal
+    # that we can require before running it.
+    keywords = [
+        ['://'],
+        None
+    ]
+
     ideal_rating = 3
 
     @classmethod
@@ -1,12 +1,16 @@
 #!/usr/bin/env python3
-from math import log, exp
+from math import log
 from json import dumps as to_json, loads as from_json
 from pathlib import Path
-from re import compile as RegEx, finditer
+
+from ...mystiks_core import GibberishModel
 
 
 ACCEPTED_CHARACTERS = 'abcdefghijklmnopqrstuvwxyz '
 
+# Text which is rated below this is considered to be gibberish.
+GIBBERISH_THRESHOLD = 0.015
+
 
 positions = {character: index for index, character in enumerate(ACCEPTED_CHARACTERS)}
 
@@ -49,50 +53,36 @@ def train(filename='big.txt'):
     return counts
 
 
-def get_gibberish_score(text, model):
-    """Return the average transition probability of l using the model."""
-    log_prob = 0.0
-    transition_ct = 0
+def create_model(model):
+    """Return a compiled model, compiling it first if it is still a matrix."""
+    if isinstance(model, GibberishModel):
+        return model
 
-    for a, b in ngram(2, text):
-        log_prob += model[positions[a]][positions[b]]
-        transition_ct += 1
+    return GibberishModel(model)
 
-    return exp(log_prob / (transition_ct or 1))
 
-
-_WORD_PATTERN = RegEx(r'(?:([A-Z]?[a-z]{2,}))|(?:([a-z]?[A-Z]{2,}))')
+def get_gibberish_score(text, model):
+    """Return the average transition probability of l using the model."""
+    return create_model(model).score(text)
 
 
-def is_gibberish(text, model, threshold=0.05, overall_threshold=0.5):
+def is_gibberish(text, model, threshold=GIBBERISH_THRESHOLD, overall_threshold=None):
     """Detect if text is gibberish based on the model and threshold."""
-    gibberish_rating = 0
-
-    for match in _WORD_PATTERN.finditer(text):
-        score = get_gibberish_score(text, model)
-
-        # if score < threshold:
-        #     gibberish_rating += len(match.group())
-
-        # ratings.append((len(match), score))
-        gibberish_rating += score * len(match.group())
-
-    rating = gibberish_rating / len(text)
-
-    # print(rating, '==>>', text)
-
-    # if rating > threshold:
-    # print(gibberish_rating, len(text), gibberish_rating / len(text), text)
+    # Older callers passed the cutoff as the overall threshold, which is
+    # still accepted in place of the threshold.
+    if overall_threshold is not None:
+        threshold = overall_threshold
 
-    return rating < 0.015
-    # return rating < 0.01
+    # The text is scored once, and that score is weighted by the length of
+    # each word found in it.
+    return create_model(model).rate(text) < threshold
 
 
 def load_model(path='gibberish.json'):
     with open(Path(__file__).parent / path, 'r') as file:
         model = from_json(file.read())['counts']
 
-    return model
+    return GibberishModel(model)
 
 
 if __name__ == '__main__':
@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-from . import SecretFinding, get_shannon_entropy
+from . import SecretFinding, get_shannon_entropy, get_batch_shannon_entropy
 
 
 class UUID(SecretFinding):
@@ -17,11 +17,27 @@ class UUID(SecretFinding):
     ideal_rating = 3
 
     @classmethod
-    def get_indicators(this, context, capture, capture_start, capture_end, groups):
+    def get_batch_indicators(this, matches):
+        # We remove all dashes in order to better calculate the UUID's entropy,
+        # and calculate it for the whole batch at once.
+        entropies = get_batch_shannon_entropy([match.capture.replace(b'-', b'') for match in matches])
+
+        return [this.get_indicators(
+            context=match.context,
+            capture=match.capture,
+            capture_start=match.relative_capture_start,
+            capture_end=match.relative_capture_end,
+            groups=match.groups,
+            entropy=entropy
+        ) for match, entropy in zip(matches, entropies)]
+
+    @classmethod
+    def get_indicators(this, context, capture, capture_start, capture_end, groups, entropy=None):
         indicators = super().get_indicators(context, capture, capture_start, capture_end, groups)
 
         # We remove all dashes in order to better calculate the UUID's entropy.
-        entropy = get_shannon_entropy(capture.replace(b'-', b''))
+        if entropy is None:
+            entropy = get_shannon_entropy(capture.replace(b'-', b''))
 
         # If the UUID's entropy is significantly low, due to repetitions of the
         # same number for instance, it is likely not secret.
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+import gzip
+from base64 import standard_b64decode
+from json import loads as from_json
+
+
+# This is written at the start of every binary manifest, and is bumped
+# whenever the layout of its records changes.
+MANIFEST_FORMAT = 'mystiks-manifest'
+MANIFEST_VERSION = 2
+
+COMPRESSIONS = ('none', 'gzip', 'zstd')
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# This is how much of a binary manifest is read at a time.
+READ_SIZE = 1024 * 1024
+
+
+def get_zstd():
+    '''
+        This function gets a Zstandard module, preferring the one built into
+        newer versions of Python. Both of them provide the same "open".
+    '''
+    try:
+        from compression import zstd
+    except ImportError:
+        import zstandard as zstd
+
+    return zstd
+
+
+def open_manifest_file(path, mode='rb', compression=None):
+    '''
+        This function opens a manifest file, compressed with the given method
+        (either "gzip" or "zstd"), or uncompressed when none is given.
+    '''
+    if compression == 'gzip':
+        return gzip.open(path, mode)
+    elif compression == 'zstd':
+        return get_zstd().open(path, mode)
+
+    return open(path, mode)
+
+
+def detect_compression(path):
+    with open(path, 'rb') as file:
+        magic = file.read(4)
+
+    if magic.startswith(GZIP_MAGIC):
+        return 'gzip'
+    elif magic.startswith(ZSTD_MAGIC):
+        return 'zstd'
+
+    return None
+
+
+def decode_json_manifest(manifest):
+    '''
+        This function decodes the Base64 values of a JSON manifest back into
+        raw bytes, so that it matches a manifest loaded from MessagePack.
+    '''
+    for entry in manifest.get('findings', {}).values():
+        entry['capture'] = standard_b64decode(entry['capture'])
+        entry['groups'] = [standard_b64decode(group) for group in entry['groups']]
+
+        # Reports from before segments were shared still carry their context.
+        if 'context' in entry:
+            entry['context'] = standard_b64decode(entry['context'])
+
+    manifest['segments'] = {
+        segment_id: standard_b64decode(segment)
+        for segment_id, segment in manifest.get('segments', {}).items()
+    }
+
+    return manifest
+
+
+def read_records(file, unpacker):
+    while True:
+        yield from unpacker
+        chunk = file.read(READ_SIZE)
+
+        if not chunk:
+            return
+
+        unpacker.feed(chunk)
+
+
+def load_manifest(path):
+    '''
+        This function loads a manifest that was saved as MessagePack or JSON,
+        compressed or not. Captures, groups and segments are always returned as
+        raw bytes, no matter which format they were stored in.
+    '''
+    with open_manifest_file(path, 'rb', detect_compression(path)) as file:
+        first_byte = file.read(1)
+
+        if first_byte == b'{':
+            return decode_json_manifest(from_json(first_byte + file.read()))
+
+        from msgpack import Unpacker
+
+        unpacker = Unpacker(raw=False, strict_map_key=False, max_buffer_size=0)
+        unpacker.feed(first_byte)
+        records = read_records(file, unpacker)
+        header = next(records, None)
+
+        if not isinstance(header, dict) or header.get('format') != MANIFEST_FORMAT:
+            raise ValueError('The file is not a Mystiks manifest')
+        elif header.get('version') not in (1, MANIFEST_VERSION):
+            raise ValueError('The manifest was saved by an incompatible version')
+
+        manifest = {
+            'findings': {},
+            'segments': {},
+            'sorting': [],
+        }
+
+        # Findings, segments and the sorting are written a record at a time,
+        # with the rest of the manifest in a single record at the end. The
+        # first version kept the sorting in that record instead.
+        for kind, *record in records:
+            if kind == 'finding':
+                manifest['findings'][record[0]] = record[1]
+            elif kind == 'segment':
+                manifest['segments'][record[0]] = record[1]
+            elif kind == 'sorting':
+                manifest['sorting'].extend(record[0])
+            elif kind == 'summary':
+                manifest.update(record[0])
+
+        return manifest
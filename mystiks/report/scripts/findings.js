@@ -52,26 +52,43 @@ function setupIndicators(rootContainer, rating, idealRating, indicators) {
     container.parentElement.querySelector('[data-content="rating-text"]').textContent = `(${rating} actual / ${idealRating} ideal)`;
 }
 
-function setupContext(rootContainer, contextBase64, contextStart=0, highlightStart=0, highlightEnd=0, rowSize=16) {
+const segmentCache = new Map();
+
+function getContextByteArray(finding, segments) {
     /**
-     * This function is used to setup the context viewers within each finding's details.
+     * This function gets the bytes of a finding's context. Contexts are
+     * sliced out of the segments they share with nearby findings, and each
+     * segment is only decoded once.
      **/
-    const contextByteArray = utilities.base64ToByteArray(contextBase64);
+    if (finding.segment === undefined) {
+        return utilities.base64ToByteArray(finding.context);
+    }
+
+    if (!segmentCache.has(finding.segment)) {
+        segmentCache.set(finding.segment, utilities.base64ToByteArray(segments[finding.segment]));
+    }
 
+    return segmentCache.get(finding.segment).subarray(finding.relativeContextStart, finding.relativeContextEnd);
+}
+
+function setupContext(rootContainer, contextByteArray, contextStart=0, highlightStart=0, highlightEnd=0, rowSize=16) {
+    /**
+     * This function is used to setup the context viewers within each finding's details.
+     **/
     viewers.setupAddressViewer(rootContainer, contextByteArray, contextStart, rowSize);
     viewers.setupHexViewer(rootContainer, contextByteArray, highlightStart, highlightEnd, rowSize);
     viewers.setupTextViewer(rootContainer, contextByteArray, highlightStart, highlightEnd, rowSize);
     viewers.setupRenderViewer(rootContainer, contextByteArray, highlightStart, highlightEnd);
 }
 
-function createDetails(containerRoot, descriptions, patterns, rating, idealRating, indicators, contextBase64, contextStart=0, highlightStart=0, highlightEnd=0, rowSize=16) {
+function createDetails(containerRoot, descriptions, patterns, rating, idealRating, indicators, contextByteArray, contextStart=0, highlightStart=0, highlightEnd=0, rowSize=16) {
     const template = document.querySelector('[data-id="finding-details-template"]');
     const detailsContainer = template.content.firstElementChild.cloneNode(true);
 
     setupDescription(detailsContainer, descriptions);
     setupPatterns(detailsContainer, patterns);
     setupIndicators(detailsContainer, rating, idealRating, indicators);
-    setupContext(detailsContainer, contextBase64, contextStart, highlightStart, highlightEnd, rowSize);
+    setupContext(detailsContainer, contextByteArray, contextStart, highlightStart, highlightEnd, rowSize);
 
     containerRoot.appendChild(detailsContainer);
 
@@ -83,14 +100,26 @@ function removeFindings() {
     findingsContainer.replaceChildren();
 }
 
-function createFinding(uuid, fileName, valueBase64, rating, idealRating, patterns, name, descriptions, indicators, contextBase64, contextStart=0, highlightStart=0, highlightEnd=0, rowSize=16) {
+function createFinding(uuid, fileName, valueBase64, rating, idealRating, patterns, name, descriptions, indicators, contextByteArray, contextStart=0, highlightStart=0, highlightEnd=0, rowSize=16, duplicateFileNames=[]) {
     const template = document.querySelector('[data-id="finding-template"]');
     const finding = template.content.firstElementChild.cloneNode(true);
     finding.setAttribute('data-id', uuid);
 
     // We start by setting some of the easy properties up.
     finding.querySelector('[data-content="name"]').textContent = name;
-    finding.querySelector('[data-content="file-name"]').textContent = fileName;
+
+    const fileNameContainer = finding.querySelector('[data-content="file-name"]');
+    fileNameContainer.textContent = fileName;
+
+    // Identical copies of the file are listed on hover, rather than being
+    // shown as separate findings.
+    if (duplicateFileNames.length) {
+        const duplicateLabel = document.createElement('span');
+        duplicateLabel.classList.add('text-gray-400');
+        duplicateLabel.textContent = ` (+${duplicateFileNames.length} identical ${ duplicateFileNames.length === 1 ? 'file' : 'files' })`;
+        duplicateLabel.setAttribute('title', [fileName, ...duplicateFileNames].join('\n'));
+        fileNameContainer.after(duplicateLabel);
+    }
 
     // Then we convert the value into a best-guess string.
     const valueByteArray = utilities.base64ToByteArray(valueBase64);
@@ -145,7 +174,7 @@ function createFinding(uuid, fileName, valueBase64, rating, idealRating, pattern
                 rating,
                 idealRating,
                 indicators,
-                contextBase64,
+                contextByteArray,
                 contextStart,
                 highlightStart,
                 highlightEnd,
@@ -213,25 +242,34 @@ function createFinding(uuid, fileName, valueBase64, rating, idealRating, pattern
     document.querySelector('[data-id="finding-container"]').appendChild(finding);
 }
 
-function refreshFindings(findings, descriptions, sorting) {
+let latestRefresh = 0;
+
+async function refreshFindings(filterTerms=[]) {
     /**
      * This function refreshes the finding list (this should be called on page
-     * changes or filter changes).
+     * changes or filter changes). Only the shards holding the current page
+     * of findings are loaded.
      */
-    document.querySelector('[data-id="finding-container"]').replaceChildren();
+    const refreshIndex = ++latestRefresh;
 
-    const findingCount = Object.keys(findings).length;
+    const findingCount = await shards.countFindings(filterTerms);
     const pageSize = utilities.getIntegerParameter('pageSize', 8, 8, 16);
     const totalPages = Math.floor(findingCount / pageSize);
     const pageIndex = utilities.getIntegerParameter('pageIndex', 0, 0, totalPages);
 
     const startIndex = pageIndex * pageSize;
     const stopIndex = Math.min(findingCount, startIndex + pageSize);
+    const page = await shards.getFindings(filterTerms, startIndex, stopIndex);
+
+    // If another refresh was started while we were loading, it wins.
+    if (refreshIndex !== latestRefresh) {
+        return;
+    }
 
-    for (let index = startIndex; index < stopIndex; index++) {
-        const uuid = sorting[index];
-        const finding = findings[uuid];
+    document.querySelector('[data-id="finding-container"]').replaceChildren();
+    segmentCache.clear();
 
+    for (const {uuid, finding, segments} of page) {
         createFinding(
             uuid,
             finding.fileName,
@@ -240,13 +278,14 @@ function refreshFindings(findings, descriptions, sorting) {
             finding.idealRating,
             [finding.pattern],
             finding.name,
-            descriptions[finding.name],
+            manifest.descriptions[finding.name],
             finding.indicators,
-            finding.context,
+            getContextByteArray(finding, segments),
             finding.contextStart,
-            (finding.captureStart - finding.contextStart),
-            (finding.captureEnd - finding.contextStart),
-            24
+            finding.relativeCaptureStart,
+            finding.relativeCaptureEnd,
+            24,
+            manifest.duplicateFiles[finding.fileName] || []
         )
     }
 
@@ -268,7 +307,7 @@ function refreshFindings(findings, descriptions, sorting) {
                 event.preventDefault();
 
                 utilities.setParameter('pageIndex', index);
-                refreshFindings(findings, descriptions, sorting);
+                refreshFindings(filterTerms);
             });
         }
 
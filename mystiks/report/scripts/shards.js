@@ -0,0 +1,210 @@
+'use strict';
+
+// This is how many shards are kept loaded at once. Shards which haven't been
+// used recently are dropped, so that large reports use a bounded amount of
+// memory.
+const maxLoadedShards = 8;
+
+const loadedShards = new Map();
+const pendingShards = new Map();
+const countCache = new Map();
+
+function receiveShard(shardIndex, shard) {
+    /**
+     * This function is called by each shard's script as it is loaded.
+     **/
+    const pending = pendingShards.get(shardIndex);
+
+    if (pending) {
+        pendingShards.delete(shardIndex);
+        pending.resolve(shard);
+    }
+}
+
+function loadShard(shardIndex) {
+    /**
+     * This function loads a shard of findings by injecting its script, since
+     * reports are usually opened straight from disk, where they can't fetch.
+     **/
+    if (loadedShards.has(shardIndex)) {
+        const shard = loadedShards.get(shardIndex);
+
+        // We move the shard to the back, so that it is evicted last.
+        loadedShards.delete(shardIndex);
+        loadedShards.set(shardIndex, shard);
+
+        return Promise.resolve(shard);
+    }
+
+    if (pendingShards.has(shardIndex)) {
+        return pendingShards.get(shardIndex).promise;
+    }
+
+    const pending = {};
+
+    pending.promise = new Promise((resolve, reject) => {
+        const script = document.createElement('script');
+
+        pending.resolve = (shard) => {
+            script.remove();
+            loadedShards.set(shardIndex, shard);
+
+            while (loadedShards.size > maxLoadedShards) {
+                loadedShards.delete(loadedShards.keys().next().value);
+            }
+
+            resolve(shard);
+        };
+
+        script.addEventListener('error', () => {
+            pendingShards.delete(shardIndex);
+            script.remove();
+            reject(new Error(`Failed to load shard ${shardIndex}`));
+        });
+
+        script.src = `scripts/shards/${shardIndex}.js`;
+        document.head.appendChild(script);
+    });
+
+    pendingShards.set(shardIndex, pending);
+
+    return pending.promise;
+}
+
+function parseTerm(term) {
+    const invertTerm = term.startsWith('!');
+    let [attribute, target] = term.split(':');
+
+    if (invertTerm) {
+        attribute = attribute.substring(1);
+    }
+
+    return [attribute.toLowerCase(), target, invertTerm];
+}
+
+function checkTerms(finding, terms) {
+    /**
+     * This function checks whether a finding meets every one of the given
+     * filter terms.
+     **/
+    for (const term of terms) {
+        const [attribute, target, invertTerm] = parseTerm(term);
+
+        switch (attribute) {
+            case 'name':
+                if (finding.name.includes(target) === invertTerm) {
+                    return false;
+                }
+
+                break;
+            case 'value': {
+                const valueByteArray = utilities.base64ToByteArray(finding.capture);
+                const value = utilities.byteArrayToString(valueByteArray);
+
+                if (value.includes(target) === invertTerm) {
+                    return false;
+                }
+
+                break;
+            }
+            case 'file': {
+                const fileNames = [finding.fileName, ...(manifest.duplicateFiles[finding.fileName] || [])];
+
+                if (fileNames.some((fileName) => fileName.includes(target)) === invertTerm) {
+                    return false;
+                }
+
+                break;
+            }
+        }
+    }
+
+    return true;
+}
+
+function isNameOnly(terms) {
+    return terms.every((term) => parseTerm(term)[0] !== 'value' && parseTerm(term)[0] !== 'file');
+}
+
+async function countShards(terms) {
+    /**
+     * This function counts how many findings within each shard meet the given
+     * filter terms. Terms which only look at names are answered from the
+     * index, while any others need each shard to be loaded once.
+     **/
+    const cacheKey = JSON.stringify(terms);
+
+    if (countCache.has(cacheKey)) {
+        return countCache.get(cacheKey);
+    }
+
+    const counts = [];
+
+    for (let shardIndex = 0; shardIndex < manifest.shards.length; shardIndex++) {
+        let count = 0;
+
+        for (const [name, nameCount] of Object.entries(manifest.shards[shardIndex].nameCounts)) {
+            if (checkTerms({name}, terms.filter((term) => parseTerm(term)[0] === 'name'))) {
+                count += nameCount;
+            }
+        }
+
+        if (count && !isNameOnly(terms)) {
+            const shard = await loadShard(shardIndex);
+            count = shard.sorting.filter((uuid) => checkTerms(shard.findings[uuid], terms)).length;
+        }
+
+        counts.push(count);
+    }
+
+    countCache.set(cacheKey, counts);
+
+    return counts;
+}
+
+async function countFindings(terms=[]) {
+    /**
+     * This function counts how many findings meet the given filter terms.
+     **/
+    if (!terms.length) {
+        return manifest.totalFindings;
+    }
+
+    return (await countShards(terms)).reduce((total, count) => total + count, 0);
+}
+
+async function getFindings(terms, startIndex, stopIndex) {
+    /**
+     * This function gets the findings which meet the given filter terms,
+     * between the given indexes of their rating order. Only the shards which
+     * hold those findings are loaded.
+     **/
+    const counts = terms.length ? await countShards(terms) : manifest.shards.map((shard) => shard.count);
+    const page = [];
+    let shardStartIndex = 0;
+
+    for (let shardIndex = 0; shardIndex < counts.length && shardStartIndex < stopIndex; shardIndex++) {
+        const shardStopIndex = shardStartIndex + counts[shardIndex];
+
+        if (counts[shardIndex] && shardStopIndex > startIndex) {
+            const shard = await loadShard(shardIndex);
+            const sorting = shard.sorting.filter((uuid) => checkTerms(shard.findings[uuid], terms));
+            const sliceStart = Math.max(startIndex - shardStartIndex, 0);
+            const sliceStop = Math.min(stopIndex - shardStartIndex, sorting.length);
+
+            for (const uuid of sorting.slice(sliceStart, sliceStop)) {
+                page.push({uuid, finding: shard.findings[uuid], segments: shard.segments});
+            }
+        }
+
+        shardStartIndex = shardStopIndex;
+    }
+
+    return page;
+}
+
+window.shards = {
+    receiveShard,
+    countFindings,
+    getFindings
+}
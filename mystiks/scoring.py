@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+from collections import deque
+from time import perf_counter
+
+from .filters import create_executor, is_free_threaded, run_filters, take_snapshot
+
+
+def get_segment_key(match):
+    '''
+        This function gets the key of the segment a match's context was cut
+        from. Segments are told apart by where they sit in their file, which
+        (along with the encoding) decides what they hold.
+    '''
+    return (match.file_name, match.encoding, match.segment_start, match.segment_end)
+
+
+def create_entry(finding, match, indicators, rating):
+    '''
+        This function creates the manifest entry for a single match. The
+        context is left in its segment, which the caller stores only once. Bytes
+        are kept raw, and are only encoded by the formats which need it.
+    '''
+    return {
+        'fileName': match.file_name,
+        'groups': list(match.groups),
+        'segment': get_segment_key(match),
+        'relativeContextStart': match.relative_context_start,
+        'relativeContextEnd': match.relative_context_end,
+        'contextStart': match.context_start,
+        'contextEnd': match.context_end,
+        'capture': match.capture,
+        'captureStart': match.capture_start,
+        'captureEnd': match.capture_end,
+        'relativeCaptureStart': match.relative_capture_start,
+        'relativeCaptureEnd': match.relative_capture_end,
+        'encoding': match.encoding,
+        'pattern': match.pattern,
+        'name': finding.name,
+        'indicators': indicators,
+        'rating': rating,
+        'idealRating': finding.ideal_rating
+    }
+
+
+def trim_segments(kept):
+    '''
+        This function trims the segments of the given matches and entries down
+        to the spans which their contexts cover, since most of a segment may
+        have belonged to matches that weren't kept. Contexts which overlap are
+        kept together in one piece, and each entry is pointed at its piece,
+        with its context rebased to match. The pieces are returned by key.
+    '''
+    grouped = {}
+
+    for match, entry in kept:
+        grouped.setdefault(entry['segment'], []).append((match, entry))
+
+    pieces = {}
+
+    for segment_key, group in grouped.items():
+        group.sort(key=lambda item: item[1]['relativeContextStart'])
+        segment = group[0][0].segment
+        runs = []
+
+        for match, entry in group:
+            if runs and entry['relativeContextStart'] <= runs[-1][1]:
+                runs[-1][1] = max(runs[-1][1], entry['relativeContextEnd'])
+                runs[-1][2].append(entry)
+            else:
+                runs.append([entry['relativeContextStart'], entry['relativeContextEnd'], [entry]])
+
+        for run_start, run_end, entries in runs:
+            piece_key = (*segment_key, run_start, run_end)
+            pieces[piece_key] = segment[run_start:run_end]
+
+            for entry in entries:
+                entry['segment'] = piece_key
+                entry['relativeContextStart'] -= run_start
+                entry['relativeContextEnd'] -= run_start
+
+    return pieces
+
+
+def score_shard(finding, matches):
+    '''
+        This function filters and scores a shard of matches which all belong
+        to the same finding. It returns the shard's manifest fragment, as a
+        list of UUIDs and their entries, the pieces of segments those entries
+        were cut from (by key), and how long it took.
+    '''
+    started_at = perf_counter()
+    keep = run_filters(finding, matches)
+    kept_matches = [match for match, should_keep in zip(matches, keep) if should_keep]
+    fragment = []
+    kept = []
+
+    # Indicators are gathered for the whole shard at once, so that findings
+    # can calculate their metrics in a single batch.
+    all_indicators = finding.get_batch_indicators(kept_matches)
+
+    for match, indicators in zip(kept_matches, all_indicators):
+        # We calculate each finding's rating here. If the rating is too low,
+        # we skip this finding and remove it.
+        rating = sum([delta for _, delta in indicators])
+
+        if rating < getattr(finding, 'min_rating', 0):
+            continue
+
+        entry = create_entry(finding, match, indicators, rating)
+        fragment.append((match.uuid, entry))
+        kept.append((match, entry))
+
+    # Only the parts of segments which kept matches need are carried over.
+    segments = trim_segments(kept)
+
+    return fragment, segments, perf_counter() - started_at
+
+
+def score_matches(matches, get_finding, batch_size=1024, max_workers=None):
+    '''
+        This function filters and scores the given matches, yielding manifest
+        fragments (along with their segments) as they are completed. Matches
+        are sharded by their finding, which is looked up by name, and if
+        workers are requested, the shards are handled in a pool while the
+        search carries on.
+    '''
+    # Threads can share the match objects directly, but processes need them
+    # to be pickled first.
+    needs_snapshots = max_workers and not is_free_threaded()
+
+    def next_shard():
+        shards = {}
+        shard_segments = {}
+
+        for match in matches:
+            finding_name = match.pattern_tag.split(':', 1)[-1]
+            shard = shards.setdefault(finding_name, [])
+
+            # Snapshots carry their segment with them. Nearby matches in the
+            # same shard share theirs, so each one is only taken once.
+            if needs_snapshots:
+                segments = shard_segments.setdefault(finding_name, {})
+                segment_key = get_segment_key(match)
+
+                if segment_key not in segments:
+                    segments[segment_key] = match.segment
+
+                shard.append(take_snapshot(match, segments[segment_key]))
+            else:
+                shard.append(match)
+
+            if len(shard) >= batch_size:
+                shard_segments.pop(finding_name, None)
+                yield get_finding(finding_name), shards.pop(finding_name)
+
+        for finding_name, shard in shards.items():
+            yield get_finding(finding_name), shard
+
+    if not max_workers:
+        for finding, shard in next_shard():
+            yield score_shard(finding, shard)
+
+        return
+
+    # We keep a few shards in flight per worker, which is enough to keep the
+    # pool busy without holding onto the whole search at once.
+    with create_executor(max_workers) as executor:
+        in_flight = deque()
+
+        for finding, shard in next_shard():
+            in_flight.append(executor.submit(score_shard, finding, shard))
+
+            while len(in_flight) > max_workers * 2:
+                yield in_flight.popleft().result()
+
+        while in_flight:
+            yield in_flight.popleft().result()
@@ -1,124 +1,150 @@
 #!/usr/bin/env python3
-from base64 import standard_b64encode
-from pathlib import Path
-
-from .findings import FINDINGS
-from .mystiks_core import recursive_regex_search
-from .patterns import create_patterns, clean_match_utf16
-
-
-def build_manifest(path, target_findings=None, desired_context=None, max_file_size=None, max_threads=None, manifest_name=None, include_utf16=False, file_name_map=None):
-    target_findings = target_findings or FINDINGS
-
-    # We prepare the RegEx patterns for searching.
-    patterns = create_patterns(target_findings, include_utf16)
-
-    # We send out our recursive RegEx search!
-    search_result = recursive_regex_search(
-        path=str(path),
-        patterns=patterns,
-        excluded_file_patterns=[
-            r'(?i)^.+\.svg$',
-            r'(?i)^.+\.png$',
-            r'(?i)^.+\.gif$',
-            r'(?i)^.+\.jpeg$',
-            r'(?i)^.+\.jpg$',
-            r'(?i)^.+\.ttf$',
-        ],
-        desired_context=desired_context,
-        max_file_size=max_file_size,
-        max_threads=max_threads
-    )
-
-    # We start by preparing a map of finding names to findings.
-    mappings = {}
-
-    for finding in target_findings:
-        mappings[finding.name] = finding
-
-    # We start building the manifest.
-    manifest = {
-        'metadata': {},
+from .findings import get_finding, get_registry
+from .mystiks_core import stream_memory_search, stream_regex_search
+from .patterns import PatternRegistry
+from .scoring import score_matches
+from .writers import ManifestCollector, RatingSorter
+
+
+def build_manifest(path, target_findings=None, desired_context=None, max_file_size=None, max_threads=None, manifest_name=None, include_utf16=False, mmap_threshold=None, chunk_size=None, scoring_workers=None, use_ignore_files=False, file_policies=None, cache_path=None, rebuild_cache=False, registry=None, writers=None, contents=None):
+    '''
+        This function searches the given path and builds its manifest. Findings
+        and segments are handed to each writer as they are scored, with the
+        summary written at the end. When no writers are given, the manifest is
+        collected and returned as a whole, otherwise only the summary is. Its
+        sorting is spooled to disk, and can only be counted once returned.
+
+        If contents are given (as an iterable of names and bytes), they are
+        searched in memory instead of the path, which only names the manifest.
+    '''
+    # When no findings are given, every finding is searched for, but they are
+    # only imported once they have actually matched something.
+    if target_findings:
+        mappings = {finding.name: finding for finding in target_findings}
+        get_target_finding = mappings.__getitem__
+        registry = registry or PatternRegistry.from_findings(target_findings)
+    else:
+        get_target_finding = get_finding
+        registry = registry or get_registry()
+
+    # We prepare the RegEx patterns for searching. Filters are left out here,
+    # since they run alongside scoring instead of inside the search.
+    patterns = registry.create_patterns()
+
+    # We send out our RegEx search, either over the given contents or through
+    # the path recursively! Matches are streamed back while the search is
+    # still running, so scoring overlaps with scanning.
+    if contents is not None:
+        search_stream = stream_memory_search(
+            contents=contents,
+            patterns=patterns,
+            desired_context=desired_context,
+            max_file_size=max_file_size,
+            file_policies=file_policies,
+            include_utf16=include_utf16
+        )
+    else:
+        search_stream = stream_regex_search(
+            path=str(path),
+            patterns=patterns,
+            excluded_file_patterns=[
+                r'(?i)^.+\.svg$',
+                r'(?i)^.+\.png$',
+                r'(?i)^.+\.gif$',
+                r'(?i)^.+\.jpeg$',
+                r'(?i)^.+\.jpg$',
+                r'(?i)^.+\.ttf$',
+            ],
+            desired_context=desired_context,
+            max_file_size=max_file_size,
+            max_threads=max_threads,
+            mmap_threshold=mmap_threshold,
+            chunk_size=chunk_size,
+            use_ignore_files=use_ignore_files,
+            file_policies=file_policies,
+            cache_path=str(cache_path) if cache_path else None,
+            rebuild_cache=rebuild_cache,
+            include_utf16=include_utf16
+        )
+
+    # We start building the summary of the manifest. The findings and their
+    # segments are handed straight to the writers instead of being kept.
+    collector = None
+
+    if not writers:
+        collector = ManifestCollector()
+        writers = [collector]
+
+    summary = {
         'descriptions': {},
         'sorting': [],
-        'findings': {},
+        'duplicateFiles': {},
+        'metadata': {},
     }
 
-    ratings = {}
-
-    for match in search_result.matches:
-        pattern_index, pattern_encoding, finding_name = match.pattern_tag.split(':', 2)
-        finding = mappings[finding_name]
-        cleaned_capture = None
-
-        if pattern_encoding == 'UTF-16':
-            cleaned_match = clean_match_utf16(match, finding)
-
-            if not cleaned_match:
-                continue
-
-            indicators = finding.get_indicators(**cleaned_match)
-            cleaned_capture = cleaned_match['capture']
-        else:
-            indicators = finding.get_indicators(
-                context=match.context,
-                capture=match.capture,
-                capture_start=match.capture_start - match.context_start,
-                capture_end=match.capture_end - match.context_start,
-                groups=match.groups
-            )
-
-        # We calculate each finding's rating here. If the rating is too low,
-        # we skip this finding and remove it.
-        rating = sum([delta for _, delta in indicators])
-
-        if rating < getattr(finding, 'min_rating', 0):
-            continue
-
-        if file_name_map:
-            file_name = file_name_map.get(Path(match.file_name).stem.split('-')[0], match.file_name)
-
-            if 'request' in match.file_name:
-                file_name = f'Request -> {file_name}'
-            elif 'response' in match.file_name:
-                file_name = f'Response <- {file_name}'
-        else:
-            file_name = match.file_name
-
-        # We can now create a manifest entry, yay!
-        manifest['findings'][match.uuid] = {
-            'fileName': file_name,
-            'groups': [standard_b64encode(group).decode() for group in match.groups],
-            'context': standard_b64encode(match.context).decode(),
-            'contextStart': match.context_start,
-            'contextEnd': match.context_end,
-            'capture': standard_b64encode(cleaned_capture or match.capture).decode(),
-            'captureStart': match.capture_start,
-            'captureEnd': match.capture_end,
-            'pattern': match.pattern,
-            'name': finding_name,
-            'indicators': indicators,
-            'rating': rating,
-            'idealRating': finding.ideal_rating
-        }
-
-        # We collect each finding's rating for later sorting.
-        ratings[match.uuid] = rating / finding.ideal_rating
-
-        # If the finding hasn't been added to the descriptions table, we add
-        # that in now.
-        if finding.name not in manifest['descriptions']:
-            manifest['descriptions'][finding.name] = finding.description
-
-    # We include a pre-computed sorting of the values, just to save time later.
-    manifest['sorting'] = list(sorted(ratings, key=ratings.get, reverse=True))
-
-    # We staple on some metadata to the manifest.
-    manifest['metadata']['uuid'] = search_result.uuid
-    manifest['metadata']['name'] = manifest_name or path.name
-    manifest['metadata']['startedAt'] = search_result.scan_started_at
-    manifest['metadata']['completedAt'] = search_result.scan_completed_at
-    manifest['metadata']['totalFilesScanned'] = search_result.total_files_scanned
-    manifest['metadata']['totalDirectoriesScanned'] = search_result.total_directories_scanned
-
-    return manifest
+    scoring_time = 0
+    segment_count = 0
+
+    # Ratings are sorted on disk, since there is one for every finding.
+    with RatingSorter() as sorting:
+        # Matches are filtered and scored in shards (one finding at a time),
+        # and each shard's fragment of the manifest is written out as it
+        # completes.
+        for fragment, segments, elapsed in score_matches(search_stream, get_target_finding, max_workers=scoring_workers):
+            scoring_time += elapsed
+            segment_ids = {}
+
+            for uuid, entry in fragment:
+                finding = get_target_finding(entry['name'])
+
+                # Each segment of the fragment is only written once, the first
+                # time a finding which was cut from it is kept, and is
+                # referenced by ID after that.
+                segment_key = entry['segment']
+
+                if segment_key not in segment_ids:
+                    segment_ids[segment_key] = str(segment_count)
+                    segment_count += 1
+
+                    for writer in writers:
+                        writer.write_segment(segment_ids[segment_key], segments[segment_key])
+
+                entry['segment'] = segment_ids[segment_key]
+
+                # We can now write the manifest entry, yay!
+                for writer in writers:
+                    writer.write_finding(uuid, entry)
+
+                # We collect each finding's rating for later sorting.
+                sorting.add(uuid, entry['rating'] / finding.ideal_rating)
+
+                # If the finding hasn't been added to the descriptions table, we
+                # add that in now.
+                if finding.name not in summary['descriptions']:
+                    summary['descriptions'][finding.name] = finding.description
+
+        # Identical copies of a file are only scanned once. Since the findings
+        # have already been written by now, the copies are listed by the name
+        # of the file which was scanned instead of on each finding.
+        for file_name, duplicate_file_names in search_stream.duplicate_files.items():
+            summary['duplicateFiles'][file_name] = sorted(duplicate_file_names)
+
+        # We include a pre-computed sorting of the values, just to save time
+        # later.
+        summary['sorting'] = sorting
+
+        # We staple on some metadata to the manifest.
+        summary['metadata']['uuid'] = search_stream.uuid
+        summary['metadata']['name'] = manifest_name or path.name
+        summary['metadata']['startedAt'] = search_stream.scan_started_at
+        summary['metadata']['completedAt'] = search_stream.scan_completed_at
+        summary['metadata']['totalFilesScanned'] = search_stream.total_files_scanned
+        summary['metadata']['totalDirectoriesScanned'] = search_stream.total_directories_scanned
+        summary['metadata']['fileClasses'] = search_stream.file_classes
+        summary['metadata']['scoringTime'] = round(scoring_time, 3)
+        summary['metadata']['totalDuplicateFiles'] = sum(len(duplicate_file_names) for duplicate_file_names in search_stream.duplicate_files.values())
+
+        for writer in writers:
+            writer.write_summary(summary)
+
+    return collector.manifest if collector else summary
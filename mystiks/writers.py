@@ -0,0 +1,659 @@
+#!/usr/bin/env python3
+from base64 import standard_b64encode
+from itertools import islice
+from json import dumps as to_json
+from os import getpid, replace as replace_file
+from pathlib import Path
+from shutil import copyfileobj, rmtree
+from sqlite3 import connect as connect_sqlite
+from tempfile import TemporaryFile
+
+from .manifests import MANIFEST_FORMAT, MANIFEST_VERSION, open_manifest_file
+
+
+# These are the sections of a manifest which are only known once the search
+# has finished, in the order that they are written after the findings.
+SUMMARY_SECTIONS = ('descriptions', 'sorting', 'duplicateFiles', 'metadata')
+
+# This is how many findings are placed into each shard of the HTML report.
+SHARD_SIZE = 256
+
+# This is how many findings are inserted into SQLite in each transaction.
+SQLITE_BATCH_SIZE = 10000
+
+# This is how many UUIDs of the sorting are packed into each MessagePack
+# record, since the whole sorting can be too large to hold at once.
+SORTING_RECORD_SIZE = 10000
+
+SQLITE_SCHEMA = '''
+    CREATE TABLE metadata (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+
+    CREATE TABLE descriptions (
+        name TEXT PRIMARY KEY,
+        description TEXT NOT NULL
+    );
+
+    -- File names are case-sensitive, so their index is only used by prefix
+    -- queries written with GLOB or a range, never by (case-insensitive) LIKE.
+    CREATE TABLE files (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    );
+
+    CREATE TABLE duplicate_files (
+        file_id INTEGER NOT NULL REFERENCES files (id),
+        name TEXT NOT NULL
+    );
+
+    CREATE TABLE segments (
+        id INTEGER PRIMARY KEY,
+        data BLOB NOT NULL
+    );
+
+    CREATE TABLE findings (
+        uuid TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        file_id INTEGER NOT NULL REFERENCES files (id),
+        segment_id INTEGER NOT NULL REFERENCES segments (id),
+        rating REAL NOT NULL,
+        ideal_rating REAL NOT NULL,
+        relative_rating REAL NOT NULL,
+        sort_index INTEGER,
+        pattern TEXT NOT NULL,
+        encoding TEXT NOT NULL,
+        capture BLOB NOT NULL,
+        capture_start INTEGER NOT NULL,
+        capture_end INTEGER NOT NULL,
+        context_start INTEGER NOT NULL,
+        context_end INTEGER NOT NULL,
+        relative_context_start INTEGER NOT NULL,
+        relative_context_end INTEGER NOT NULL,
+        relative_capture_start INTEGER NOT NULL,
+        relative_capture_end INTEGER NOT NULL
+    );
+
+    CREATE TABLE groups (
+        finding_uuid TEXT NOT NULL REFERENCES findings (uuid),
+        position INTEGER NOT NULL,
+        data BLOB NOT NULL
+    );
+
+    CREATE TABLE indicators (
+        finding_uuid TEXT NOT NULL REFERENCES findings (uuid),
+        position INTEGER NOT NULL,
+        description TEXT NOT NULL,
+        delta REAL NOT NULL
+    );
+
+    -- Each context is a slice of the segment it was cut from, which SQLite
+    -- can take straight out of the blob.
+    CREATE VIEW contexts AS
+        SELECT
+            findings.uuid AS finding_uuid,
+            substr(segments.data, findings.relative_context_start + 1, findings.relative_context_end - findings.relative_context_start) AS data
+        FROM findings
+        JOIN segments ON segments.id = findings.segment_id;
+'''
+
+# The indexes are only created once everything has been inserted, which is
+# much faster than keeping them up to date along the way.
+SQLITE_INDEXES = '''
+    CREATE INDEX findings_by_name ON findings (name);
+    CREATE INDEX findings_by_file ON findings (file_id);
+    CREATE INDEX findings_by_rating ON findings (rating);
+    CREATE INDEX findings_by_relative_rating ON findings (relative_rating);
+    CREATE INDEX findings_by_sort_index ON findings (sort_index);
+    CREATE INDEX groups_by_finding ON groups (finding_uuid);
+    CREATE INDEX indicators_by_finding ON indicators (finding_uuid);
+    CREATE INDEX duplicate_files_by_file ON duplicate_files (file_id);
+    CREATE INDEX duplicate_files_by_name ON duplicate_files (name);
+'''
+
+
+def get_temporary_path(path):
+    '''
+        This function gets a temporary path beside the given one. Reports are
+        written there first, and only replace the given path once they are
+        complete, so a search which fails partway never leaves a truncated
+        report behind.
+    '''
+    path = Path(path)
+    return path.with_name(f'.{path.name}.{getpid()}.tmp')
+
+
+def finish_file(temporary_path, path, is_complete):
+    if is_complete:
+        replace_file(temporary_path, path)
+    else:
+        Path(temporary_path).unlink(missing_ok=True)
+
+
+def encode_bytes(value):
+    '''
+        This function encodes raw bytes as Base64 for formats which can't hold
+        them, such as JSON. It is used as the fallback when dumping JSON.
+    '''
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return standard_b64encode(value).decode()
+
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+class RatingSorter:
+    '''
+        A rating sorter puts findings in order of their rating, best first,
+        without holding them in memory. Ratings are spooled into a temporary
+        SQLite database, which sorts them on disk each time that the sorter
+        is iterated. Findings with the same rating keep the order that they
+        were added in.
+    '''
+
+    def __init__(self, batch_size=SQLITE_BATCH_SIZE):
+        # An empty path gives a private database which is kept on disk.
+        self.connection = connect_sqlite('')
+        self.connection.execute('CREATE TABLE ratings (position INTEGER PRIMARY KEY, uuid TEXT NOT NULL, rating REAL NOT NULL)')
+        self.batch_size = batch_size
+        self.ratings = []
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        self.flush()
+
+        for uuid, in self.connection.execute('SELECT uuid FROM ratings ORDER BY rating DESC, position'):
+            yield uuid
+
+    def flush(self):
+        with self.connection:
+            self.connection.executemany('INSERT INTO ratings VALUES (?, ?, ?)', self.ratings)
+
+        self.ratings.clear()
+
+    def add(self, uuid, rating):
+        self.ratings.append((self.count, uuid, rating))
+        self.count += 1
+
+        if len(self.ratings) >= self.batch_size:
+            self.flush()
+
+    def close(self):
+        self.connection.close()
+
+
+class ManifestCollector:
+    '''
+        A manifest collector gathers everything it is given into a single
+        manifest dictionary, for callers which want the whole manifest in
+        memory instead of written out. Bytes are encoded as Base64, just as
+        they are in the JSON report.
+    '''
+
+    def __init__(self):
+        self.manifest = {
+            'findings': {},
+            'segments': {},
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def write_finding(self, uuid, entry):
+        self.manifest['findings'][uuid] = {
+            **entry,
+            'groups': [encode_bytes(group) for group in entry['groups']],
+            'capture': encode_bytes(entry['capture'])
+        }
+
+    def write_segment(self, segment_id, segment):
+        self.manifest['segments'][segment_id] = encode_bytes(segment)
+
+    def write_summary(self, summary):
+        self.manifest.update(summary)
+        self.manifest['sorting'] = list(summary['sorting'])
+
+    def close(self):
+        pass
+
+
+class JSONManifestWriter:
+    '''
+        A JSON manifest writer streams a manifest out to a file, one finding at
+        a time, so that the findings never have to be held in memory at once.
+        Segments are spooled into a temporary file as they arrive, and are
+        copied in after the findings. The output is identical to dumping the
+        whole manifest at once, with the same indentation.
+    '''
+
+    def __init__(self, path, indent=None, prefix=''):
+        self.path = Path(path)
+        self.temporary_path = get_temporary_path(self.path)
+        self.file = open(self.temporary_path, 'w')
+        self.segments_file = TemporaryFile('w+')
+        self.indent = indent
+        self.key_separator = ': ' if indent else ':'
+        self.has_findings = False
+        self.has_segments = False
+        self.is_complete = False
+
+        self.file.write(prefix + '{' + self.get_newline(1) + to_json('findings') + self.key_separator + '{')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def get_newline(self, depth):
+        if self.indent is None:
+            return ''
+
+        return '\n' + self.indent * depth
+
+    def to_json(self, value, depth):
+        # Nested values are dumped on their own, and then indented to the
+        # depth they sit at within the manifest.
+        if self.indent is None:
+            return to_json(value, separators=(',', ':'), default=encode_bytes)
+
+        return to_json(value, indent=self.indent, default=encode_bytes).replace('\n', self.get_newline(depth))
+
+    def format_item(self, key, value, is_first):
+        return (
+            ('' if is_first else ',')
+            + self.get_newline(2)
+            + to_json(key)
+            + self.key_separator
+            + self.to_json(value, 2)
+        )
+
+    def write_list(self, values, depth):
+        # Lists which can be as long as the findings are written one value at
+        # a time, just as they would have been dumped.
+        self.file.write('[')
+        has_values = False
+
+        for value in values:
+            self.file.write((',' if has_values else '') + self.get_newline(depth + 1) + to_json(value))
+            has_values = True
+
+        self.file.write((self.get_newline(depth) if has_values else '') + ']')
+
+    def write_finding(self, uuid, entry):
+        self.file.write(self.format_item(uuid, entry, not self.has_findings))
+        self.has_findings = True
+
+    def write_segment(self, segment_id, segment):
+        self.segments_file.write(self.format_item(segment_id, segment, not self.has_segments))
+        self.has_segments = True
+
+    def write_summary(self, summary):
+        self.file.write((self.get_newline(1) if self.has_findings else '') + '}')
+
+        # We copy the spooled segments in behind the findings.
+        self.file.write(',' + self.get_newline(1) + to_json('segments') + self.key_separator + '{')
+        self.segments_file.seek(0)
+        copyfileobj(self.segments_file, self.file)
+        self.file.write((self.get_newline(1) if self.has_segments else '') + '}')
+
+        for section in SUMMARY_SECTIONS:
+            self.file.write(',' + self.get_newline(1) + to_json(section) + self.key_separator)
+
+            if section == 'sorting':
+                self.write_list(summary[section], 1)
+            else:
+                self.file.write(self.to_json(summary[section], 1))
+
+        self.file.write(self.get_newline(0) + '}')
+        self.is_complete = True
+
+    def close(self):
+        self.segments_file.close()
+        self.file.close()
+        finish_file(self.temporary_path, self.path, self.is_complete)
+
+
+class HTMLManifestWriter:
+    '''
+        An HTML manifest writer splits a manifest into shards of findings for
+        the HTML report, in order of their rating, along with a small index in
+        "data.js". The report only loads the shards that it is showing.
+
+        Findings and segments are spooled into temporary files as they arrive,
+        since their order is only known once the search has finished. Where
+        each one was spooled is kept in a temporary SQLite database, rather
+        than in memory.
+    '''
+
+    def __init__(self, path, shard_size=SHARD_SIZE):
+        self.path = Path(path)
+        self.shard_size = shard_size
+        self.findings_file = TemporaryFile()
+        self.segments_file = TemporaryFile()
+        self.is_complete = False
+
+        # The shards and their index are written beside the old ones, which
+        # they only replace once the whole report has been written.
+        self.temporary_shards_path = get_temporary_path(self.path / 'shards')
+        self.temporary_data_path = get_temporary_path(self.path / 'data.js')
+
+        # An empty path gives a private database which is kept on disk.
+        self.spool_index = connect_sqlite('')
+        self.spool_index.executescript('''
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+
+            CREATE TABLE findings (
+                uuid TEXT PRIMARY KEY,
+                start INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                segment_id TEXT NOT NULL
+            );
+
+            CREATE TABLE segments (
+                id TEXT PRIMARY KEY,
+                start INTEGER NOT NULL,
+                length INTEGER NOT NULL
+            );
+        ''')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def spool(self, file, value):
+        data = to_json(value, separators=(',', ':'), default=encode_bytes).encode()
+        offset = file.tell()
+        file.write(data)
+
+        return offset, len(data)
+
+    def unspool(self, file, offset, length):
+        file.seek(offset)
+        return file.read(length).decode()
+
+    def write_finding(self, uuid, entry):
+        self.spool_index.execute('INSERT INTO findings VALUES (?, ?, ?, ?, ?)', (
+            uuid,
+            *self.spool(self.findings_file, entry),
+            entry['name'],
+            entry['segment']
+        ))
+
+    def write_segment(self, segment_id, segment):
+        self.spool_index.execute('INSERT INTO segments VALUES (?, ?, ?)', (segment_id, *self.spool(self.segments_file, segment)))
+
+    def write_shard(self, path, shard_index, uuids):
+        '''
+            This function writes a single shard of findings, along with every
+            segment that they were cut from. It returns the shard's entry in
+            the index, which counts the findings of each name, so that the
+            report can tell which shards a filter needs without loading them.
+        '''
+        name_counts = {}
+        segment_ids = {}
+
+        with open(path, 'w') as file:
+            file.write(f'shards.receiveShard({shard_index},{{"sorting":' + to_json(uuids, separators=(',', ':')) + ',"findings":{')
+
+            for position, uuid in enumerate(uuids):
+                offset, length, name, segment_id = self.spool_index.execute(
+                    'SELECT start, length, name, segment_id FROM findings WHERE uuid = ?', (uuid,)
+                ).fetchone()
+
+                file.write((',' if position else '') + to_json(uuid) + ':' + self.unspool(self.findings_file, offset, length))
+                name_counts[name] = name_counts.get(name, 0) + 1
+                segment_ids.setdefault(segment_id, None)
+
+            file.write('},"segments":{')
+
+            for position, segment_id in enumerate(segment_ids):
+                offset, length = self.spool_index.execute('SELECT start, length FROM segments WHERE id = ?', (segment_id,)).fetchone()
+                file.write((',' if position else '') + to_json(segment_id) + ':' + self.unspool(self.segments_file, offset, length))
+
+            file.write('}});')
+
+        return {
+            'count': len(uuids),
+            'nameCounts': name_counts
+        }
+
+    def write_summary(self, summary):
+        rmtree(self.temporary_shards_path, ignore_errors=True)
+        self.temporary_shards_path.mkdir(parents=True)
+
+        # The sorting is read a shard at a time, since it can be as long as
+        # the findings. Only the small index entry of each shard is kept.
+        sorting = iter(summary['sorting'])
+        shards = []
+        total_findings = 0
+
+        while True:
+            uuids = list(islice(sorting, self.shard_size))
+
+            if not uuids:
+                break
+
+            shard_index = len(shards)
+            shards.append(self.write_shard(self.temporary_shards_path / f'{shard_index}.js', shard_index, uuids))
+            total_findings += len(uuids)
+
+        with open(self.temporary_data_path, 'w') as file:
+            file.write('window.manifest=' + to_json({
+                'metadata': summary['metadata'],
+                'descriptions': summary['descriptions'],
+                'duplicateFiles': summary['duplicateFiles'],
+                'totalFindings': total_findings,
+                'shardSize': self.shard_size,
+                'shards': shards,
+            }, separators=(',', ':')))
+
+        self.is_complete = True
+
+    def close(self):
+        self.spool_index.close()
+        self.findings_file.close()
+        self.segments_file.close()
+
+        # Shards from an earlier report in the same place are removed, so
+        # that they can't be mixed in with this one.
+        if self.is_complete:
+            rmtree(self.path / 'shards', ignore_errors=True)
+            replace_file(self.temporary_shards_path, self.path / 'shards')
+        else:
+            rmtree(self.temporary_shards_path, ignore_errors=True)
+
+        finish_file(self.temporary_data_path, self.path / 'data.js', self.is_complete)
+
+
+class SQLiteManifestWriter:
+    '''
+        A SQLite manifest writer stores a manifest in normalized tables, which
+        are indexed by finding name, file name and rating, so that large
+        reports can be queried without loading them. Bytes are stored as blobs
+        rather than Base64, and rows are inserted in large transactions.
+    '''
+
+    def __init__(self, path, batch_size=SQLITE_BATCH_SIZE):
+        # The report is built up beside an earlier report in the same place,
+        # which it only replaces (rather than being added onto) once complete.
+        self.path = Path(path)
+        self.temporary_path = get_temporary_path(self.path)
+        self.temporary_path.unlink(missing_ok=True)
+        self.is_complete = False
+
+        self.connection = connect_sqlite(self.temporary_path)
+        self.connection.execute('PRAGMA journal_mode = OFF')
+        self.connection.execute('PRAGMA synchronous = OFF')
+        self.connection.executescript(SQLITE_SCHEMA)
+
+        self.batch_size = batch_size
+        self.file_ids = {}
+        self.segment_ids = {}
+        self.findings = []
+        self.groups = []
+        self.indicators = []
+        self.segments = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def get_file_id(self, file_name):
+        if file_name not in self.file_ids:
+            self.file_ids[file_name] = len(self.file_ids)
+            self.connection.execute('INSERT INTO files (id, name) VALUES (?, ?)', (self.file_ids[file_name], file_name))
+
+        return self.file_ids[file_name]
+
+    def flush(self):
+        with self.connection:
+            self.connection.executemany('INSERT INTO segments VALUES (?, ?)', self.segments)
+            self.connection.executemany('INSERT INTO findings VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', self.findings)
+            self.connection.executemany('INSERT INTO groups VALUES (?, ?, ?)', self.groups)
+            self.connection.executemany('INSERT INTO indicators VALUES (?, ?, ?, ?)', self.indicators)
+
+        self.findings.clear()
+        self.groups.clear()
+        self.indicators.clear()
+        self.segments.clear()
+
+    def write_finding(self, uuid, entry):
+        self.findings.append((
+            uuid,
+            entry['name'],
+            self.get_file_id(entry['fileName']),
+            self.segment_ids[entry['segment']],
+            entry['rating'],
+            entry['idealRating'],
+            entry['rating'] / entry['idealRating'],
+            entry['pattern'],
+            entry['encoding'],
+            entry['capture'],
+            entry['captureStart'],
+            entry['captureEnd'],
+            entry['contextStart'],
+            entry['contextEnd'],
+            entry['relativeContextStart'],
+            entry['relativeContextEnd'],
+            entry['relativeCaptureStart'],
+            entry['relativeCaptureEnd'],
+        ))
+
+        for position, group in enumerate(entry['groups']):
+            self.groups.append((uuid, position, group))
+
+        for position, (description, delta) in enumerate(entry['indicators']):
+            self.indicators.append((uuid, position, description, delta))
+
+        if len(self.findings) >= self.batch_size:
+            self.flush()
+
+    def write_segment(self, segment_id, segment):
+        self.segment_ids[segment_id] = len(self.segment_ids)
+        self.segments.append((self.segment_ids[segment_id], segment))
+
+    def write_summary(self, summary):
+        self.flush()
+
+        with self.connection:
+            self.connection.executemany('INSERT INTO metadata VALUES (?, ?)', (
+                (key, to_json(value)) for key, value in summary['metadata'].items()
+            ))
+
+            self.connection.executemany('INSERT INTO descriptions VALUES (?, ?)', (
+                (name, to_json(description)) for name, description in summary['descriptions'].items()
+            ))
+
+            self.connection.executemany('INSERT INTO duplicate_files VALUES (?, ?)', (
+                (self.get_file_id(file_name), duplicate_file_name)
+                for file_name, duplicate_file_names in summary['duplicateFiles'].items()
+                for duplicate_file_name in duplicate_file_names
+            ))
+
+            # We store the pre-computed sorting as each finding's place in it.
+            self.connection.executemany('UPDATE findings SET sort_index = ? WHERE uuid = ?', (
+                (sort_index, uuid) for sort_index, uuid in enumerate(summary['sorting'])
+            ))
+
+        self.connection.executescript(SQLITE_INDEXES)
+        self.is_complete = True
+
+    def close(self):
+        self.connection.close()
+        finish_file(self.temporary_path, self.path, self.is_complete)
+
+
+class MessagePackManifestWriter:
+    '''
+        A MessagePack manifest writer streams a manifest out as a series of
+        MessagePack records, which hold bytes natively instead of as Base64.
+        The records can be compressed with gzip or Zstandard, and are read
+        back with "mystiks.load_manifest".
+    '''
+
+    def __init__(self, path, compression=None):
+        from msgpack import Packer
+
+        self.packer = Packer(use_bin_type=True)
+        self.path = Path(path)
+        self.temporary_path = get_temporary_path(self.path)
+        self.file = open_manifest_file(self.temporary_path, 'wb', compression)
+        self.is_complete = False
+        self.write_record({'format': MANIFEST_FORMAT, 'version': MANIFEST_VERSION})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def write_record(self, record):
+        self.file.write(self.packer.pack(record))
+
+    def write_finding(self, uuid, entry):
+        self.write_record(('finding', uuid, entry))
+
+    def write_segment(self, segment_id, segment):
+        self.write_record(('segment', segment_id, segment))
+
+    def write_summary(self, summary):
+        # The sorting can be as long as the findings, so it is written out in
+        # records of its own, ahead of the rest of the summary.
+        sorting = iter(summary['sorting'])
+
+        while True:
+            uuids = list(islice(sorting, SORTING_RECORD_SIZE))
+
+            if not uuids:
+                break
+
+            self.write_record(('sorting', uuids))
+
+        self.write_record(('summary', {
+            section: summary[section] for section in SUMMARY_SECTIONS if section != 'sorting'
+        }))
+
+        self.is_complete = True
+
+    def close(self):
+        self.file.close()
+        finish_file(self.temporary_path, self.path, self.is_complete)
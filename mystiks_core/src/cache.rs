@@ -0,0 +1,321 @@
+use std::collections::HashMap;
+use std::fs::{self, File};
+use std::io::{self, BufWriter, Write};
+use std::sync::{Arc, Mutex};
+use std::time::UNIX_EPOCH;
+use xxhash_rust::xxh3::Xxh3;
+
+use crate::patterns::CompiledPatterns;
+use crate::scanner::{Match, Segment, generate_match_id};
+use crate::search::SearchOptions;
+use crate::sniffer::FileClass;
+use crate::utf16::Encoding;
+
+
+// Every cache starts with this header, which is bumped whenever the layout of
+// the cache changes.
+const CACHE_HEADER: &[u8] = b"MYSTIKS-CACHE-5\n";
+
+
+pub struct CachedFile {
+    pub file_size: u64,
+    pub modified_at: u64,
+    pub file_class: Option<FileClass>,
+    // Files which were streamed in chunks are never hashed.
+    pub content_hash: Option<u64>,
+    // Copies of another file are cached without any matches of their own, so
+    // that they can be recognized again without being read.
+    pub is_duplicate: bool,
+    pub matches: Vec<Match>,
+}
+
+
+impl CachedFile {
+    pub fn is_fresh(&self, file_size: u64, modified_at: u64) -> bool {
+        self.file_size == file_size && self.modified_at == modified_at
+    }
+
+    pub fn replay(&self) -> Vec<Match> {
+        // Cached matches are handed out again as if they had just been found,
+        // and have the same identifiers they were found with.
+        self.matches.clone()
+    }
+}
+
+
+pub struct SearchCache {
+    path: String,
+    fingerprint: u64,
+    // Entries from the previous search are taken out as they are used, and
+    // every file seen during this search ends up in the current entries. Only
+    // the current entries are saved, so deleted files drop out of the cache.
+    previous: Mutex<HashMap<String, CachedFile>>,
+    current: Mutex<HashMap<String, CachedFile>>,
+}
+
+
+impl SearchCache {
+    pub fn open(path: &str, options: &SearchOptions, regex_patterns: &CompiledPatterns, rebuild: bool) -> SearchCache {
+        let fingerprint = cache_fingerprint(options, regex_patterns);
+
+        // A cache that is missing, unreadable or built for other patterns is
+        // simply treated as empty, and is replaced once the search finishes.
+        let previous = if rebuild {
+            HashMap::new()
+        } else {
+            fs::read(path).ok()
+                .and_then(|contents| decode_cache(&contents, fingerprint, regex_patterns))
+                .unwrap_or_default()
+        };
+
+        SearchCache {
+            path: path.to_string(),
+            fingerprint: fingerprint,
+            previous: Mutex::new(previous),
+            current: Mutex::new(HashMap::new()),
+        }
+    }
+
+    pub fn take(&self, file_name: &str) -> Option<CachedFile> {
+        self.previous.lock().unwrap().remove(file_name)
+    }
+
+    pub fn store(&self, file_name: &str, cached_file: CachedFile) {
+        self.current.lock().unwrap().insert(file_name.to_string(), cached_file);
+    }
+
+    pub fn save(&self) -> io::Result<()> {
+        // We write the cache next to its final path first, so that a search
+        // which dies halfway never leaves a broken cache behind.
+        let temporary_path = format!("{}.tmp", self.path);
+        let mut writer = BufWriter::new(File::create(&temporary_path)?);
+
+        writer.write_all(CACHE_HEADER)?;
+        write_u64(&mut writer, self.fingerprint)?;
+
+        let current = self.current.lock().unwrap();
+        write_u64(&mut writer, current.len() as u64)?;
+
+        for (file_name, cached_file) in current.iter() {
+            write_bytes(&mut writer, file_name.as_bytes())?;
+            write_u64(&mut writer, cached_file.file_size)?;
+            write_u64(&mut writer, cached_file.modified_at)?;
+            write_u64(&mut writer, cached_file.file_class.map_or(0, |file_class| file_class.index() as u64 + 1))?;
+            write_u64(&mut writer, cached_file.content_hash.is_some() as u64)?;
+            write_u64(&mut writer, cached_file.content_hash.unwrap_or(0))?;
+            write_u64(&mut writer, cached_file.is_duplicate as u64)?;
+
+            // The segments a file's matches share are written once, before the
+            // matches which refer to them by index.
+            let mut segment_indexes: HashMap<*const Segment, usize> = HashMap::new();
+            let mut segments: Vec<&Segment> = Vec::new();
+
+            for cached_match in cached_file.matches.iter() {
+                segment_indexes.entry(Arc::as_ptr(&cached_match.segment)).or_insert_with(|| {
+                    segments.push(&cached_match.segment);
+                    segments.len() - 1
+                });
+            }
+
+            write_u64(&mut writer, segments.len() as u64)?;
+
+            for segment in segments.iter() {
+                write_bytes(&mut writer, &segment.bytes)?;
+                write_u64(&mut writer, segment.start as u64)?;
+                write_u64(&mut writer, segment.end as u64)?;
+            }
+
+            write_u64(&mut writer, cached_file.matches.len() as u64)?;
+
+            for cached_match in cached_file.matches.iter() {
+                write_u64(&mut writer, cached_match.pattern_index as u64)?;
+                write_u64(&mut writer, cached_match.encoding.index() as u64)?;
+                write_u64(&mut writer, segment_indexes[&Arc::as_ptr(&cached_match.segment)] as u64)?;
+                write_u64(&mut writer, cached_match.context.start as u64)?;
+                write_u64(&mut writer, cached_match.context.end as u64)?;
+                write_u64(&mut writer, cached_match.capture.start as u64)?;
+                write_u64(&mut writer, cached_match.capture.end as u64)?;
+                write_u64(&mut writer, cached_match.groups.len() as u64)?;
+
+                for group in cached_match.groups.iter() {
+                    write_u64(&mut writer, group.start as u64)?;
+                    write_u64(&mut writer, group.end as u64)?;
+                }
+
+                write_u64(&mut writer, cached_match.capture_start as u64)?;
+                write_u64(&mut writer, cached_match.capture_end as u64)?;
+                write_u64(&mut writer, cached_match.context_start as u64)?;
+                write_u64(&mut writer, cached_match.context_end as u64)?;
+            }
+        }
+
+        writer.into_inner().map_err(|error| error.into_error())?.sync_all()?;
+        fs::rename(&temporary_path, &self.path)
+    }
+}
+
+
+pub fn file_modified_at(metadata: &fs::Metadata) -> Option<u64> {
+    metadata.modified().ok()?.duration_since(UNIX_EPOCH).ok().map(|duration| duration.as_nanos() as u64)
+}
+
+
+fn cache_fingerprint(options: &SearchOptions, regex_patterns: &CompiledPatterns) -> u64 {
+    // Anything which changes what a file's matches look like has to be part
+    // of the fingerprint, or stale matches would be served from the cache.
+    let mut hasher = Xxh3::new();
+    hasher.update(&regex_patterns.fingerprint.to_le_bytes());
+    hasher.update(&(options.desired_context as u64).to_le_bytes());
+    hasher.update(&(options.max_file_size as u64).to_le_bytes());
+    hasher.update(&(options.chunk_size as u64).to_le_bytes());
+    hasher.update(&[options.include_utf16 as u8]);
+
+    for file_class in FileClass::ALL.iter() {
+        hasher.update(&[options.class_policies.get(*file_class) as u8]);
+    }
+
+    hasher.digest()
+}
+
+
+fn write_u64(writer: &mut impl Write, value: u64) -> io::Result<()> {
+    writer.write_all(&value.to_le_bytes())
+}
+
+
+fn write_bytes(writer: &mut impl Write, value: &[u8]) -> io::Result<()> {
+    write_u64(writer, value.len() as u64)?;
+    writer.write_all(value)
+}
+
+
+struct CacheReader<'a> {
+    contents: &'a [u8],
+    position: usize,
+}
+
+
+impl<'a> CacheReader<'a> {
+    fn read_u64(&mut self) -> Option<u64> {
+        let bytes = self.contents.get(self.position..self.position + 8)?;
+        self.position += 8;
+
+        Some(u64::from_le_bytes(bytes.try_into().ok()?))
+    }
+
+    fn read_usize(&mut self) -> Option<usize> {
+        self.read_u64().map(|value| value as usize)
+    }
+
+    fn read_bytes(&mut self) -> Option<&'a [u8]> {
+        let length = self.read_usize()?;
+        let bytes = self.contents.get(self.position..self.position.checked_add(length)?)?;
+        self.position += length;
+
+        Some(bytes)
+    }
+}
+
+
+fn decode_cache(contents: &[u8], fingerprint: u64, regex_patterns: &CompiledPatterns) -> Option<HashMap<String, CachedFile>> {
+    let mut reader = CacheReader {
+        contents: contents.strip_prefix(CACHE_HEADER)?,
+        position: 0,
+    };
+
+    if reader.read_u64()? != fingerprint {
+        return None;
+    }
+
+    let file_count = reader.read_usize()?;
+    let mut cached_files = HashMap::new();
+
+    for _ in 0..file_count {
+        let file_name = String::from_utf8(reader.read_bytes()?.to_vec()).ok()?;
+        let shared_file_name: Arc<str> = Arc::from(file_name.as_str());
+        let file_size = reader.read_u64()?;
+        let modified_at = reader.read_u64()?;
+
+        let file_class = match reader.read_usize()? {
+            0 => None,
+            index => Some(*FileClass::ALL.get(index - 1)?),
+        };
+
+        let has_content_hash = reader.read_u64()? != 0;
+        let content_hash = reader.read_u64()?;
+        let content_hash = if has_content_hash { Some(content_hash) } else { None };
+        let is_duplicate = reader.read_u64()? != 0;
+        let segment_count = reader.read_usize()?;
+        let mut segments = Vec::new();
+
+        for _ in 0..segment_count {
+            segments.push(Arc::new(Segment {
+                bytes: reader.read_bytes()?.to_vec(),
+                start: reader.read_usize()?,
+                end: reader.read_usize()?,
+            }));
+        }
+
+        let match_count = reader.read_usize()?;
+        let mut matches = Vec::new();
+
+        for _ in 0..match_count {
+            let pattern_index = reader.read_usize()?;
+            let pattern = regex_patterns.patterns.get(pattern_index)?;
+            let encoding = *Encoding::ALL.get(reader.read_usize()?)?;
+            let segment = segments.get(reader.read_usize()?)?.clone();
+            let context = reader.read_usize()?..reader.read_usize()?;
+            let capture = reader.read_usize()?..reader.read_usize()?;
+            let group_count = reader.read_usize()?;
+            let mut groups = Vec::new();
+
+            for _ in 0..group_count {
+                groups.push(reader.read_usize()?..reader.read_usize()?);
+            }
+
+            // A corrupted cache could point outside of the segment or the
+            // context, which would panic once the match is sliced.
+            if context.start > context.end || context.end > segment.bytes.len() {
+                return None;
+            }
+
+            if capture.end > context.len() || groups.iter().any(|group| group.start > group.end || group.end > context.len()) || capture.start > capture.end {
+                return None;
+            }
+
+            let capture_start = reader.read_usize()?;
+            let capture_end = reader.read_usize()?;
+            let context_start = reader.read_usize()?;
+            let context_end = reader.read_usize()?;
+
+            matches.push(Match {
+                uuid: generate_match_id(&file_name, content_hash, &pattern.tag, encoding, capture_start, capture_end),
+                file_name: shared_file_name.clone(),
+                pattern_index: pattern_index,
+                pattern: pattern.source.clone(),
+                pattern_tag: pattern.tag.clone(),
+                encoding: encoding,
+                segment: segment,
+                context: context,
+                capture: capture,
+                groups: groups,
+                capture_start: capture_start,
+                capture_end: capture_end,
+                context_start: context_start,
+                context_end: context_end,
+            });
+        }
+
+        cached_files.insert(file_name, CachedFile {
+            file_size: file_size,
+            modified_at: modified_at,
+            file_class: file_class,
+            content_hash: content_hash,
+            is_duplicate: is_duplicate,
+            matches: matches,
+        });
+    }
+
+    Some(cached_files)
+}
+
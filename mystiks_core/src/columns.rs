@@ -0,0 +1,155 @@
+use std::collections::HashMap;
+use std::sync::Arc;
+
+use crate::scanner::{Match, Segment};
+use crate::utf16::Encoding;
+
+
+#[derive(Default)]
+pub struct MatchColumns {
+    // File names and patterns are interned, so that each of them is only ever
+    // stored once, no matter how many matches refer to it.
+    pub file_names: Vec<Arc<str>>,
+    file_indexes: HashMap<Arc<str>, u32>,
+    pub patterns: Vec<Option<(Arc<str>, Arc<str>)>>,
+    pub uuids: Vec<String>,
+    pub file_index: Vec<u32>,
+    pub pattern_index: Vec<u32>,
+    pub encoding: Vec<u8>,
+    pub capture_start: Vec<u64>,
+    pub capture_end: Vec<u64>,
+    pub context_start: Vec<u64>,
+    pub context_end: Vec<u64>,
+    // Every segment is stored once, back to back in a single arena, with
+    // segment N found between offsets N and N + 1. Each match's context is a
+    // range of its segment, and its capture and groups are relative to the
+    // start of that context.
+    pub arena: Vec<u8>,
+    segment_indexes: HashMap<(u32, u8, u64, u64), u32>,
+    pub segment_offsets: Vec<u64>,
+    pub segment_start: Vec<u64>,
+    pub segment_end: Vec<u64>,
+    pub segment_index: Vec<u32>,
+    pub relative_context_start: Vec<u64>,
+    pub relative_context_end: Vec<u64>,
+    pub relative_capture_start: Vec<u64>,
+    pub relative_capture_end: Vec<u64>,
+    // The groups of match N are found between group offsets N and N + 1.
+    pub group_offsets: Vec<u64>,
+    pub group_starts: Vec<u64>,
+    pub group_ends: Vec<u64>,
+}
+
+
+impl MatchColumns {
+    pub fn new() -> MatchColumns {
+        MatchColumns {
+            segment_offsets: vec![0],
+            group_offsets: vec![0],
+            ..Default::default()
+        }
+    }
+
+    pub fn len(&self) -> usize {
+        self.uuids.len()
+    }
+
+    fn intern_file_name(&mut self, file_name: &Arc<str>) -> u32 {
+        if let Some(index) = self.file_indexes.get(file_name) {
+            return *index;
+        }
+
+        let index = self.file_names.len() as u32;
+        self.file_names.push(file_name.clone());
+        self.file_indexes.insert(file_name.clone(), index);
+
+        index
+    }
+
+    fn intern_segment(&mut self, file_index: u32, native_match: &Match) -> u32 {
+        // Segments are told apart by where they sit in their file, which
+        // (along with the encoding) decides what they hold.
+        let segment = &native_match.segment;
+        let key = (file_index, native_match.encoding.index() as u8, segment.start as u64, segment.end as u64);
+
+        if let Some(index) = self.segment_indexes.get(&key) {
+            return *index;
+        }
+
+        let index = self.segment_start.len() as u32;
+        self.arena.extend_from_slice(&segment.bytes);
+        self.segment_offsets.push(self.arena.len() as u64);
+        self.segment_start.push(segment.start as u64);
+        self.segment_end.push(segment.end as u64);
+        self.segment_indexes.insert(key, index);
+
+        index
+    }
+
+    pub fn push(&mut self, native_match: Match) {
+        let file_index = self.intern_file_name(&native_match.file_name);
+
+        if self.patterns.len() <= native_match.pattern_index {
+            self.patterns.resize(native_match.pattern_index + 1, None);
+        }
+
+        self.patterns[native_match.pattern_index].get_or_insert_with(|| {
+            (native_match.pattern.clone(), native_match.pattern_tag.clone())
+        });
+
+        self.file_index.push(file_index);
+        self.pattern_index.push(native_match.pattern_index as u32);
+        self.encoding.push(native_match.encoding.index() as u8);
+        self.capture_start.push(native_match.capture_start as u64);
+        self.capture_end.push(native_match.capture_end as u64);
+        self.context_start.push(native_match.context_start as u64);
+        self.context_end.push(native_match.context_end as u64);
+
+        let segment_index = self.intern_segment(file_index, &native_match);
+        self.segment_index.push(segment_index);
+        self.relative_context_start.push(native_match.context.start as u64);
+        self.relative_context_end.push(native_match.context.end as u64);
+        self.relative_capture_start.push(native_match.capture.start as u64);
+        self.relative_capture_end.push(native_match.capture.end as u64);
+
+        for group in &native_match.groups {
+            self.group_starts.push(group.start as u64);
+            self.group_ends.push(group.end as u64);
+        }
+
+        self.group_offsets.push(self.group_starts.len() as u64);
+        self.uuids.push(native_match.uuid);
+    }
+
+    pub fn get(&self, index: usize) -> Match {
+        // This rebuilds a single match from the columns, which is only done
+        // when a match is actually asked for. Segments can be large, so the
+        // rebuilt match is only given its own context as its segment.
+        let (pattern, pattern_tag) = self.patterns[self.pattern_index[index] as usize].clone().unwrap();
+        let segment_start = self.segment_offsets[self.segment_index[index] as usize] as usize;
+        let context = segment_start + self.relative_context_start[index] as usize..segment_start + self.relative_context_end[index] as usize;
+        let context_length = context.len();
+        let groups = self.group_offsets[index] as usize..self.group_offsets[index + 1] as usize;
+
+        Match {
+            uuid: self.uuids[index].clone(),
+            file_name: self.file_names[self.file_index[index] as usize].clone(),
+            pattern_index: self.pattern_index[index] as usize,
+            pattern: pattern,
+            pattern_tag: pattern_tag,
+            encoding: Encoding::ALL[self.encoding[index] as usize],
+            segment: Arc::new(Segment {
+                bytes: self.arena[context].to_vec(),
+                start: self.context_start[index] as usize,
+                end: self.context_end[index] as usize,
+            }),
+            context: 0..context_length,
+            capture: self.relative_capture_start[index] as usize..self.relative_capture_end[index] as usize,
+            groups: groups.map(|group| self.group_starts[group] as usize..self.group_ends[group] as usize).collect(),
+            capture_start: self.capture_start[index] as usize,
+            capture_end: self.capture_end[index] as usize,
+            context_start: self.context_start[index] as usize,
+            context_end: self.context_end[index] as usize,
+        }
+    }
+}
@@ -0,0 +1,47 @@
+use std::collections::HashMap;
+use std::sync::{Arc, Mutex};
+use xxhash_rust::xxh3::xxh3_64;
+
+
+pub fn hash_contents(contents: &[u8]) -> u64 {
+    xxh3_64(contents)
+}
+
+
+#[derive(Default)]
+pub struct DuplicateIndex {
+    // Each unique blob (by size and content hash) is owned by the first file
+    // that claimed it, and every later copy is recorded against that owner.
+    owners: Mutex<HashMap<(u64, u64), Arc<str>>>,
+    duplicates: Mutex<HashMap<Arc<str>, Vec<Arc<str>>>>,
+}
+
+
+impl DuplicateIndex {
+    pub fn claim(&self, file_name: &Arc<str>, file_size: u64, content_hash: u64) -> bool {
+        // This returns whether the file is the first copy of its contents,
+        // and should therefore be scanned.
+        let owner = {
+            let mut owners = self.owners.lock().unwrap();
+
+            match owners.get(&(file_size, content_hash)) {
+                Some(owner) if owner != file_name => owner.clone(),
+                Some(_) => return true,
+                None => {
+                    owners.insert((file_size, content_hash), file_name.clone());
+                    return true;
+                },
+            }
+        };
+
+        self.duplicates.lock().unwrap().entry(owner).or_default().push(file_name.clone());
+
+        false
+    }
+
+    pub fn duplicates(&self) -> HashMap<String, Vec<String>> {
+        self.duplicates.lock().unwrap().iter().map(|(owner, copies)| {
+            (owner.to_string(), copies.iter().map(|copy| copy.to_string()).collect())
+        }).collect()
+    }
+}
@@ -0,0 +1,82 @@
+use regex::Regex;
+
+
+// These are the characters the model knows about, in the order of its rows and
+// columns. Anything else is left out of the text before it is scored.
+const ACCEPTED_CHARACTERS: &str = "abcdefghijklmnopqrstuvwxyz ";
+const CHARACTER_COUNT: usize = 27;
+
+// This is how words are found when rating text.
+const WORD_PATTERN: &str = r"(?:([A-Z]?[a-z]{2,}))|(?:([a-z]?[A-Z]{2,}))";
+
+
+pub struct GibberishScorer {
+    // The transition matrix is kept flat, with each row one after the other.
+    transitions: Vec<f64>,
+    word_pattern: Regex,
+}
+
+
+fn get_position(character: char) -> Option<usize> {
+    // Characters are lowered first, but only count when they lower into a
+    // single accepted character.
+    let mut lowered = character.to_lowercase();
+
+    match (lowered.next(), lowered.next()) {
+        (Some(character), None) => ACCEPTED_CHARACTERS.find(character),
+        _ => None,
+    }
+}
+
+
+impl GibberishScorer {
+    pub fn new(matrix: Vec<Vec<f64>>) -> Result<GibberishScorer, String> {
+        if matrix.len() != CHARACTER_COUNT || matrix.iter().any(|row| row.len() != CHARACTER_COUNT) {
+            return Err(format!("The gibberish model must be a {0}x{0} matrix", CHARACTER_COUNT));
+        }
+
+        Ok(GibberishScorer {
+            transitions: matrix.into_iter().flatten().collect(),
+            word_pattern: Regex::new(WORD_PATTERN).unwrap(),
+        })
+    }
+
+    pub fn score(&self, text: &str) -> f64 {
+        // This is the average transition probability of the text, with each
+        // pair of accepted characters looked up once.
+        let mut log_probability = 0.0;
+        let mut transition_count = 0;
+        let mut last_position = None;
+
+        for position in text.chars().filter_map(get_position) {
+            if let Some(last_position) = last_position {
+                log_probability += self.transitions[last_position * CHARACTER_COUNT + position];
+                transition_count += 1;
+            }
+
+            last_position = Some(position);
+        }
+
+        (log_probability / transition_count.max(1) as f64).exp()
+    }
+
+    pub fn rate(&self, text: &str) -> f64 {
+        // The text's score is weighted by how much of it is made up of words.
+        // Empty text has nothing to weigh, and is given a rating of zero.
+        let length = text.chars().count();
+
+        if length == 0 {
+            return 0.0;
+        }
+
+        let mut score = None;
+        let mut rating = 0.0;
+
+        for word in self.word_pattern.find_iter(text) {
+            let score = *score.get_or_insert_with(|| self.score(text));
+            rating += score * word.as_str().chars().count() as f64;
+        }
+
+        rating / length as f64
+    }
+}
@@ -1,20 +1,53 @@
-use num_cpus;
 use base64::{Engine as _, engine::general_purpose};
-use rand_core::{RngCore, OsRng};
+use num_cpus;
 use pyo3::prelude::*;
 use pyo3::PyObject;
-use pyo3::types::{PyBytes, PyTuple};
-use pyo3::exceptions::{PyIOError, PyValueError, PyRuntimeError};
+use pyo3::types::{PyBytes, PyMemoryView};
+use pyo3::exceptions::{PyIOError, PyIndexError, PyKeyError, PyValueError, PyRuntimeError};
 use pyo3::wrap_pyfunction;
-use rayon::prelude::*;
-use regex::bytes::Regex;
-use regex::Regex as TextRegex;
-use std::fs::File;
-use std::io::prelude::*;
+use rand_core::{RngCore, OsRng};
+use regex::RegexSet as TextRegexSet;
+use std::collections::{HashMap, VecDeque};
 use std::sync::{Arc, Mutex};
-use std::sync::mpsc::channel;
-use std::time::{SystemTime, UNIX_EPOCH};
-use walkdir::WalkDir;
+use std::sync::atomic::{AtomicBool, Ordering};
+use std::sync::mpsc::{channel, sync_channel, Receiver};
+use std::thread::{self, JoinHandle};
+use std::time::SystemTime;
+
+mod cache;
+mod columns;
+mod dedup;
+mod gibberish;
+mod metrics;
+mod patterns;
+mod reader;
+mod scanner;
+mod search;
+mod sniffer;
+mod utf16;
+
+use columns::MatchColumns;
+use gibberish::GibberishScorer;
+use metrics::{Units, byte_units, text_units};
+use patterns::{CompiledPatterns, compile_patterns};
+use scanner::Match;
+use search::{SearchOptions, SearchStatistics, run_search, search_buffer, unix_timestamp};
+use sniffer::{ClassPolicies, ClassPolicy, FileClass};
+use utf16::Encoding;
+
+
+fn generate_token() -> String {
+    // Searches (unlike matches) are given random identifiers, as no two of
+    // them should ever be confused.
+    let mut buffer: [u8; 16] = [0; 16];
+    OsRng.fill_bytes(&mut buffer);
+    return general_purpose::URL_SAFE_NO_PAD.encode(buffer);
+}
+
+
+// This is how many batches of matches (one per file or chunk) can be waiting
+// to be consumed before the scanning threads are made to wait.
+const STREAM_CAPACITY: usize = 256;
 
 
 #[pyclass]
@@ -30,6 +63,10 @@ pub struct SearchResult {
     #[pyo3(get, set)]
     total_directories_scanned: usize,
     #[pyo3(get, set)]
+    file_classes: HashMap<String, usize>,
+    #[pyo3(get, set)]
+    duplicate_files: HashMap<String, Vec<String>>,
+    #[pyo3(get, set)]
     matches: Vec<Py<SearchMatch>>
 }
 
@@ -37,283 +74,811 @@ pub struct SearchResult {
 #[pyclass]
 #[derive(Clone)]
 pub struct SearchMatch {
-    #[pyo3(get, set)]
-    uuid: String,
-    #[pyo3(get, set)]
-    file_name: String,
-    #[pyo3(get, set)]
-    pattern: String,
-    #[pyo3(get, set)]
-    pattern_tag: String,
-    #[pyo3(get, set)]
-    groups: Vec<Py<PyBytes>>,
-    #[pyo3(get, set)]
-    capture: Py<PyBytes>,
-    #[pyo3(get, set)]
-    capture_start: usize,
-    #[pyo3(get, set)]
-    capture_end: usize,
-    #[pyo3(get, set)]
-    context: Py<PyBytes>,
-    #[pyo3(get, set)]
-    context_start: usize,
-    #[pyo3(get, set)]
-    context_end: usize,
+    // Matches are kept as native data, and their bytes are only turned into
+    // Python objects when they are actually accessed.
+    inner: Match,
 }
 
 
-fn generate_token() -> String {
-    let mut buffer: [u8; 16] = [0; 16];
-    OsRng.fill_bytes(&mut buffer);
-    return general_purpose::URL_SAFE_NO_PAD.encode(buffer);
-}
+#[pymethods]
+impl SearchMatch {
+    #[getter]
+    fn uuid(&self) -> &str {
+        &self.inner.uuid
+    }
 
+    #[getter]
+    fn file_name(&self) -> &str {
+        &self.inner.file_name
+    }
 
-fn compile_patterns(patterns: Vec<(String, String, Option<PyObject>)>) -> Result<Vec<(String, Regex, Option<PyObject>)>, PyErr> {
-    // We compile each pattern and its tag into a vector.
-    let mut regex_patterns: Vec<(String, Regex, Option<PyObject>)> = Vec::new();
+    #[getter]
+    fn pattern(&self) -> &str {
+        &self.inner.pattern
+    }
 
-    for (tag, pattern, filter) in patterns {
-        // We attempt to convert the byte string into a valid pattern, and if
-        // that fails, we raise a value error.
-        let byte_pattern = Regex::new(&pattern).map_err(|error| {
-            PyErr::new::<PyValueError, _>(format!("Failed to compile pattern: {}", error))
-        })?;
+    #[getter]
+    fn pattern_tag(&self) -> &str {
+        &self.inner.pattern_tag
+    }
+
+    #[getter]
+    fn encoding(&self) -> &str {
+        self.inner.encoding.name()
+    }
+
+    #[getter]
+    fn groups<'py>(&self, py: Python<'py>) -> Vec<&'py PyBytes> {
+        self.inner.groups.iter().map(|group| PyBytes::new(py, self.inner.slice(group))).collect()
+    }
+
+    #[getter]
+    fn capture<'py>(&self, py: Python<'py>) -> &'py PyBytes {
+        PyBytes::new(py, self.inner.capture())
+    }
+
+    #[getter]
+    fn relative_capture_start(&self) -> usize {
+        // This is where the capture starts within the context, which differs
+        // from the file offsets whenever the text was transcoded.
+        self.inner.capture.start
+    }
+
+    #[getter]
+    fn relative_capture_end(&self) -> usize {
+        self.inner.capture.end
+    }
+
+    #[getter]
+    fn capture_start(&self) -> usize {
+        self.inner.capture_start
+    }
+
+    #[getter]
+    fn capture_end(&self) -> usize {
+        self.inner.capture_end
+    }
+
+    #[getter]
+    fn context<'py>(&self, py: Python<'py>) -> &'py PyBytes {
+        PyBytes::new(py, self.inner.context_bytes())
+    }
+
+    #[getter]
+    fn segment<'py>(&self, py: Python<'py>) -> &'py PyBytes {
+        // This is the text shared by the matches around this one, which the
+        // context is a slice of.
+        PyBytes::new(py, &self.inner.segment.bytes)
+    }
+
+    #[getter]
+    fn segment_start(&self) -> usize {
+        self.inner.segment.start
+    }
+
+    #[getter]
+    fn segment_end(&self) -> usize {
+        self.inner.segment.end
+    }
+
+    #[getter]
+    fn relative_context_start(&self) -> usize {
+        self.inner.context.start
+    }
 
-        regex_patterns.push((tag, byte_pattern, filter));
+    #[getter]
+    fn relative_context_end(&self) -> usize {
+        self.inner.context.end
     }
 
-    Ok::<Vec<(String, Regex, Option<PyObject>)>, _>(regex_patterns)
+    #[getter]
+    fn context_start(&self) -> usize {
+        self.inner.context_start
+    }
+
+    #[getter]
+    fn context_end(&self) -> usize {
+        self.inner.context_end
+    }
 }
 
 
-#[pyfunction]
-fn recursive_regex_search(py: Python, path: &str, patterns: Vec<(String, String, Option<PyObject>)>, excluded_file_patterns: Option<Vec<String>>, desired_context: Option<usize>, max_file_size: Option<usize>, max_threads: Option<usize>, skip_symlinks: Option<bool>) -> PyResult<SearchResult> {
-    // If any of the function arguments are left blank, we assign defaults here.
-    let desired_context: usize = desired_context.unwrap_or(128);
-    let max_file_size: usize = max_file_size.unwrap_or(0);
-    let max_threads: usize = max_threads.unwrap_or(num_cpus::get());
-    let skip_symlinks: bool = skip_symlinks.unwrap_or(false);
+// Matches are either scanned from a directory in the background, or from
+// buffers which are pulled from a Python iterable as they are needed.
+enum MatchSource {
+    Walk {
+        receiver: Mutex<Receiver<Vec<Match>>>,
+        error_receiver: Mutex<Receiver<String>>,
+        worker: Option<JoinHandle<()>>,
+    },
+    Buffers {
+        contents: Option<PyObject>,
+        options: SearchOptions,
+        regex_patterns: CompiledPatterns,
+    },
+}
+
+
+#[pyclass]
+pub struct SearchStream {
+    #[pyo3(get)]
+    uuid: String,
+    #[pyo3(get)]
+    scan_started_at: u64,
+    source: MatchSource,
+    pending: VecDeque<Py<SearchMatch>>,
+    // Filters are indexed by pattern, and only ever run on the consuming
+    // thread, so the scanning threads never have to wait on the GIL.
+    filters: Vec<Option<PyObject>>,
+    filter_error: Option<PyErr>,
+    statistics: Arc<SearchStatistics>,
+    cancelled: Arc<AtomicBool>,
+}
 
-    let regex_patterns = Arc::new(compile_patterns(patterns)?);
 
-    let mut exclude_patterns = Vec::new();
+impl SearchStream {
+    fn is_filtered(&mut self, py: Python, match_obj: &Py<SearchMatch>, pattern_index: usize, pattern_tag: &str) -> bool {
+        let filter = match &self.filters[pattern_index] {
+            Some(filter) => filter.clone_ref(py),
+            None => return false,
+        };
+
+        // We try to get a return value from the filter here, but if the
+        // filter fails, we remember that and raise it at the end.
+        match filter.call1(py, (match_obj.clone_ref(py),)).and_then(|value| value.extract::<bool>(py)) {
+            Ok(is_filtered) => is_filtered,
+            Err(_) => {
+                if self.filter_error.is_none() {
+                    self.filter_error = Some(PyErr::new::<PyRuntimeError, _>(format!("Failed to filter the finding: {}", pattern_tag)));
+                }
 
-    if excluded_file_patterns.is_some() {
-        for pattern in excluded_file_patterns.unwrap().iter() {
-            let pattern = TextRegex::new(&pattern).map_err(|error| {
-                PyErr::new::<PyValueError, _>(format!("Failed to compile pattern: {}", error))
+                true
+            },
+        }
+    }
+
+    fn accept_batch(&mut self, py: Python, batch: Vec<Match>) -> PyResult<()> {
+        // The whole batch is turned into Python objects at once, while we
+        // hold the GIL, and is then run through any filters.
+        for native_match in batch {
+            let pattern_index = native_match.pattern_index;
+            let pattern_tag = native_match.pattern_tag.clone();
+            let match_obj = Py::new(py, SearchMatch { inner: native_match })?;
+
+            if !self.is_filtered(py, &match_obj, pattern_index, &pattern_tag) {
+                self.pending.push_back(match_obj);
+            }
+        }
+
+        Ok(())
+    }
+
+    fn receive_batch(&mut self, py: Python) -> PyResult<Option<Vec<Match>>> {
+        if let MatchSource::Buffers { .. } = self.source {
+            return self.scan_next_buffer(py);
+        }
+
+        let (receiver, error_receiver, worker) = match &mut self.source {
+            MatchSource::Walk { receiver, error_receiver, worker } => (receiver, error_receiver, worker),
+            MatchSource::Buffers { .. } => unreachable!(),
+        };
+
+        if worker.is_none() {
+            return Ok(None);
+        }
+
+        // We wait for the next batch without holding onto the GIL, as the
+        // scanning threads may need it in the meantime.
+        if let Ok(batch) = py.allow_threads(|| receiver.lock().unwrap().recv()) {
+            return Ok(Some(batch));
+        }
+
+        // Once every sender has been dropped, the scan is over.
+        if let Some(worker) = worker.take() {
+            py.allow_threads(|| worker.join()).map_err(|_| {
+                PyErr::new::<PyRuntimeError, _>("The search thread panicked")
             })?;
+        }
+
+        // If something exploded mid-search, we raise that error here.
+        if let Some(error) = self.filter_error.take() {
+            return Err(error);
+        }
 
-            exclude_patterns.push(pattern);
+        if let Ok(error) = error_receiver.lock().unwrap().try_recv() {
+            return Err(PyErr::new::<PyIOError, _>(error));
         }
+
+        Ok(None)
     }
 
-    // We prepare some channels for us to use between threads.
-    let (match_sender, match_receiver) = channel();
-    let match_sender = Arc::new(Mutex::new(match_sender));
+    fn scan_next_buffer(&mut self, py: Python) -> PyResult<Option<Vec<Match>>> {
+        let (contents, options, regex_patterns) = match &mut self.source {
+            MatchSource::Buffers { contents, options, regex_patterns } => (contents, options, regex_patterns),
+            MatchSource::Walk { .. } => return Ok(None),
+        };
+
+        // Buffers are only pulled from the iterable once the last one has
+        // been consumed, so only one of them is ever held at a time.
+        while let Some(iterator) = contents.as_ref() {
+            if self.cancelled.load(Ordering::Relaxed) {
+                break;
+            }
+
+            let item = match iterator.as_ref(py).iter()?.next() {
+                Some(item) => item?,
+                None => break,
+            };
+
+            let (file_name, buffer): (String, &PyBytes) = item.extract()?;
+            let file_name: Arc<str> = Arc::from(file_name);
+            let buffer = buffer.as_bytes();
+            let statistics = &self.statistics;
+
+            let batch = py.allow_threads(|| {
+                search_buffer(&file_name, buffer, options, regex_patterns, statistics)
+            });
 
-    let (error_sender, error_receiver) = channel();
-    let error_sender = Arc::new(Mutex::new(error_sender));
+            if !batch.is_empty() {
+                return Ok(Some(batch));
+            }
+        }
 
-    // We keep some operation statistics.
-    let total_files_scanned = Arc::new(Mutex::new(0));
-    let total_directories_scanned = Arc::new(Mutex::new(0));
-    let scan_started_at = SystemTime::now();
+        // Once the iterable runs dry, the scan is over.
+        if contents.take().is_some() {
+            self.statistics.scan_completed_at.store(unix_timestamp(SystemTime::now()), Ordering::Relaxed);
+        }
 
-    let pool = rayon::ThreadPoolBuilder::new().num_threads(max_threads).build().unwrap();
+        if let Some(error) = self.filter_error.take() {
+            return Err(error);
+        }
 
-    // We begin executing inside the context of our thread pool.
-    py.allow_threads(|| {
-        pool.install(|| {
-            WalkDir::new(path).into_iter().filter_map(|e| e.ok())
-            .filter_map(|entry| {
-                if exclude_patterns.len() == 0 {
-                    return Some(entry);
-                }
+        Ok(None)
+    }
 
-                let path = entry.path().to_string_lossy().into_owned();
+    fn next_match(&mut self, py: Python) -> PyResult<Option<Py<SearchMatch>>> {
+        loop {
+            if let Some(search_match) = self.pending.pop_front() {
+                return Ok(Some(search_match));
+            }
 
-                for pattern in exclude_patterns.iter() {
-                    if pattern.is_match(&path) {
-                        return None;
+            match self.receive_batch(py)? {
+                Some(batch) => self.accept_batch(py, batch)?,
+                None => return Ok(None),
+            }
+        }
+    }
+
+    fn collect_columns(&mut self, py: Python) -> PyResult<MatchColumns> {
+        // Matches are kept native as they are collected, and only those with
+        // a filter are ever turned into Python objects.
+        let mut columns = MatchColumns::new();
+
+        while let Some(batch) = self.receive_batch(py)? {
+            for native_match in batch {
+                if self.filters[native_match.pattern_index].is_some() {
+                    let pattern_index = native_match.pattern_index;
+                    let pattern_tag = native_match.pattern_tag.clone();
+                    let match_obj = Py::new(py, SearchMatch { inner: native_match.clone() })?;
+
+                    if self.is_filtered(py, &match_obj, pattern_index, &pattern_tag) {
+                        continue;
                     }
                 }
 
-                return Some(entry);
-            }).par_bridge().for_each(|entry| {
-                let file_type = entry.file_type();
+                columns.push(native_match);
+            }
+        }
 
-                if file_type.is_symlink() && skip_symlinks {
-                    return;
-                } else if !file_type.is_file() {
-                    if file_type.is_dir() {
-                        *total_directories_scanned.lock().unwrap() += 1;
-                    }
+        Ok(columns)
+    }
+}
 
-                    return;
-                }
 
-                // If we've made it this far, the entry is a file.
-                *total_files_scanned.lock().unwrap() += 1;
+#[pymethods]
+impl SearchStream {
+    #[getter]
+    fn scan_completed_at(&self) -> Option<u64> {
+        match self.statistics.scan_completed_at.load(Ordering::Relaxed) {
+            0 => None,
+            completed_at => Some(completed_at),
+        }
+    }
 
-                // We can move onto reading the file.
-                let path = entry.path();
+    #[getter]
+    fn total_files_scanned(&self) -> usize {
+        self.statistics.total_files_scanned.load(Ordering::Relaxed)
+    }
 
-                // We open the file for reading, or error if we can't.
-                let file_open_result = File::open(&path);
+    #[getter]
+    fn total_directories_scanned(&self) -> usize {
+        self.statistics.total_directories_scanned.load(Ordering::Relaxed)
+    }
 
-                if file_open_result.is_err() {
-                    error_sender.lock().unwrap().send(
-                        PyErr::new::<PyIOError, _>(format!("Failed to open file: {}", path.display()))
-                    ).unwrap();
-                    return;
-                }
+    #[getter]
+    fn file_classes(&self) -> HashMap<String, usize> {
+        FileClass::ALL.iter().map(|file_class| {
+            (file_class.name().to_string(), self.statistics.files_by_class[file_class.index()].load(Ordering::Relaxed))
+        }).collect()
+    }
 
-                let mut file = file_open_result.unwrap();
+    #[getter]
+    fn duplicate_files(&self) -> HashMap<String, Vec<String>> {
+        // This maps each scanned file to the identical copies of it that were
+        // skipped, and is only complete once the stream is exhausted.
+        self.statistics.duplicates.duplicates()
+    }
 
-                // Next, we try to check for the file's metadata.
-                let file_metadata_result = file.metadata();
+    fn __iter__(slf: PyRef<'_, Self>) -> PyRef<'_, Self> {
+        slf
+    }
 
-                if file_metadata_result.is_err() {
-                    error_sender.lock().unwrap().send(
-                        PyErr::new::<PyIOError, _>(format!("Failed to get file metadata: {}", path.display()))
-                    ).unwrap();
-                    return;
-                }
+    fn __next__(mut slf: PyRefMut<'_, Self>, py: Python) -> PyResult<Option<Py<SearchMatch>>> {
+        slf.next_match(py)
+    }
 
-                let file_metadata = file_metadata_result.unwrap();
+    fn cancel(&self) {
+        self.cancelled.store(true, Ordering::Relaxed);
+    }
+}
 
-                // If the file is too big, we skip it.
-                if max_file_size > 0 && file_metadata.len() > max_file_size.try_into().unwrap() {
-                    return;
-                }
 
-                // We read the file's contents into memory for scanning.
-                let mut contents = Vec::new();
+impl Drop for SearchStream {
+    fn drop(&mut self) {
+        // If the stream is abandoned early, the scanning threads stop too.
+        self.cancelled.store(true, Ordering::Relaxed);
+    }
+}
 
-                if file.read_to_end(&mut contents).is_err() {
-                    error_sender.lock().unwrap().send(
-                        PyErr::new::<PyIOError, _>(format!("Failed to read the file: {}", path.display()))
-                    ).unwrap();
-                    return;
-                }
 
-                // Time to iterate through our capture patterns!
-                for (pattern_tag, pattern, filter) in regex_patterns.iter() {
-                    for capture in pattern.captures_iter(&contents) {
-                        let full_match = capture.get(0).unwrap();
-
-                        // We make sure that the correct amount of context is stored.
-                        let mut context_start = 0;
-
-                        if full_match.start() > desired_context {
-                            context_start = full_match.start() - desired_context;
-                        }
-
-                        let mut context_end = contents.len();
-
-                        if context_end > full_match.end() + desired_context {
-                            context_end = full_match.end() + desired_context;
-                        }
-
-                        // We store each capture group.
-                        let mut groups: Vec<Py<PyBytes>> = Vec::new();
-
-                        if capture.len() > 1 {
-                            for index in 1..capture.len() {
-                                let group = capture.get(index).unwrap();
-                                groups.push(Python::with_gil(|py| PyBytes::new(py, &contents[group.start()..group.end()]).into()));
-                            }
-                        }
-
-                        // We setup our capture and context values.
-                        let capture = contents[full_match.start()..full_match.end()].to_vec();
-                        let context = contents[context_start..context_end].to_vec();
-
-                        let match_obj = Python::with_gil(|py| {
-                            Py::new(py, SearchMatch {
-                                uuid: generate_token(),
-                                file_name: path.display().to_string(),
-                                pattern: pattern.as_str().to_string(),
-                                pattern_tag: pattern_tag.to_string(),
-                                groups: groups,
-                                capture: PyBytes::new(py, &capture).into(),
-                                capture_start: full_match.start(),
-                                capture_end: full_match.end(),
-                                context: PyBytes::new(py, &context).into(),
-                                context_start: context_start,
-                                context_end: context_end,
-                            })
-                        }).unwrap();
-
-                        if filter.is_some() {
-                            let filter = filter.clone().unwrap();
-
-                            // We try to get a return value from the filter here,
-                            // but if the filter fails, we handle that next.
-                            let filter_result: Result<bool, PyErr> = Python::with_gil(|py| {
-                                let args = PyTuple::new(py, &[match_obj.clone()]);
-                                let value: bool = filter.call1(py, args)?.extract(py)?;
-
-                                Ok::<bool, _>(value)
-                            });
-
-                            if filter_result.is_err() {
-                                error_sender.lock().unwrap().send(
-                                    PyErr::new::<PyRuntimeError, _>(format!("Failed to filter the finding: {}", pattern_tag.to_string()))
-                                ).unwrap();
-                                continue;
-                            }
-
-                            // Technically, this conversion can fail. However, if done
-                            // correctly, it will never fail. Only developers can
-                            // introduce a crash here.
-                            let is_filtered: bool = filter_result.unwrap();
-
-                            if is_filtered {
-                                continue;
-                            }
-                        }
-
-                        // We can now acquire the lock and push our results back!
-                        match_sender.lock().unwrap().send(match_obj).unwrap();
-                    }
-                }
-            });
-        });
-    });
+#[pyclass]
+pub struct SearchColumns {
+    #[pyo3(get)]
+    uuid: String,
+    #[pyo3(get)]
+    scan_started_at: u64,
+    #[pyo3(get)]
+    scan_completed_at: u64,
+    #[pyo3(get)]
+    total_files_scanned: usize,
+    #[pyo3(get)]
+    total_directories_scanned: usize,
+    #[pyo3(get)]
+    file_classes: HashMap<String, usize>,
+    #[pyo3(get)]
+    duplicate_files: HashMap<String, Vec<String>>,
+    inner: MatchColumns,
+}
 
-    drop(match_sender);
-    drop(error_sender);
 
-    // If something exploded mid-search, we raise that error here.
-    if let Ok(error) = error_receiver.try_recv() {
-        return Err(error);
+fn to_memory_view<'py>(py: Python<'py>, bytes: &[u8], format: &str) -> PyResult<&'py PyAny> {
+    // Columns are handed out as typed memory views over their bytes, which
+    // can be used as they are, or wrapped by NumPy (or Arrow) without a copy.
+    PyMemoryView::from(PyBytes::new(py, bytes))?.call_method1("cast", (format,))
+}
+
+
+fn u32_view<'py>(py: Python<'py>, values: &[u32]) -> PyResult<&'py PyAny> {
+    to_memory_view(py, &values.iter().flat_map(|value| value.to_ne_bytes()).collect::<Vec<u8>>(), "I")
+}
+
+
+fn u64_view<'py>(py: Python<'py>, values: &[u64]) -> PyResult<&'py PyAny> {
+    to_memory_view(py, &values.iter().flat_map(|value| value.to_ne_bytes()).collect::<Vec<u8>>(), "Q")
+}
+
+
+#[pymethods]
+impl SearchColumns {
+    #[getter]
+    fn file_names(&self) -> Vec<&str> {
+        self.inner.file_names.iter().map(|file_name| file_name.as_ref()).collect()
     }
 
-    let scan_completed_at = SystemTime::now();
+    #[getter]
+    fn pattern_tags(&self) -> Vec<Option<&str>> {
+        // These are indexed by pattern, and patterns without any matches are
+        // left empty.
+        self.inner.patterns.iter().map(|pattern| pattern.as_ref().map(|(_, pattern_tag)| pattern_tag.as_ref())).collect()
+    }
 
-    // We iterate through the result queue and push those into an array.
-    let search_matches = match_receiver.iter().collect();
-    let total_files_scanned = *total_files_scanned.lock().unwrap();
-    let total_directories_scanned = *total_directories_scanned.lock().unwrap();
+    #[getter]
+    fn patterns(&self) -> Vec<Option<&str>> {
+        self.inner.patterns.iter().map(|pattern| pattern.as_ref().map(|(pattern, _)| pattern.as_ref())).collect()
+    }
 
-    Ok(SearchResult {
+    #[getter]
+    fn uuids(&self) -> Vec<&str> {
+        self.inner.uuids.iter().map(|uuid| uuid.as_str()).collect()
+    }
+
+    #[getter]
+    fn encodings(&self) -> Vec<&'static str> {
+        Encoding::ALL.iter().map(|encoding| encoding.name()).collect()
+    }
+
+    fn column<'py>(&self, py: Python<'py>, name: &str) -> PyResult<&'py PyAny> {
+        match name {
+            "file_index" => u32_view(py, &self.inner.file_index),
+            "pattern_index" => u32_view(py, &self.inner.pattern_index),
+            "encoding" => to_memory_view(py, &self.inner.encoding, "B"),
+            "arena" => to_memory_view(py, &self.inner.arena, "B"),
+            "capture_start" => u64_view(py, &self.inner.capture_start),
+            "capture_end" => u64_view(py, &self.inner.capture_end),
+            "context_start" => u64_view(py, &self.inner.context_start),
+            "context_end" => u64_view(py, &self.inner.context_end),
+            "segment_index" => u32_view(py, &self.inner.segment_index),
+            "segment_offsets" => u64_view(py, &self.inner.segment_offsets),
+            "segment_start" => u64_view(py, &self.inner.segment_start),
+            "segment_end" => u64_view(py, &self.inner.segment_end),
+            "relative_context_start" => u64_view(py, &self.inner.relative_context_start),
+            "relative_context_end" => u64_view(py, &self.inner.relative_context_end),
+            "relative_capture_start" => u64_view(py, &self.inner.relative_capture_start),
+            "relative_capture_end" => u64_view(py, &self.inner.relative_capture_end),
+            "group_offsets" => u64_view(py, &self.inner.group_offsets),
+            "group_starts" => u64_view(py, &self.inner.group_starts),
+            "group_ends" => u64_view(py, &self.inner.group_ends),
+            _ => Err(PyErr::new::<PyKeyError, _>(format!("Unknown column: {}", name))),
+        }
+    }
+
+    fn __len__(&self) -> usize {
+        self.inner.len()
+    }
+
+    fn __getitem__(&self, index: isize) -> PyResult<SearchMatch> {
+        // Matches are only rebuilt from the columns when they are accessed,
+        // and support negative indexes just like a list.
+        let length = self.inner.len() as isize;
+        let index = if index < 0 { index + length } else { index };
+
+        if index < 0 || index >= length {
+            return Err(PyErr::new::<PyIndexError, _>("Match index out of range"));
+        }
+
+        Ok(SearchMatch { inner: self.inner.get(index as usize) })
+    }
+
+    fn __iter__(slf: PyRef<'_, Self>) -> SearchColumnsIterator {
+        SearchColumnsIterator {
+            columns: slf.into(),
+            index: 0,
+        }
+    }
+}
+
+
+#[pyclass]
+pub struct SearchColumnsIterator {
+    columns: Py<SearchColumns>,
+    index: usize,
+}
+
+
+#[pymethods]
+impl SearchColumnsIterator {
+    fn __iter__(slf: PyRef<'_, Self>) -> PyRef<'_, Self> {
+        slf
+    }
+
+    fn __next__(mut slf: PyRefMut<'_, Self>, py: Python) -> Option<SearchMatch> {
+        let index = slf.index;
+        let columns = slf.columns.borrow(py);
+
+        if index >= columns.inner.len() {
+            return None;
+        }
+
+        let search_match = SearchMatch { inner: columns.inner.get(index) };
+        drop(columns);
+        slf.index += 1;
+
+        Some(search_match)
+    }
+}
+
+
+fn split_patterns(patterns: Vec<(String, String, Option<PyObject>, Option<Vec<String>>)>) -> PyResult<(Vec<Option<PyObject>>, CompiledPatterns)> {
+    // The filters stay behind with the stream, while everything else about
+    // the patterns is handed over to the scanning threads.
+    let mut filters = Vec::new();
+    let mut pattern_specs = Vec::new();
+
+    for (tag, pattern, filter, keywords) in patterns {
+        filters.push(filter);
+        pattern_specs.push((tag, pattern, keywords));
+    }
+
+    let regex_patterns = compile_patterns(pattern_specs).map_err(|error| {
+        PyErr::new::<PyValueError, _>(error)
+    })?;
+
+    Ok((filters, regex_patterns))
+}
+
+
+fn parse_class_policies(file_policies: Option<HashMap<String, String>>) -> PyResult<ClassPolicies> {
+    // Each class of file can be given its own policy, with the rest left at
+    // their defaults.
+    let mut class_policies = ClassPolicies::default();
+
+    for (class_name, policy_name) in file_policies.unwrap_or_default() {
+        let file_class = FileClass::from_name(&class_name).ok_or_else(|| {
+            PyErr::new::<PyValueError, _>(format!("Unknown file class: {}", class_name))
+        })?;
+
+        let policy = ClassPolicy::from_name(&policy_name).ok_or_else(|| {
+            PyErr::new::<PyValueError, _>(format!("Unknown file policy: {}", policy_name))
+        })?;
+
+        class_policies.set(file_class, policy);
+    }
+
+    Ok(class_policies)
+}
+
+
+fn start_search(path: &str, patterns: Vec<(String, String, Option<PyObject>, Option<Vec<String>>)>, excluded_file_patterns: Option<Vec<String>>, desired_context: Option<usize>, max_file_size: Option<usize>, max_threads: Option<usize>, skip_symlinks: Option<bool>, mmap_threshold: Option<usize>, chunk_size: Option<usize>, use_ignore_files: Option<bool>, file_policies: Option<HashMap<String, String>>, cache_path: Option<String>, rebuild_cache: Option<bool>, include_utf16: Option<bool>) -> PyResult<SearchStream> {
+    let (filters, regex_patterns) = split_patterns(patterns)?;
+
+    // Exclusions are combined into a single set, so each path is only
+    // checked once no matter how many exclusions there are.
+    let exclude_patterns = match excluded_file_patterns {
+        Some(excluded_file_patterns) if !excluded_file_patterns.is_empty() => {
+            Some(TextRegexSet::new(excluded_file_patterns).map_err(|error| {
+                PyErr::new::<PyValueError, _>(format!("Failed to compile pattern: {}", error))
+            })?)
+        },
+        _ => None,
+    };
+
+    let class_policies = parse_class_policies(file_policies)?;
+
+    // If any of the function arguments are left blank, we assign defaults here.
+    let options = SearchOptions {
+        path: path.to_string(),
+        exclude_patterns: exclude_patterns,
+        desired_context: desired_context.unwrap_or(128),
+        max_file_size: max_file_size.unwrap_or(0),
+        max_threads: max_threads.unwrap_or(num_cpus::get()),
+        skip_symlinks: skip_symlinks.unwrap_or(false),
+        mmap_threshold: mmap_threshold.unwrap_or(0),
+        chunk_size: chunk_size.unwrap_or(0),
+        use_ignore_files: use_ignore_files.unwrap_or(false),
+        include_utf16: include_utf16.unwrap_or(false),
+        class_policies: class_policies,
+        cache_path: cache_path,
+        rebuild_cache: rebuild_cache.unwrap_or(false),
+    };
+
+    // We prepare some channels for us to use between threads. The match
+    // channel is bounded, so a slow consumer holds back the scan instead of
+    // letting matches pile up in memory.
+    let (match_sender, match_receiver) = sync_channel(STREAM_CAPACITY);
+    let (error_sender, error_receiver) = channel();
+
+    // We keep some operation statistics.
+    let statistics = Arc::new(SearchStatistics::default());
+    let cancelled = Arc::new(AtomicBool::new(false));
+    let scan_started_at = SystemTime::now();
+
+    // The scan runs in the background, and its senders are dropped as soon
+    // as it finishes, which is what ends the stream.
+    let worker = {
+        let statistics = statistics.clone();
+        let cancelled = cancelled.clone();
+
+        thread::spawn(move || {
+            let match_sender = Mutex::new(match_sender);
+            let error_sender = Mutex::new(error_sender);
+
+            run_search(&options, &regex_patterns, &match_sender, &error_sender, &statistics, &cancelled);
+        })
+    };
+
+    Ok(SearchStream {
+        uuid: generate_token(),
+        scan_started_at: unix_timestamp(scan_started_at),
+        source: MatchSource::Walk {
+            receiver: Mutex::new(match_receiver),
+            error_receiver: Mutex::new(error_receiver),
+            worker: Some(worker),
+        },
+        pending: VecDeque::new(),
+        filters: filters,
+        filter_error: None,
+        statistics: statistics,
+        cancelled: cancelled,
+    })
+}
+
+
+#[pyfunction]
+fn stream_regex_search(path: &str, patterns: Vec<(String, String, Option<PyObject>, Option<Vec<String>>)>, excluded_file_patterns: Option<Vec<String>>, desired_context: Option<usize>, max_file_size: Option<usize>, max_threads: Option<usize>, skip_symlinks: Option<bool>, mmap_threshold: Option<usize>, chunk_size: Option<usize>, use_ignore_files: Option<bool>, file_policies: Option<HashMap<String, String>>, cache_path: Option<String>, rebuild_cache: Option<bool>, include_utf16: Option<bool>) -> PyResult<SearchStream> {
+    start_search(path, patterns, excluded_file_patterns, desired_context, max_file_size, max_threads, skip_symlinks, mmap_threshold, chunk_size, use_ignore_files, file_policies, cache_path, rebuild_cache, include_utf16)
+}
+
+
+#[pyfunction]
+fn stream_memory_search(contents: &PyAny, patterns: Vec<(String, String, Option<PyObject>, Option<Vec<String>>)>, desired_context: Option<usize>, max_file_size: Option<usize>, file_policies: Option<HashMap<String, String>>, include_utf16: Option<bool>) -> PyResult<SearchStream> {
+    // This searches buffers which are already in memory, such as the bodies
+    // extracted from a Burp export, rather than the files of a directory. The
+    // contents can be any iterable of file names and bytes, and are pulled
+    // one buffer at a time as the stream is consumed.
+    let (filters, regex_patterns) = split_patterns(patterns)?;
+    let class_policies = parse_class_policies(file_policies)?;
+
+    // Options which only apply to walking directories are left blank.
+    let options = SearchOptions {
+        path: String::new(),
+        exclude_patterns: None,
+        desired_context: desired_context.unwrap_or(128),
+        max_file_size: max_file_size.unwrap_or(0),
+        max_threads: 1,
+        skip_symlinks: false,
+        mmap_threshold: 0,
+        chunk_size: 0,
+        use_ignore_files: false,
+        include_utf16: include_utf16.unwrap_or(false),
+        class_policies: class_policies,
+        cache_path: None,
+        rebuild_cache: false,
+    };
+
+    Ok(SearchStream {
         uuid: generate_token(),
-        scan_started_at: scan_started_at.duration_since(UNIX_EPOCH).unwrap().as_secs(),
-        scan_completed_at: scan_completed_at.duration_since(UNIX_EPOCH).unwrap().as_secs(),
-        total_files_scanned: total_files_scanned,
-        total_directories_scanned: total_directories_scanned,
+        scan_started_at: unix_timestamp(SystemTime::now()),
+        source: MatchSource::Buffers {
+            contents: Some(contents.iter()?.into()),
+            options: options,
+            regex_patterns: regex_patterns,
+        },
+        pending: VecDeque::new(),
+        filters: filters,
+        filter_error: None,
+        statistics: Arc::new(SearchStatistics::default()),
+        cancelled: Arc::new(AtomicBool::new(false)),
+    })
+}
+
+
+#[pyfunction]
+fn recursive_regex_search(py: Python, path: &str, patterns: Vec<(String, String, Option<PyObject>, Option<Vec<String>>)>, excluded_file_patterns: Option<Vec<String>>, desired_context: Option<usize>, max_file_size: Option<usize>, max_threads: Option<usize>, skip_symlinks: Option<bool>, mmap_threshold: Option<usize>, chunk_size: Option<usize>, use_ignore_files: Option<bool>, file_policies: Option<HashMap<String, String>>, cache_path: Option<String>, rebuild_cache: Option<bool>, include_utf16: Option<bool>) -> PyResult<SearchResult> {
+    let mut stream = start_search(path, patterns, excluded_file_patterns, desired_context, max_file_size, max_threads, skip_symlinks, mmap_threshold, chunk_size, use_ignore_files, file_policies, cache_path, rebuild_cache, include_utf16)?;
+
+    // We drain the stream and push every match into an array.
+    let mut search_matches = Vec::new();
+
+    while let Some(search_match) = stream.next_match(py)? {
+        search_matches.push(search_match);
+    }
+
+    Ok(SearchResult {
+        uuid: stream.uuid.clone(),
+        scan_started_at: stream.scan_started_at,
+        scan_completed_at: stream.scan_completed_at().unwrap_or(stream.scan_started_at),
+        total_files_scanned: stream.total_files_scanned(),
+        total_directories_scanned: stream.total_directories_scanned(),
+        file_classes: stream.file_classes(),
+        duplicate_files: stream.duplicate_files(),
         matches: search_matches,
     })
 }
 
 
+#[pyfunction]
+fn columnar_regex_search(py: Python, path: &str, patterns: Vec<(String, String, Option<PyObject>, Option<Vec<String>>)>, excluded_file_patterns: Option<Vec<String>>, desired_context: Option<usize>, max_file_size: Option<usize>, max_threads: Option<usize>, skip_symlinks: Option<bool>, mmap_threshold: Option<usize>, chunk_size: Option<usize>, use_ignore_files: Option<bool>, file_policies: Option<HashMap<String, String>>, cache_path: Option<String>, rebuild_cache: Option<bool>, include_utf16: Option<bool>) -> PyResult<SearchColumns> {
+    let mut stream = start_search(path, patterns, excluded_file_patterns, desired_context, max_file_size, max_threads, skip_symlinks, mmap_threshold, chunk_size, use_ignore_files, file_policies, cache_path, rebuild_cache, include_utf16)?;
+
+    // We drain the stream into columns, rather than into match objects.
+    let columns = stream.collect_columns(py)?;
+
+    Ok(SearchColumns {
+        uuid: stream.uuid.clone(),
+        scan_started_at: stream.scan_started_at,
+        scan_completed_at: stream.scan_completed_at().unwrap_or(stream.scan_started_at),
+        total_files_scanned: stream.total_files_scanned(),
+        total_directories_scanned: stream.total_directories_scanned(),
+        file_classes: stream.file_classes(),
+        duplicate_files: stream.duplicate_files(),
+        inner: columns,
+    })
+}
+
+
+#[derive(FromPyObject)]
+enum MetricInput<'a> {
+    Text(&'a str),
+    Bytes(&'a [u8]),
+}
+
+
+fn collect_units(values: Vec<MetricInput>) -> Vec<Units> {
+    // The values are copied out while we hold the GIL, so that the metrics
+    // themselves can be calculated without it.
+    values.into_iter().map(|value| match value {
+        MetricInput::Text(text) => text_units(text),
+        MetricInput::Bytes(bytes) => byte_units(bytes),
+    }).collect()
+}
+
+
+#[pyfunction]
+fn batch_shannon_entropy(py: Python, values: Vec<MetricInput>) -> Vec<f64> {
+    let values = collect_units(values);
+    py.allow_threads(|| values.iter().map(|units| metrics::shannon_entropy(units)).collect())
+}
+
+
+#[pyfunction]
+fn batch_relative_shannon_entropy(py: Python, values: Vec<MetricInput>) -> Vec<f64> {
+    let values = collect_units(values);
+    py.allow_threads(|| values.iter().map(|units| metrics::relative_shannon_entropy(units)).collect())
+}
+
+
+#[pyfunction]
+fn batch_sequence_rating(py: Python, values: Vec<MetricInput>, max_distance: Option<u32>) -> Vec<f64> {
+    let values = collect_units(values);
+    let max_distance = max_distance.unwrap_or(1);
+    py.allow_threads(|| values.iter().map(|units| metrics::sequence_rating(units, max_distance)).collect())
+}
+
+
+#[pyfunction]
+fn batch_character_counts(py: Python, values: Vec<MetricInput>) -> Vec<(usize, usize, usize)> {
+    let values = collect_units(values);
+    py.allow_threads(|| values.iter().map(|units| metrics::character_counts(units)).collect())
+}
+
+
+#[pyclass]
+pub struct GibberishModel {
+    inner: GibberishScorer,
+}
+
+
+#[pymethods]
+impl GibberishModel {
+    #[new]
+    fn new(matrix: Vec<Vec<f64>>) -> PyResult<GibberishModel> {
+        Ok(GibberishModel {
+            inner: GibberishScorer::new(matrix).map_err(PyValueError::new_err)?,
+        })
+    }
+
+    fn score(&self, text: &str) -> f64 {
+        self.inner.score(text)
+    }
+
+    fn score_batch(&self, py: Python, texts: Vec<String>) -> Vec<f64> {
+        py.allow_threads(|| texts.iter().map(|text| self.inner.score(text)).collect())
+    }
+
+    fn rate(&self, text: &str) -> f64 {
+        self.inner.rate(text)
+    }
+
+    fn rate_batch(&self, py: Python, texts: Vec<String>) -> Vec<f64> {
+        py.allow_threads(|| texts.iter().map(|text| self.inner.rate(text)).collect())
+    }
+}
+
+
 #[pymodule]
 fn mystiks_core(_py: Python, m: &PyModule) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(recursive_regex_search, m)?)?;
+    m.add_function(wrap_pyfunction!(stream_regex_search, m)?)?;
+    m.add_function(wrap_pyfunction!(stream_memory_search, m)?)?;
+    m.add_function(wrap_pyfunction!(columnar_regex_search, m)?)?;
+    m.add_function(wrap_pyfunction!(batch_shannon_entropy, m)?)?;
+    m.add_function(wrap_pyfunction!(batch_relative_shannon_entropy, m)?)?;
+    m.add_function(wrap_pyfunction!(batch_sequence_rating, m)?)?;
+    m.add_function(wrap_pyfunction!(batch_character_counts, m)?)?;
+    m.add_class::<GibberishModel>()?;
+    m.add_class::<SearchColumns>()?;
     m.add_class::<SearchMatch>()?;
+    m.add_class::<SearchStream>()?;
 
     Ok(())
 }
@@ -0,0 +1,98 @@
+use std::collections::HashMap;
+
+
+// This is how a string is measured: as Unicode characters when it is text, or
+// as byte values when it is bytes, just as iterating over either would give.
+pub type Units = Vec<u32>;
+
+
+pub fn text_units(text: &str) -> Units {
+    text.chars().map(|character| character as u32).collect()
+}
+
+
+pub fn byte_units(bytes: &[u8]) -> Units {
+    bytes.iter().map(|byte| *byte as u32).collect()
+}
+
+
+fn count_units(units: &[u32]) -> Vec<usize> {
+    // The counts are kept in the order each unit first appears, which is the
+    // order they are summed in by the Python implementation, so that results
+    // are identical to it (and not just close).
+    let mut indexes: HashMap<u32, usize> = HashMap::new();
+    let mut counts: Vec<usize> = Vec::new();
+
+    for unit in units {
+        let index = *indexes.entry(*unit).or_insert_with(|| {
+            counts.push(0);
+            counts.len() - 1
+        });
+
+        counts[index] += 1;
+    }
+
+    counts
+}
+
+
+fn entropy_from_counts(counts: &[usize], length: usize) -> f64 {
+    let mut entropy = 0.0;
+
+    for count in counts {
+        let probability = *count as f64 / length as f64;
+        entropy += probability * probability.log2();
+    }
+
+    -entropy
+}
+
+
+pub fn shannon_entropy(units: &[u32]) -> f64 {
+    if units.is_empty() {
+        return 0.0;
+    }
+
+    entropy_from_counts(&count_units(units), units.len())
+}
+
+
+pub fn relative_shannon_entropy(units: &[u32]) -> f64 {
+    // Strings with fewer than two distinct units have no entropy to speak of,
+    // so they are given a rating of zero instead of dividing by zero.
+    let counts = count_units(units);
+
+    if counts.len() < 2 {
+        return 0.0;
+    }
+
+    entropy_from_counts(&counts, units.len()) / (counts.len() as f64).log2()
+}
+
+
+pub fn sequence_rating(units: &[u32], max_distance: u32) -> f64 {
+    if units.len() < 2 {
+        return 0.0;
+    }
+
+    let sequences = units.windows(2).filter(|pair| pair[0].abs_diff(pair[1]) <= max_distance).count();
+
+    sequences as f64 / (units.len() - 1) as f64
+}
+
+
+pub fn character_counts(units: &[u32]) -> (usize, usize, usize) {
+    let mut letter_count = 0;
+    let mut number_count = 0;
+    let mut symbol_count = 0;
+
+    for unit in units {
+        match char::from_u32(*unit) {
+            Some(character) if character.is_ascii_alphabetic() => letter_count += 1,
+            Some(character) if character.is_ascii_digit() => number_count += 1,
+            _ => symbol_count += 1,
+        }
+    }
+
+    (letter_count, number_count, symbol_count)
+}
@@ -0,0 +1,156 @@
+use aho_corasick::AhoCorasick;
+use regex::bytes::{Regex, RegexSet};
+use regex_syntax::ParserBuilder;
+use std::cmp::max;
+use std::collections::HashMap;
+use std::sync::Arc;
+use xxhash_rust::xxh3::Xxh3;
+
+
+pub struct CompiledPattern {
+    pub tag: Arc<str>,
+    pub source: Arc<str>,
+    pub regex: Regex,
+}
+
+
+pub struct CompiledPatterns {
+    // The combined set is used to find which patterns match a buffer in a
+    // single pass, before running capture extraction for just those patterns.
+    pub set: RegexSet,
+    pub patterns: Vec<CompiledPattern>,
+    // Patterns which declare keywords are only evaluated when at least one of
+    // those keywords appears in the buffer. Each keyword maps back to the
+    // patterns which declared it.
+    keywords: Option<AhoCorasick>,
+    keyword_owners: Vec<Vec<usize>>,
+    requires_keywords: Vec<bool>,
+    // This is the longest match any pattern can produce, if it is bounded.
+    pub max_match_length: Option<usize>,
+    // This is a hash of every pattern, tag and keyword, in order, which tells
+    // whether results from an earlier search used the same patterns.
+    pub fingerprint: u64,
+}
+
+
+impl CompiledPatterns {
+    pub fn find_candidates(&self, contents: &[u8]) -> Vec<bool> {
+        // Patterns without keywords are always candidates.
+        let mut candidates: Vec<bool> = self.requires_keywords.iter().map(|required| !required).collect();
+
+        let keywords = match &self.keywords {
+            Some(keywords) => keywords,
+            None => return candidates,
+        };
+
+        let mut remaining = self.requires_keywords.iter().filter(|required| **required).count();
+
+        // We sweep the buffer once for every keyword, stopping early as soon
+        // as every pattern has been unlocked.
+        for keyword_match in keywords.find_overlapping_iter(contents) {
+            for owner in self.keyword_owners[keyword_match.pattern().as_usize()].iter() {
+                if !candidates[*owner] {
+                    candidates[*owner] = true;
+                    remaining -= 1;
+                }
+            }
+
+            if remaining == 0 {
+                break;
+            }
+        }
+
+        candidates
+    }
+}
+
+
+pub fn compile_patterns(patterns: Vec<(String, String, Option<Vec<String>>)>) -> Result<CompiledPatterns, String> {
+    // We compile each pattern and its tag into a vector.
+    let mut regex_patterns: Vec<CompiledPattern> = Vec::new();
+
+    let mut keywords: Vec<String> = Vec::new();
+    let mut keyword_indexes: HashMap<String, usize> = HashMap::new();
+    let mut keyword_owners: Vec<Vec<usize>> = Vec::new();
+    let mut requires_keywords: Vec<bool> = Vec::new();
+    let mut max_match_length: Option<usize> = Some(0);
+    let mut fingerprint = Xxh3::new();
+
+    for (index, (tag, pattern, pattern_keywords)) in patterns.into_iter().enumerate() {
+        for part in [&tag, &pattern].into_iter().chain(pattern_keywords.iter().flatten()) {
+            fingerprint.update(part.as_bytes());
+            fingerprint.update(b"\x00");
+        }
+
+        fingerprint.update(b"\x01");
+
+        // We attempt to convert the byte string into a valid pattern, and if
+        // that fails, we return an error.
+        let byte_pattern = Regex::new(&pattern).map_err(|error| {
+            format!("Failed to compile pattern: {}", error)
+        })?;
+
+        // We also keep track of how long a match can be, which is used to
+        // size the overlap between chunks when streaming large files.
+        let pattern_length = ParserBuilder::new().utf8(false).build().parse(&pattern).ok()
+            .and_then(|hir| hir.properties().maximum_len());
+
+        max_match_length = match (max_match_length, pattern_length) {
+            (Some(current_length), Some(pattern_length)) => Some(max(current_length, pattern_length)),
+            _ => None,
+        };
+
+        regex_patterns.push(CompiledPattern {
+            tag: Arc::from(tag),
+            source: Arc::from(pattern),
+            regex: byte_pattern,
+        });
+
+        // An empty keyword can match anywhere, so a pattern which supplies
+        // one is treated as if it had no keywords at all.
+        let pattern_keywords = pattern_keywords.unwrap_or_default();
+
+        if pattern_keywords.is_empty() || pattern_keywords.iter().any(|keyword| keyword.is_empty()) {
+            requires_keywords.push(false);
+            continue;
+        }
+
+        requires_keywords.push(true);
+
+        for keyword in pattern_keywords {
+            let keyword_index = *keyword_indexes.entry(keyword.clone()).or_insert_with(|| {
+                keywords.push(keyword);
+                keyword_owners.push(Vec::new());
+                keywords.len() - 1
+            });
+
+            keyword_owners[keyword_index].push(index);
+        }
+    }
+
+    // We also combine every pattern into a single set, which lets us scan a
+    // buffer once no matter how many patterns have been loaded.
+    let regex_set = RegexSet::new(regex_patterns.iter().map(|pattern| pattern.regex.as_str())).map_err(|error| {
+        format!("Failed to compile pattern set: {}", error)
+    })?;
+
+    // Keywords are matched case-insensitively, since many patterns are. This
+    // only ever lets more files through, so it can't cause missed findings.
+    let keyword_automaton = if keywords.is_empty() {
+        None
+    } else {
+        Some(AhoCorasick::builder().ascii_case_insensitive(true).build(&keywords).map_err(|error| {
+            format!("Failed to compile keywords: {}", error)
+        })?)
+    };
+
+    Ok(CompiledPatterns {
+        set: regex_set,
+        patterns: regex_patterns,
+        keywords: keyword_automaton,
+        keyword_owners: keyword_owners,
+        requires_keywords: requires_keywords,
+        max_match_length: max_match_length,
+        fingerprint: fingerprint.digest(),
+    })
+}
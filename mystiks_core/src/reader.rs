@@ -0,0 +1,105 @@
+use memmap2::Mmap;
+use std::cmp::min;
+use std::fs::File;
+use std::io::{self, Read, Seek, SeekFrom};
+use std::ops::{Deref, Range};
+
+
+pub enum FileContents {
+    Buffer(Vec<u8>),
+    Mapped(Mmap),
+}
+
+
+impl Deref for FileContents {
+    type Target = [u8];
+
+    fn deref(&self) -> &[u8] {
+        match self {
+            FileContents::Buffer(buffer) => buffer,
+            FileContents::Mapped(mapping) => mapping,
+        }
+    }
+}
+
+
+pub fn read_contents(file: &mut File, file_size: u64, mmap_threshold: usize) -> io::Result<FileContents> {
+    // Files above the threshold are mapped into memory and scanned in place,
+    // rather than being copied onto the heap of each worker.
+    if mmap_threshold > 0 && file_size > mmap_threshold as u64 {
+        // Mapping can fail on some filesystems (e.g. certain network mounts),
+        // so we quietly fall back to reading the file if it does.
+        if let Ok(mapping) = unsafe { Mmap::map(&*file) } {
+            return Ok(FileContents::Mapped(mapping));
+        }
+    }
+
+    let mut contents = Vec::with_capacity(file_size as usize);
+    file.read_to_end(&mut contents)?;
+
+    Ok(FileContents::Buffer(contents))
+}
+
+
+pub fn read_head(file: &mut File, length: usize) -> io::Result<Vec<u8>> {
+    // This reads the start of a file, and then rewinds it so that the file
+    // can be read again from the beginning.
+    let mut head = Vec::with_capacity(length);
+    (&mut *file).take(length as u64).read_to_end(&mut head)?;
+    file.seek(SeekFrom::Start(0))?;
+
+    Ok(head)
+}
+
+
+pub struct ChunkReader {
+    file: File,
+    file_size: usize,
+    chunk_size: usize,
+    // The lead is how far each window reaches back before its chunk, and the
+    // tail is how far it reaches past it. Together they make sure that any
+    // match starting inside a chunk is fully visible along with its context.
+    lead: usize,
+    tail: usize,
+    position: usize,
+    buffer: Vec<u8>,
+}
+
+
+impl ChunkReader {
+    pub fn new(file: File, file_size: usize, chunk_size: usize, lead: usize, tail: usize) -> ChunkReader {
+        ChunkReader {
+            file: file,
+            file_size: file_size,
+            chunk_size: chunk_size,
+            lead: lead,
+            tail: tail,
+            position: 0,
+            buffer: Vec::with_capacity(lead + chunk_size + tail),
+        }
+    }
+
+    pub fn next_chunk(&mut self) -> io::Result<Option<(&[u8], usize, Range<usize>)>> {
+        // This returns the window's contents, the file offset that the window
+        // starts at, and the range of the window which belongs to this chunk.
+        // Only matches starting inside that range should be kept, as the rest
+        // will be (or have been) found by the neighbouring chunks.
+        if self.position >= self.file_size {
+            return Ok(None);
+        }
+
+        let window_start = self.position.saturating_sub(self.lead);
+        let window_end = min(self.file_size, self.position + self.chunk_size + self.tail);
+
+        self.file.seek(SeekFrom::Start(window_start as u64))?;
+        self.buffer.clear();
+        (&mut self.file).take((window_end - window_start) as u64).read_to_end(&mut self.buffer)?;
+
+        let accepted_start = self.position - window_start;
+        let accepted_end = min(self.position + self.chunk_size, self.file_size) - window_start;
+
+        self.position += self.chunk_size;
+
+        Ok(Some((&self.buffer, window_start, accepted_start..accepted_end)))
+    }
+}
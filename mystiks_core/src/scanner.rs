@@ -0,0 +1,345 @@
+use std::cmp::{max, min};
+use std::ops::Range;
+use std::sync::Arc;
+use xxhash_rust::xxh3::Xxh3;
+
+use crate::patterns::CompiledPatterns;
+use crate::utf16::{Encoding, Transcoded, detect_encoding, find_regions, transcode};
+
+
+// This is the shortest run of printable characters that is scanned when only
+// the strings of a file are searched.
+const MIN_STRING_LENGTH: usize = 8;
+
+
+pub struct Segment {
+    // This is a window of scanned text which the contexts of one or more
+    // nearby matches are cut from, along with where it sits in the file.
+    pub bytes: Vec<u8>,
+    pub start: usize,
+    pub end: usize,
+}
+
+
+#[derive(Clone)]
+pub struct Match {
+    pub uuid: String,
+    pub file_name: Arc<str>,
+    pub pattern_index: usize,
+    pub pattern: Arc<str>,
+    pub pattern_tag: Arc<str>,
+    pub encoding: Encoding,
+    // Matches close together share a segment, and each of their contexts is
+    // a range within it. The context is always UTF-8 (UTF-16 text is
+    // transcoded before it is scanned), and the capture and its groups are
+    // ranges within the context.
+    pub segment: Arc<Segment>,
+    pub context: Range<usize>,
+    pub capture: Range<usize>,
+    pub groups: Vec<Range<usize>>,
+    // These are where the capture and context sit in the original file.
+    pub capture_start: usize,
+    pub capture_end: usize,
+    pub context_start: usize,
+    pub context_end: usize,
+}
+
+
+impl Match {
+    pub fn context_bytes(&self) -> &[u8] {
+        &self.segment.bytes[self.context.clone()]
+    }
+
+    pub fn slice(&self, range: &Range<usize>) -> &[u8] {
+        &self.context_bytes()[range.clone()]
+    }
+
+    pub fn capture(&self) -> &[u8] {
+        self.slice(&self.capture)
+    }
+}
+
+
+pub enum OffsetMap<'a> {
+    // The contents are a window into the file, starting at this offset.
+    Shifted(usize),
+    // The contents were transcoded, and each byte has its own file offset.
+    Mapped(&'a [usize]),
+}
+
+
+impl<'a> OffsetMap<'a> {
+    fn file_offset(&self, index: usize) -> usize {
+        match self {
+            OffsetMap::Shifted(contents_offset) => contents_offset + index,
+            OffsetMap::Mapped(offsets) => offsets[index],
+        }
+    }
+}
+
+
+pub fn generate_match_id(file_name: &str, content_hash: Option<u64>, pattern_tag: &str, encoding: Encoding, capture_start: usize, capture_end: usize) -> String {
+    // Match identifiers are a hash of what was matched and where, so they are
+    // cheap to make and stay the same from one search to the next. Files are
+    // told apart by their contents where they were hashed, since which copy of
+    // a duplicated file gets scanned depends on the order of the walk.
+    let mut hasher = Xxh3::new();
+
+    match content_hash {
+        Some(content_hash) => {
+            hasher.update(b"hash\0");
+            hasher.update(&content_hash.to_le_bytes());
+        },
+        None => {
+            hasher.update(b"file\0");
+            hasher.update(file_name.as_bytes());
+        },
+    }
+
+    hasher.update(b"\0");
+    hasher.update(pattern_tag.as_bytes());
+    hasher.update(b"\0");
+    hasher.update(encoding.name().as_bytes());
+    hasher.update(&(capture_start as u64).to_le_bytes());
+    hasher.update(&(capture_end as u64).to_le_bytes());
+
+    format!("{:032x}", hasher.digest128())
+}
+
+
+fn is_continuation_byte(byte: u8) -> bool {
+    byte & 0xc0 == 0x80
+}
+
+
+pub fn search_contents(contents: &[u8], offset_map: &OffsetMap, encoding: Encoding, accepted: Range<usize>, file_name: &Arc<str>, content_hash: Option<u64>, regex_patterns: &CompiledPatterns, desired_context: usize, matches: &mut Vec<Match>) {
+    // The contents may only be a window into a larger file (or text decoded
+    // from one). The offset map is how positions in the contents are turned
+    // back into file offsets, and only matches that start inside the accepted
+    // range of the contents are kept.
+
+    // We look for the keywords of each pattern first. If the contents lack
+    // every keyword, no regex is evaluated at all.
+    let candidate_patterns = regex_patterns.find_candidates(contents);
+
+    if !candidate_patterns.iter().any(|is_candidate| *is_candidate) {
+        return;
+    }
+
+    // We run the combined pattern set over the contents next. Most files
+    // match nothing, and those never reach capture extraction.
+    let matched_patterns = regex_patterns.set.matches(contents);
+
+    if !matched_patterns.matched_any() {
+        return;
+    }
+
+    // Time to iterate through the capture patterns that matched! Positions
+    // are kept relative to the contents until every match has been found.
+    let mut found: Vec<(usize, Range<usize>, Range<usize>, Vec<Range<usize>>)> = Vec::new();
+
+    for pattern_index in matched_patterns.iter() {
+        if !candidate_patterns[pattern_index] {
+            continue;
+        }
+
+        let pattern = &regex_patterns.patterns[pattern_index];
+
+        for capture in pattern.regex.captures_iter(contents) {
+            let full_match = capture.get(0).unwrap();
+
+            if full_match.start() < accepted.start {
+                continue;
+            } else if full_match.start() >= accepted.end {
+                break;
+            }
+
+            // We make sure that the correct amount of context is stored.
+            let mut context_start = full_match.start().saturating_sub(desired_context);
+            let mut context_end = min(contents.len(), full_match.end() + desired_context);
+
+            // Transcoded text is known to be UTF-8, so its context is kept
+            // from splitting a character in half.
+            if let OffsetMap::Mapped(_) = offset_map {
+                while context_start < full_match.start() && is_continuation_byte(contents[context_start]) {
+                    context_start += 1;
+                }
+
+                while context_end > full_match.end() && context_end < contents.len() && is_continuation_byte(contents[context_end]) {
+                    context_end -= 1;
+                }
+            }
+
+            // We store where each capture group sits. Groups which did not
+            // participate in the match are stored as empty.
+            let groups = (1..capture.len()).map(|index| {
+                match capture.get(index) {
+                    Some(group) => group.range(),
+                    None => full_match.start()..full_match.start(),
+                }
+            }).collect();
+
+            found.push((pattern_index, context_start..context_end, full_match.range(), groups));
+        }
+    }
+
+    if found.is_empty() {
+        return;
+    }
+
+    // Contexts which overlap (or touch) are merged into shared segments, so
+    // that matches close together don't each hold a copy of the same text.
+    let mut windows: Vec<Range<usize>> = found.iter().map(|(_, context, _, _)| context.clone()).collect();
+    windows.sort_by_key(|window| window.start);
+
+    let mut merged_windows: Vec<Range<usize>> = Vec::new();
+
+    for window in windows {
+        match merged_windows.last_mut() {
+            Some(merged_window) if window.start <= merged_window.end => merged_window.end = max(merged_window.end, window.end),
+            _ => merged_windows.push(window),
+        }
+    }
+
+    let segments: Vec<Arc<Segment>> = merged_windows.iter().map(|window| Arc::new(Segment {
+        bytes: contents[window.clone()].to_vec(),
+        start: offset_map.file_offset(window.start),
+        end: offset_map.file_offset(window.end),
+    })).collect();
+
+    for (pattern_index, context, full_match, groups) in found {
+        let pattern = &regex_patterns.patterns[pattern_index];
+        let segment_index = merged_windows.partition_point(|window| window.start <= context.start) - 1;
+        let segment_start = merged_windows[segment_index].start;
+        let capture_start = offset_map.file_offset(full_match.start);
+        let capture_end = offset_map.file_offset(full_match.end);
+
+        matches.push(Match {
+            uuid: generate_match_id(file_name, content_hash, &pattern.tag, encoding, capture_start, capture_end),
+            file_name: file_name.clone(),
+            pattern_index: pattern_index,
+            pattern: pattern.source.clone(),
+            pattern_tag: pattern.tag.clone(),
+            encoding: encoding,
+            segment: segments[segment_index].clone(),
+            context: context.start - segment_start..context.end - segment_start,
+            capture: full_match.start - context.start..full_match.end - context.start,
+            groups: groups.into_iter().map(|group| group.start - context.start..group.end - context.start).collect(),
+            capture_start: capture_start,
+            capture_end: capture_end,
+            context_start: offset_map.file_offset(context.start),
+            context_end: offset_map.file_offset(context.end),
+        });
+    }
+}
+
+
+fn is_printable(byte: u8) -> bool {
+    matches!(byte, 0x20..=0x7e | b'\t' | b'\n' | b'\r')
+}
+
+
+pub fn search_strings(contents: &[u8], contents_offset: usize, accepted: Range<usize>, file_name: &Arc<str>, content_hash: Option<u64>, regex_patterns: &CompiledPatterns, desired_context: usize, matches: &mut Vec<Match>) {
+    // We find every run of printable characters first. Runs which sit close
+    // enough together for their context to overlap are grouped, so that they
+    // can be scanned in one go.
+    let mut groups: Vec<Range<usize>> = Vec::new();
+    let mut index = 0;
+
+    while index < contents.len() {
+        if !is_printable(contents[index]) {
+            index += 1;
+            continue;
+        }
+
+        let run_start = index;
+
+        while index < contents.len() && is_printable(contents[index]) {
+            index += 1;
+        }
+
+        if index - run_start < MIN_STRING_LENGTH {
+            continue;
+        }
+
+        match groups.last_mut() {
+            Some(group) if run_start <= group.end + desired_context * 2 => group.end = index,
+            _ => groups.push(run_start..index),
+        }
+    }
+
+    // Each group is scanned along with its context, but only matches which
+    // start inside the group (and inside the accepted range) are kept.
+    for group in groups {
+        let group_accepted = max(group.start, accepted.start)..min(group.end, accepted.end);
+
+        if group_accepted.start >= group_accepted.end {
+            continue;
+        }
+
+        let window_start = group.start.saturating_sub(desired_context);
+        let window_end = min(contents.len(), group.end + desired_context);
+
+        search_contents(
+            &contents[window_start..window_end],
+            &OffsetMap::Shifted(contents_offset + window_start),
+            Encoding::Utf8,
+            group_accepted.start - window_start..group_accepted.end - window_start,
+            file_name,
+            content_hash,
+            regex_patterns,
+            desired_context,
+            matches
+        );
+    }
+}
+
+
+fn search_transcoded(transcoded: &Transcoded, encoding: Encoding, accepted: Range<usize>, file_name: &Arc<str>, content_hash: Option<u64>, regex_patterns: &CompiledPatterns, desired_context: usize, matches: &mut Vec<Match>) {
+    // The accepted range is given in file offsets, and is turned into a range
+    // of the text before scanning.
+    let accepted = transcoded.to_text_range(&accepted);
+
+    if accepted.start >= accepted.end {
+        return;
+    }
+
+    search_contents(&transcoded.text, &OffsetMap::Mapped(&transcoded.offsets), encoding, accepted, file_name, content_hash, regex_patterns, desired_context, matches);
+}
+
+
+pub fn search_utf16(contents: &[u8], contents_offset: usize, accepted: Range<usize>, file_name: &Arc<str>, content_hash: Option<u64>, regex_patterns: &CompiledPatterns, desired_context: usize, matches: &mut Vec<Match>) {
+    // This searches contents which are entirely UTF-16. Code units are taken
+    // to start at even file offsets, which skips over any BOM as well.
+    let encoding = detect_encoding(contents, contents_offset);
+    let mut region_start = contents_offset % 2;
+
+    if contents_offset == 0 && (contents.starts_with(b"\xff\xfe") || contents.starts_with(b"\xfe\xff")) {
+        region_start = 2;
+    }
+
+    if region_start >= contents.len() {
+        return;
+    }
+
+    let transcoded = transcode(contents, contents_offset, region_start..contents.len(), encoding);
+    let accepted = contents_offset + accepted.start..contents_offset + accepted.end;
+
+    search_transcoded(&transcoded, encoding, accepted, file_name, content_hash, regex_patterns, desired_context, matches);
+}
+
+
+pub fn search_utf16_regions(contents: &[u8], contents_offset: usize, accepted: Range<usize>, file_name: &Arc<str>, content_hash: Option<u64>, regex_patterns: &CompiledPatterns, desired_context: usize, matches: &mut Vec<Match>) {
+    // This searches the runs of UTF-16 text found inside of other contents,
+    // such as the strings of a Windows binary.
+    for (region, encoding) in find_regions(contents) {
+        if region.start >= accepted.end || region.end <= accepted.start {
+            continue;
+        }
+
+        let transcoded = transcode(contents, contents_offset, region, encoding);
+        let region_accepted = contents_offset + accepted.start..contents_offset + accepted.end;
+
+        search_transcoded(&transcoded, encoding, region_accepted, file_name, content_hash, regex_patterns, desired_context, matches);
+    }
+}
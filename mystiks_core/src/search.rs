@@ -0,0 +1,373 @@
+use ignore::{WalkBuilder, WalkState};
+use regex::RegexSet as TextRegexSet;
+use std::fs::File;
+use std::ops::Range;
+use std::path::Path;
+use std::sync::{Arc, Mutex};
+use std::sync::atomic::{AtomicBool, AtomicU64, AtomicUsize, Ordering};
+use std::sync::mpsc::{Sender, SyncSender};
+use std::time::{SystemTime, UNIX_EPOCH};
+
+use crate::cache::{CachedFile, SearchCache, file_modified_at};
+use crate::dedup::{DuplicateIndex, hash_contents};
+use crate::patterns::CompiledPatterns;
+use crate::reader::{ChunkReader, read_contents, read_head};
+use crate::scanner::{Match, OffsetMap, search_contents, search_strings, search_utf16, search_utf16_regions};
+use crate::sniffer::{ClassPolicies, ClassPolicy, FileClass, SNIFF_LENGTH, sniff};
+use crate::utf16::Encoding;
+
+
+// When a pattern has no upper bound on its length, chunked scanning assumes
+// that its matches are no longer than this many bytes.
+const UNBOUNDED_MATCH_LENGTH: usize = 4096;
+
+// Files with this name are always honored, and follow the gitignore syntax.
+const IGNORE_FILE_NAME: &str = ".mystiksignore";
+
+
+pub struct SearchOptions {
+    pub path: String,
+    pub exclude_patterns: Option<TextRegexSet>,
+    pub desired_context: usize,
+    pub max_file_size: usize,
+    pub max_threads: usize,
+    pub skip_symlinks: bool,
+    pub mmap_threshold: usize,
+    pub chunk_size: usize,
+    pub use_ignore_files: bool,
+    pub include_utf16: bool,
+    pub class_policies: ClassPolicies,
+    pub cache_path: Option<String>,
+    pub rebuild_cache: bool,
+}
+
+
+#[derive(Default)]
+pub struct SearchStatistics {
+    pub total_files_scanned: AtomicUsize,
+    pub total_directories_scanned: AtomicUsize,
+    pub scan_completed_at: AtomicU64,
+    // This counts the files of each class, indexed by `FileClass::index`.
+    pub files_by_class: [AtomicUsize; 4],
+    pub duplicates: DuplicateIndex,
+}
+
+
+pub fn unix_timestamp(time: SystemTime) -> u64 {
+    time.duration_since(UNIX_EPOCH).unwrap().as_secs()
+}
+
+
+fn scan_contents(contents: &[u8], contents_offset: usize, accepted: Range<usize>, file_name: &Arc<str>, content_hash: Option<u64>, file_class: FileClass, policy: ClassPolicy, options: &SearchOptions, regex_patterns: &CompiledPatterns, matches: &mut Vec<Match>) {
+    match policy {
+        ClassPolicy::Strings => {
+            search_strings(contents, contents_offset, accepted.clone(), file_name, content_hash, regex_patterns, options.desired_context, matches);
+        },
+        ClassPolicy::Decode if file_class == FileClass::Utf16 => {
+            search_utf16(contents, contents_offset, accepted.clone(), file_name, content_hash, regex_patterns, options.desired_context, matches);
+        },
+        _ => {
+            search_contents(contents, &OffsetMap::Shifted(contents_offset), Encoding::Utf8, accepted.clone(), file_name, content_hash, regex_patterns, options.desired_context, matches);
+        },
+    }
+
+    // UTF-16 text hiding inside of other files is only searched for when
+    // asked, as it needs another pass over the contents.
+    if options.include_utf16 && file_class != FileClass::Utf16 {
+        search_utf16_regions(contents, contents_offset, accepted, file_name, content_hash, regex_patterns, options.desired_context, matches);
+    }
+}
+
+
+pub fn search_buffer(file_name: &Arc<str>, contents: &[u8], options: &SearchOptions, regex_patterns: &CompiledPatterns, statistics: &SearchStatistics) -> Vec<Match> {
+    // Buffers are searched just like files, except that they are already in
+    // memory, and are named by whoever handed them over.
+    let mut matches = Vec::new();
+    statistics.total_files_scanned.fetch_add(1, Ordering::Relaxed);
+
+    if options.max_file_size > 0 && contents.len() > options.max_file_size {
+        return matches;
+    }
+
+    let file_class = sniff(contents);
+    statistics.files_by_class[file_class.index()].fetch_add(1, Ordering::Relaxed);
+
+    let policy = options.class_policies.get(file_class);
+
+    if policy == ClassPolicy::Skip {
+        return matches;
+    }
+
+    let content_hash = hash_contents(contents);
+
+    if !contents.is_empty() && !statistics.duplicates.claim(file_name, contents.len() as u64, content_hash) {
+        return matches;
+    }
+
+    scan_contents(contents, 0, 0..contents.len(), file_name, Some(content_hash), file_class, policy, options, regex_patterns, &mut matches);
+
+    matches
+}
+
+
+fn search_file(path: &Path, options: &SearchOptions, regex_patterns: &CompiledPatterns, statistics: &SearchStatistics, cache: Option<&SearchCache>, chunk_lead: usize, chunk_tail: usize, send_matches: &dyn Fn(Vec<Match>), send_error: &dyn Fn(String)) {
+    let file_name: Arc<str> = Arc::from(path.display().to_string());
+
+    // We open the file for reading, or error if we can't.
+    let file_open_result = File::open(&path);
+
+    if file_open_result.is_err() {
+        send_error(format!("Failed to open file: {}", path.display()));
+        return;
+    }
+
+    let mut file = file_open_result.unwrap();
+
+    // Next, we try to check for the file's metadata.
+    let file_metadata_result = file.metadata();
+
+    if file_metadata_result.is_err() {
+        send_error(format!("Failed to get file metadata: {}", path.display()));
+        return;
+    }
+
+    let file_metadata = file_metadata_result.unwrap();
+
+    // Files which haven't changed since the last search are served straight
+    // from the cache, without being read at all.
+    let file_size = file_metadata.len();
+    let modified_at = file_modified_at(&file_metadata);
+
+    if let (Some(cache), Some(modified_at)) = (cache, modified_at) {
+        if let Some(cached_file) = cache.take(&file_name) {
+            if cached_file.is_fresh(file_size, modified_at) {
+                // A cached file may have become a copy of another file, in
+                // which case the other file's matches already cover it.
+                let is_duplicate = match cached_file.content_hash {
+                    Some(content_hash) => !statistics.duplicates.claim(&file_name, file_size, content_hash),
+                    None => false,
+                };
+
+                // A file which was only a copy during the last search has no
+                // matches to replay, so once it is the first copy of its
+                // contents, it has to be scanned again.
+                if is_duplicate || !cached_file.is_duplicate {
+                    if let Some(file_class) = cached_file.file_class {
+                        statistics.files_by_class[file_class.index()].fetch_add(1, Ordering::Relaxed);
+                    }
+
+                    if is_duplicate {
+                        cache.store(&file_name, CachedFile {
+                            is_duplicate: true,
+                            matches: Vec::new(),
+                            ..cached_file
+                        });
+                    } else {
+                        send_matches(cached_file.replay());
+                        cache.store(&file_name, cached_file);
+                    }
+
+                    return;
+                }
+            }
+        }
+    }
+
+    let is_oversized = options.max_file_size > 0 && file_size > options.max_file_size as u64;
+
+    if is_oversized && options.chunk_size == 0 {
+        return;
+    }
+
+    // We classify the file from its first few bytes, and then decide how (or
+    // whether) to scan it based on that class.
+    let head_result = read_head(&mut file, SNIFF_LENGTH);
+
+    if head_result.is_err() {
+        send_error(format!("Failed to read the file: {}", path.display()));
+        return;
+    }
+
+    let file_class = sniff(&head_result.unwrap());
+    statistics.files_by_class[file_class.index()].fetch_add(1, Ordering::Relaxed);
+
+    // Otherwise, whatever we find is remembered for the next search.
+    let store_in_cache = |matches: Vec<Match>, content_hash: Option<u64>, is_duplicate: bool| {
+        if let (Some(cache), Some(modified_at)) = (cache, modified_at) {
+            cache.store(&file_name, CachedFile {
+                file_size: file_size,
+                modified_at: modified_at,
+                file_class: Some(file_class),
+                content_hash: content_hash,
+                is_duplicate: is_duplicate,
+                matches: matches,
+            });
+        }
+    };
+
+    let policy = options.class_policies.get(file_class);
+
+    if policy == ClassPolicy::Skip {
+        store_in_cache(Vec::new(), None, false);
+        return;
+    }
+
+    let mut cached_matches = Vec::new();
+
+    let mut scan = |contents: &[u8], contents_offset: usize, accepted: Range<usize>, content_hash: Option<u64>| {
+        let mut matches = Vec::new();
+        scan_contents(contents, contents_offset, accepted, &file_name, content_hash, file_class, policy, options, regex_patterns, &mut matches);
+
+        if cache.is_some() {
+            cached_matches.extend(matches.iter().cloned());
+        }
+
+        send_matches(matches);
+    };
+
+    // If the file is too big, we stream it through in chunks.
+    if is_oversized {
+        let mut chunk_reader = ChunkReader::new(file, file_size as usize, options.chunk_size, chunk_lead, chunk_tail);
+
+        loop {
+            match chunk_reader.next_chunk() {
+                Ok(Some((contents, contents_offset, accepted))) => scan(contents, contents_offset, accepted, None),
+                Ok(None) => break,
+                Err(_) => {
+                    // A partially read file is never cached.
+                    send_error(format!("Failed to read the file: {}", path.display()));
+                    return;
+                },
+            }
+        }
+
+        store_in_cache(cached_matches, None, false);
+        return;
+    }
+
+    // We read (or map) the file's contents into memory for scanning.
+    let contents_result = read_contents(&mut file, file_size, options.mmap_threshold);
+
+    if contents_result.is_err() {
+        send_error(format!("Failed to read the file: {}", path.display()));
+        return;
+    }
+
+    let contents = contents_result.unwrap();
+
+    // Identical copies of a file (e.g. vendored libraries) are only scanned
+    // once, and the rest are recorded as duplicates of the first copy.
+    let content_hash = hash_contents(&contents);
+
+    if file_size > 0 && !statistics.duplicates.claim(&file_name, file_size, content_hash) {
+        store_in_cache(Vec::new(), Some(content_hash), true);
+        return;
+    }
+
+    scan(&contents, 0, 0..contents.len(), Some(content_hash));
+    store_in_cache(cached_matches, Some(content_hash), false);
+}
+
+
+pub fn run_search(options: &SearchOptions, regex_patterns: &CompiledPatterns, match_sender: &Mutex<SyncSender<Vec<Match>>>, error_sender: &Mutex<Sender<String>>, statistics: &SearchStatistics, cancelled: &AtomicBool) {
+    // Chunks overlap by the longest possible match plus the context window,
+    // so that no match (or its context) is ever cut in half.
+    let chunk_lead = options.desired_context;
+    let chunk_tail = regex_patterns.max_match_length.unwrap_or(UNBOUNDED_MATCH_LENGTH) + options.desired_context;
+
+    // Matches are sent back in batches, one per file (or chunk). If the
+    // consumer has gone away, we stop scanning altogether.
+    let send_matches = |matches: Vec<Match>| {
+        if matches.is_empty() {
+            return;
+        }
+
+        if match_sender.lock().unwrap().send(matches).is_err() {
+            cancelled.store(true, Ordering::Relaxed);
+        }
+    };
+
+    // Errors are reported on a best-effort basis, since the consumer may
+    // have already gone away.
+    let send_error = |error: String| {
+        error_sender.lock().unwrap().send(error).ok();
+    };
+
+    // If a cache was given, we load whatever it holds from the last search.
+    let cache = options.cache_path.as_ref().map(|cache_path| {
+        SearchCache::open(cache_path, options, regex_patterns, options.rebuild_cache)
+    });
+
+    // The walk itself is spread across our threads, with each thread reading
+    // directories and scanning files as it goes.
+    let mut walk_builder = WalkBuilder::new(&options.path);
+    walk_builder.standard_filters(false).threads(options.max_threads);
+
+    // Ignore files are compiled once per directory as the walk reaches them,
+    // and are shared with every entry beneath that directory. Hidden files
+    // are still scanned either way, since that is where secrets tend to hide.
+    walk_builder.add_custom_ignore_filename(IGNORE_FILE_NAME);
+
+    if options.use_ignore_files {
+        walk_builder
+            .git_ignore(true)
+            .git_exclude(true)
+            .ignore(true)
+            .parents(true)
+            .require_git(false);
+    }
+
+    // Excluded paths are checked before an entry is yielded, so excluded
+    // directories are never descended into.
+    if let Some(exclude_patterns) = options.exclude_patterns.clone() {
+        walk_builder.filter_entry(move |entry| {
+            !exclude_patterns.is_match(&entry.path().to_string_lossy())
+        });
+    }
+
+    walk_builder.build_parallel().run(|| {
+        Box::new(|result| {
+            if cancelled.load(Ordering::Relaxed) {
+                return WalkState::Quit;
+            }
+
+            // Entries that can't be read (e.g. due to permissions) are skipped.
+            let entry = match result {
+                Ok(entry) => entry,
+                Err(_) => return WalkState::Continue,
+            };
+
+            let file_type = match entry.file_type() {
+                Some(file_type) => file_type,
+                None => return WalkState::Continue,
+            };
+
+            if file_type.is_symlink() && options.skip_symlinks {
+                return WalkState::Continue;
+            } else if !file_type.is_file() {
+                if file_type.is_dir() {
+                    statistics.total_directories_scanned.fetch_add(1, Ordering::Relaxed);
+                }
+
+                return WalkState::Continue;
+            }
+
+            // If we've made it this far, the entry is a file.
+            statistics.total_files_scanned.fetch_add(1, Ordering::Relaxed);
+
+            search_file(entry.path(), options, regex_patterns, statistics, cache.as_ref(), chunk_lead, chunk_tail, &send_matches, &send_error);
+
+            WalkState::Continue
+        })
+    });
+
+    // The cache is only saved after a complete search, since an interrupted
+    // one would forget every file it didn't reach.
+    if let Some(cache) = &cache {
+        if !cancelled.load(Ordering::Relaxed) && cache.save().is_err() {
+            send_error(format!("Failed to save the cache: {}", options.cache_path.as_ref().unwrap()));
+        }
+    }
+
+    statistics.scan_completed_at.store(unix_timestamp(SystemTime::now()), Ordering::Relaxed);
+}
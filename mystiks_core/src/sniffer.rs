@@ -0,0 +1,142 @@
+// This is how many bytes from the start of a file are used to classify it.
+pub const SNIFF_LENGTH: usize = 8192;
+
+// These are the magic numbers of the compressed and archived formats we know.
+const COMPRESSED_SIGNATURES: [&[u8]; 9] = [
+    b"\x1f\x8b",                 // GZIP
+    b"PK\x03\x04",               // ZIP (and JAR, DOCX, APK, ...)
+    b"PK\x05\x06",               // ZIP (empty)
+    b"BZh",                      // BZIP2
+    b"\xfd7zXZ\x00",             // XZ
+    b"\x28\xb5\x2f\xfd",         // ZSTD
+    b"7z\xbc\xaf\x27\x1c",       // 7-Zip
+    b"Rar!\x1a\x07",             // RAR
+    b"\x04\x22\x4d\x18",         // LZ4
+];
+
+
+#[derive(Clone, Copy, PartialEq, Eq)]
+pub enum FileClass {
+    Text,
+    Utf16,
+    Compressed,
+    Binary,
+}
+
+
+impl FileClass {
+    pub const ALL: [FileClass; 4] = [FileClass::Text, FileClass::Utf16, FileClass::Compressed, FileClass::Binary];
+
+    pub fn name(&self) -> &'static str {
+        match self {
+            FileClass::Text => "text",
+            FileClass::Utf16 => "utf16",
+            FileClass::Compressed => "compressed",
+            FileClass::Binary => "binary",
+        }
+    }
+
+    pub fn from_name(name: &str) -> Option<FileClass> {
+        FileClass::ALL.iter().find(|file_class| file_class.name() == name).copied()
+    }
+
+    pub fn index(&self) -> usize {
+        *self as usize
+    }
+}
+
+
+#[derive(Clone, Copy, PartialEq, Eq)]
+pub enum ClassPolicy {
+    // The file is not scanned at all.
+    Skip,
+    // Only runs of printable characters are scanned, with their context still
+    // taken from the surrounding bytes.
+    Strings,
+    // The whole file is scanned.
+    Scan,
+    // The whole file is decoded into UTF-8 before it is scanned. This only
+    // applies to UTF-16 files, and is the same as scanning for anything else.
+    Decode,
+}
+
+
+impl ClassPolicy {
+    pub fn from_name(name: &str) -> Option<ClassPolicy> {
+        match name {
+            "skip" => Some(ClassPolicy::Skip),
+            "strings" => Some(ClassPolicy::Strings),
+            "scan" => Some(ClassPolicy::Scan),
+            "decode" => Some(ClassPolicy::Decode),
+            _ => None,
+        }
+    }
+}
+
+
+pub struct ClassPolicies {
+    policies: [ClassPolicy; 4],
+}
+
+
+impl Default for ClassPolicies {
+    fn default() -> ClassPolicies {
+        ClassPolicies {
+            policies: [ClassPolicy::Scan, ClassPolicy::Decode, ClassPolicy::Skip, ClassPolicy::Strings],
+        }
+    }
+}
+
+
+impl ClassPolicies {
+    pub fn get(&self, file_class: FileClass) -> ClassPolicy {
+        self.policies[file_class.index()]
+    }
+
+    pub fn set(&mut self, file_class: FileClass, policy: ClassPolicy) {
+        self.policies[file_class.index()] = policy;
+    }
+}
+
+
+pub fn sniff(head: &[u8]) -> FileClass {
+    let head = &head[..head.len().min(SNIFF_LENGTH)];
+
+    if COMPRESSED_SIGNATURES.iter().any(|signature| head.starts_with(signature)) {
+        return FileClass::Compressed;
+    }
+
+    if head.starts_with(b"\xff\xfe") || head.starts_with(b"\xfe\xff") {
+        return FileClass::Utf16;
+    }
+
+    // Without a BOM, UTF-16 text is spotted by NUL bytes which (nearly)
+    // always land on the same side of each pair of bytes.
+    let pair_count = head.len() / 2;
+
+    if pair_count >= 8 {
+        let even_nulls = head.iter().step_by(2).filter(|byte| **byte == 0).count();
+        let odd_nulls = head.iter().skip(1).step_by(2).filter(|byte| **byte == 0).count();
+
+        if (even_nulls > pair_count * 2 / 5 && odd_nulls < pair_count / 10) || (odd_nulls > pair_count * 2 / 5 && even_nulls < pair_count / 10) {
+            return FileClass::Utf16;
+        }
+    }
+
+    // Anything else with a NUL byte, or with a lot of control characters, is
+    // treated as binary. Bytes above ASCII are allowed, as they are common in
+    // UTF-8 and other text encodings.
+    if head.contains(&0) {
+        return FileClass::Binary;
+    }
+
+    let control_count = head.iter().filter(|byte| {
+        (**byte < 0x20 && !matches!(**byte, b'\t' | b'\n' | b'\r' | b'\x0c' | b'\x1b')) || **byte == 0x7f
+    }).count();
+
+    if control_count * 10 > head.len() {
+        return FileClass::Binary;
+    }
+
+    FileClass::Text
+}
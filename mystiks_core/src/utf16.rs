@@ -0,0 +1,172 @@
+use std::ops::Range;
+
+
+// This is the shortest run of UTF-16 characters that is treated as a region
+// of UTF-16 text when it is found inside of another file.
+const MIN_REGION_LENGTH: usize = 8;
+
+
+#[derive(Clone, Copy, PartialEq, Eq)]
+pub enum Encoding {
+    Utf8,
+    Utf16Le,
+    Utf16Be,
+}
+
+
+impl Encoding {
+    pub const ALL: [Encoding; 3] = [Encoding::Utf8, Encoding::Utf16Le, Encoding::Utf16Be];
+
+    pub fn name(&self) -> &'static str {
+        match self {
+            Encoding::Utf8 => "UTF-8",
+            Encoding::Utf16Le => "UTF-16LE",
+            Encoding::Utf16Be => "UTF-16BE",
+        }
+    }
+
+    pub fn index(&self) -> usize {
+        *self as usize
+    }
+
+    fn code_unit(&self, bytes: &[u8]) -> u16 {
+        match self {
+            Encoding::Utf16Be => u16::from_be_bytes([bytes[0], bytes[1]]),
+            _ => u16::from_le_bytes([bytes[0], bytes[1]]),
+        }
+    }
+}
+
+
+pub struct Transcoded {
+    // This is the region decoded into UTF-8.
+    pub text: Vec<u8>,
+    // This holds the file offset of every byte of the text, plus one more for
+    // the end of the region, so that any range of the text can be mapped back.
+    pub offsets: Vec<usize>,
+}
+
+
+impl Transcoded {
+    pub fn to_text_range(&self, file_range: &Range<usize>) -> Range<usize> {
+        // This maps a range of the file onto the bytes of the text which came
+        // from it.
+        let text_length = self.text.len();
+        let start = self.offsets[..text_length].partition_point(|offset| *offset < file_range.start);
+        let end = self.offsets[..text_length].partition_point(|offset| *offset < file_range.end);
+
+        start..end
+    }
+}
+
+
+pub fn detect_encoding(contents: &[u8], contents_offset: usize) -> Encoding {
+    // This is only used once a file is known to be UTF-16, and tells apart
+    // the byte order by its BOM, or by which side of each pair has the NULs.
+    // The contents may be a chunk starting at an odd offset, so pairs are
+    // lined up by their offset in the file rather than in the contents.
+    if contents_offset == 0 && contents.starts_with(b"\xfe\xff") {
+        return Encoding::Utf16Be;
+    } else if contents_offset == 0 && contents.starts_with(b"\xff\xfe") {
+        return Encoding::Utf16Le;
+    }
+
+    let first_even = contents_offset % 2;
+    let even_nulls = contents.iter().skip(first_even).step_by(2).filter(|byte| **byte == 0).count();
+    let odd_nulls = contents.iter().skip(1 - first_even).step_by(2).filter(|byte| **byte == 0).count();
+
+    if even_nulls > odd_nulls {
+        Encoding::Utf16Be
+    } else {
+        Encoding::Utf16Le
+    }
+}
+
+
+fn is_text_unit(contents: &[u8], index: usize, encoding: Encoding) -> bool {
+    // A unit is counted as text when it holds a printable ASCII character.
+    index + 1 < contents.len() && matches!(encoding.code_unit(&contents[index..index + 2]), 0x20..=0x7e | 0x09 | 0x0a | 0x0d)
+}
+
+
+pub fn find_regions(contents: &[u8]) -> Vec<(Range<usize>, Encoding)> {
+    // Inside of other files, UTF-16 text is found as runs of printable ASCII
+    // characters which are each paired with a NUL byte.
+    let mut regions: Vec<(Range<usize>, Encoding)> = Vec::new();
+
+    if !contents.contains(&0) {
+        return regions;
+    }
+
+    let mut index = 0;
+
+    while index + 1 < contents.len() {
+        let encoding = if is_text_unit(contents, index, Encoding::Utf16Le) {
+            Encoding::Utf16Le
+        } else if is_text_unit(contents, index, Encoding::Utf16Be) {
+            Encoding::Utf16Be
+        } else {
+            index += 1;
+            continue;
+        };
+
+        let region_start = index;
+
+        while is_text_unit(contents, index, encoding) {
+            index += 2;
+        }
+
+        if (index - region_start) / 2 < MIN_REGION_LENGTH {
+            index = region_start + 1;
+            continue;
+        }
+
+        regions.push((region_start..index, encoding));
+    }
+
+    regions
+}
+
+
+pub fn transcode(contents: &[u8], contents_offset: usize, region: Range<usize>, encoding: Encoding) -> Transcoded {
+    let mut text = Vec::with_capacity(region.len() / 2);
+    let mut offsets = Vec::with_capacity(region.len() / 2 + 1);
+    let mut buffer = [0; 4];
+    let mut index = region.start;
+
+    while index + 1 < region.end {
+        let unit = encoding.code_unit(&contents[index..index + 2]);
+        let mut unit_length = 2;
+
+        // Surrogate pairs are combined, and anything that can't be decoded is
+        // replaced, so that the text is always valid UTF-8.
+        let character = if (0xd800..0xdc00).contains(&unit) && index + 3 < region.end {
+            let low_unit = encoding.code_unit(&contents[index + 2..index + 4]);
+
+            if (0xdc00..0xe000).contains(&low_unit) {
+                unit_length = 4;
+                char::from_u32(0x10000 + (((unit as u32) - 0xd800) << 10) + ((low_unit as u32) - 0xdc00))
+            } else {
+                None
+            }
+        } else {
+            char::from_u32(unit as u32)
+        };
+
+        let encoded = character.unwrap_or(char::REPLACEMENT_CHARACTER).encode_utf8(&mut buffer);
+
+        for byte in encoded.bytes() {
+            text.push(byte);
+            offsets.push(contents_offset + index);
+        }
+
+        index += unit_length;
+    }
+
+    offsets.push(contents_offset + index);
+
+    Transcoded {
+        text: text,
+        offsets: offsets,
+    }
+}
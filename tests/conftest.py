@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+import pytest
+
+
+# This is the pattern most tests search for. Its keyword lets files without
+# it be skipped, and its length is bounded, so chunks only overlap a little.
+SECRET_PATTERN = ('0:Test Secret', r'SECRET-[0-9]{8}', None, ['SECRET-'])
+
+
+@pytest.fixture
+def core():
+    '''
+        This fixture gets the compiled core, skipping the test when it hasn't
+        been built.
+    '''
+    return pytest.importorskip('mystiks.mystiks_core')
+
+
+@pytest.fixture
+def search(core):
+    '''
+        This fixture searches a path with the given patterns (the test secret
+        by default), returning the finished stream and every match it found.
+    '''
+    def search(path, patterns=(SECRET_PATTERN,), **options):
+        stream = core.stream_regex_search(path=str(path), patterns=list(patterns), **options)
+        matches = list(stream)
+        return stream, matches
+
+    return search
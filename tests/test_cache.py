@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+from os import stat, utime
+
+import pytest
+from conftest import SECRET_PATTERN
+
+
+@pytest.fixture
+def cached_tree(tmp_path, search):
+    '''
+        This fixture searches a tree once to fill its cache, and then swaps
+        the file's secret for another one without changing its size or time.
+        Searches that use the cache still see the old secret, while the rest
+        see the new one.
+    '''
+    tree_path = tmp_path / 'tree'
+    tree_path.mkdir()
+    secret_path = tree_path / 'secrets.txt'
+    secret_path.write_text('value = SECRET-00000001\n')
+    cache_path = tmp_path / 'search.cache'
+
+    _, matches = search(tree_path, cache_path=str(cache_path))
+    assert [match.capture for match in matches] == [b'SECRET-00000001']
+    assert cache_path.exists()
+
+    file_stat = stat(secret_path)
+    secret_path.write_text('value = SECRET-00000002\n')
+    utime(secret_path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+
+    return tree_path, cache_path
+
+
+def test_unchanged_files_are_cached(cached_tree, search):
+    tree_path, cache_path = cached_tree
+
+    # The cached matches are replayed exactly as they were found.
+    _, first_matches = search(tree_path, cache_path=str(cache_path))
+    _, second_matches = search(tree_path, cache_path=str(cache_path))
+
+    assert [match.capture for match in first_matches] == [b'SECRET-00000001']
+    assert [(match.uuid, match.context, match.segment) for match in first_matches] == \
+        [(match.uuid, match.context, match.segment) for match in second_matches]
+
+
+@pytest.mark.parametrize('options', [
+    {'rebuild_cache': True},
+    {'desired_context': 4},
+    {'max_file_size': 1024 * 1024},
+    {'include_utf16': True},
+    {'file_policies': {'binary': 'skip'}},
+])
+def test_cache_fingerprint_options(cached_tree, search, options):
+    tree_path, cache_path = cached_tree
+
+    # Any option which changes the matches throws the cached ones away.
+    _, matches = search(tree_path, cache_path=str(cache_path), **options)
+    assert [match.capture for match in matches] == [b'SECRET-00000002']
+
+
+@pytest.mark.parametrize('patterns', [
+    [('1:Test Secret', SECRET_PATTERN[1], None, SECRET_PATTERN[3])],
+    [(SECRET_PATTERN[0], r'SECRET-[0-9]{7,8}', None, SECRET_PATTERN[3])],
+    [(SECRET_PATTERN[0], SECRET_PATTERN[1], None, ['SECRET'])],
+    [SECRET_PATTERN, ('0:Other Secret', r'OTHER-[0-9]{8}', None, None)],
+])
+def test_cache_fingerprint_patterns(cached_tree, search, patterns):
+    tree_path, cache_path = cached_tree
+
+    # So do any changes to the patterns, their tags or their keywords.
+    _, matches = search(tree_path, patterns=patterns, cache_path=str(cache_path))
+    assert [match.capture for match in matches] == [b'SECRET-00000002']
+
+
+def test_corrupt_cache(cached_tree, search):
+    tree_path, cache_path = cached_tree
+    cache_path.write_bytes(cache_path.read_bytes()[:-7])
+
+    # A cache that can't be read is treated as empty, and then replaced.
+    _, matches = search(tree_path, cache_path=str(cache_path))
+    assert [match.capture for match in matches] == [b'SECRET-00000002']
+
+    _, matches = search(tree_path, cache_path=str(cache_path))
+    assert [match.capture for match in matches] == [b'SECRET-00000002']
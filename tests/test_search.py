@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+import pytest
+from conftest import SECRET_PATTERN
+
+
+def test_keyword_prefiltering(tmp_path, search):
+    (tmp_path / 'plain.txt').write_text('value = SECRET-00000001\n')
+    (tmp_path / 'keyed.txt').write_text('Token = SECRET-00000002\n')
+
+    # The pattern matches both files, but only one of them has its keyword,
+    # which is looked for without regard to case.
+    keyed_pattern = ('0:Keyed Secret', r'SECRET-[0-9]{8}', None, ['token'])
+    _, matches = search(tmp_path, patterns=[keyed_pattern])
+
+    assert [match.capture for match in matches] == [b'SECRET-00000002']
+
+    # Patterns without keywords, or with an empty one, are always evaluated.
+    for keywords in (None, [], ['token', '']):
+        _, matches = search(tmp_path, patterns=[('0:Keyed Secret', r'SECRET-[0-9]{8}', None, keywords)])
+        assert sorted(match.capture for match in matches) == [b'SECRET-00000001', b'SECRET-00000002']
+
+
+def test_keywords_only_skip_their_own_patterns(tmp_path, search):
+    (tmp_path / 'secrets.txt').write_text('SECRET-00000001 PASSWORD-1234\n')
+
+    password_pattern = ('0:Password', r'PASSWORD-[0-9]{4}', None, ['PASSWORD-'])
+    missing_pattern = ('0:Missing', r'[0-9]{4}', None, ['MISSING'])
+    _, matches = search(tmp_path, patterns=[SECRET_PATTERN, password_pattern, missing_pattern])
+
+    assert sorted((match.pattern_tag, match.capture) for match in matches) == [
+        ('0:Password', b'PASSWORD-1234'),
+        ('0:Test Secret', b'SECRET-00000001'),
+    ]
+
+
+@pytest.mark.parametrize('chunk_size', [64, 100, 1000])
+def test_chunk_boundaries(tmp_path, search, chunk_size):
+    # Each secret straddles (or starts right at) a chunk boundary, and the
+    # file is far bigger than the maximum, so it is streamed in chunks.
+    contents = bytearray(b'x' * chunk_size * 40)
+    offsets = []
+
+    for index, boundary in enumerate(range(chunk_size, len(contents) - chunk_size, chunk_size)):
+        offset = boundary - index % 16
+        contents[offset - 1:offset + 16] = f' SECRET-{index:08d} '.encode()
+        offsets.append(offset)
+
+    (tmp_path / 'secrets.txt').write_bytes(bytes(contents))
+
+    _, matches = search(tmp_path, desired_context=24, max_file_size=chunk_size, chunk_size=chunk_size)
+    matches = sorted(matches, key=lambda match: match.capture_start)
+
+    # Every secret is found exactly once, with its full context, even though
+    # the chunks they were found in overlap.
+    assert [match.capture_start for match in matches] == offsets
+
+    for match in matches:
+        assert contents[match.capture_start:match.capture_end] == match.capture
+        assert match.context_start == max(0, match.capture_start - 24)
+        assert match.context_end == min(len(contents), match.capture_end + 24)
+        assert contents[match.context_start:match.context_end] == match.context
+
+
+def test_oversized_files_without_chunks(tmp_path, search):
+    (tmp_path / 'secrets.txt').write_text('SECRET-00000001' + 'x' * 1024)
+
+    # Without a chunk size, files over the maximum size are skipped entirely.
+    _, matches = search(tmp_path, max_file_size=1024)
+    assert matches == []
+
+    _, matches = search(tmp_path, max_file_size=1024, chunk_size=256)
+    assert [match.capture for match in matches] == [b'SECRET-00000001']
+
+
+def test_memory_mapped_files(tmp_path, search):
+    (tmp_path / 'secrets.txt').write_text('x' * 4096 + ' SECRET-00000001\n')
+
+    # Mapped and read files give exactly the same matches.
+    _, read_matches = search(tmp_path)
+    _, mapped_matches = search(tmp_path, mmap_threshold=1024)
+
+    assert [(match.capture_start, match.context) for match in mapped_matches] == \
+        [(match.capture_start, match.context) for match in read_matches]
+
+
+def test_duplicate_files(tmp_path, search):
+    (tmp_path / 'vendor').mkdir()
+
+    for file_name in ('first.txt', 'second.txt', 'vendor/third.txt'):
+        (tmp_path / file_name).write_text('value = SECRET-00000001\n')
+
+    (tmp_path / 'other.txt').write_text('value = SECRET-00000002\n')
+    (tmp_path / 'empty.txt').write_text('')
+    (tmp_path / 'also-empty.txt').write_text('')
+
+    stream, matches = search(tmp_path)
+    file_names = {str(tmp_path / file_name) for file_name in ('first.txt', 'second.txt', 'vendor/third.txt')}
+
+    # Whichever copy is reached first is scanned, and the rest are grouped
+    # under it. Empty files are never treated as copies of each other.
+    assert len(stream.duplicate_files) == 1
+    owner, copies = next(iter(stream.duplicate_files.items()))
+
+    assert owner in file_names
+    assert sorted(copies) == sorted(file_names - {owner})
+    assert sorted((match.file_name, match.capture) for match in matches) == sorted([
+        (owner, b'SECRET-00000001'),
+        (str(tmp_path / 'other.txt'), b'SECRET-00000002'),
+    ])
+
+
+def test_stable_match_ids(tmp_path, search):
+    for directory in ('first', 'second'):
+        (tmp_path / directory).mkdir()
+        (tmp_path / directory / 'secrets.txt').write_text('SECRET-00000001 SECRET-00000002\n')
+
+    _, first_matches = search(tmp_path / 'first')
+    _, repeated_matches = search(tmp_path / 'first')
+    _, second_matches = search(tmp_path / 'second')
+
+    def get_match_ids(matches):
+        return {match.capture: match.uuid for match in matches}
+
+    # Match IDs are the same from one search to the next, and follow a file's
+    # contents rather than its path, so copies of a file share them.
+    assert get_match_ids(first_matches) == get_match_ids(repeated_matches)
+    assert get_match_ids(first_matches) == get_match_ids(second_matches)
+    assert len(set(get_match_ids(first_matches).values())) == 2
+    assert all(len(match.uuid) == 32 for match in first_matches)
+
+
+def test_stable_chunked_match_ids(tmp_path, search):
+    for directory in ('first', 'second'):
+        (tmp_path / directory).mkdir()
+        (tmp_path / directory / 'secrets.txt').write_text('x' * 4096 + ' SECRET-00000001\n')
+
+    options = {'max_file_size': 1024, 'chunk_size': 1024}
+    _, first_matches = search(tmp_path / 'first', **options)
+    _, repeated_matches = search(tmp_path / 'first', **options)
+    _, second_matches = search(tmp_path / 'second', **options)
+
+    # Chunked files are never hashed as a whole, so their match IDs follow
+    # their path instead, though they are still stable between searches.
+    assert [match.uuid for match in first_matches] == [match.uuid for match in repeated_matches]
+    assert [match.uuid for match in first_matches] != [match.uuid for match in second_matches]
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+import pytest
+
+
+def create_secrets(count, spacing):
+    # Each secret is padded out, so that they land all over the chunks.
+    return ''.join(f'{"x" * spacing} SECRET-{index:08d}\n' for index in range(count))
+
+
+@pytest.mark.parametrize('encoding, core_encoding', [
+    ('utf-16-le', 'UTF-16LE'),
+    ('utf-16-be', 'UTF-16BE'),
+])
+def test_utf16_offsets(tmp_path, search, encoding, core_encoding):
+    text = create_secrets(20, 37)
+    contents = text.encode(encoding)
+    (tmp_path / 'secrets.txt').write_bytes(contents)
+
+    _, matches = search(tmp_path, desired_context=16)
+
+    assert sorted(match.capture for match in matches) == [f'SECRET-{index:08d}'.encode() for index in range(20)]
+
+    # Captures are transcoded, but their offsets still point into the file.
+    for match in matches:
+        assert match.encoding == core_encoding
+        assert contents[match.capture_start:match.capture_end].decode(encoding).encode() == match.capture
+
+
+@pytest.mark.parametrize('desired_context, chunk_size', [(127, 4096), (16, 4095), (33, 1001)])
+def test_chunked_utf16_with_odd_offsets(tmp_path, search, desired_context, chunk_size):
+    # Chunks start at their position minus the context, which is odd here, so
+    # the byte order has to be told apart by file offsets, not chunk indexes.
+    text = create_secrets(200, 101)
+    contents = text.encode('utf-16-le')
+    (tmp_path / 'secrets.txt').write_bytes(contents)
+
+    _, matches = search(tmp_path, desired_context=desired_context, max_file_size=1024, chunk_size=chunk_size)
+    captures = sorted(match.capture for match in matches)
+
+    assert captures == [f'SECRET-{index:08d}'.encode() for index in range(200)]
+    assert all(match.encoding == 'UTF-16LE' for match in matches)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+from base64 import standard_b64encode
+from json import dumps as to_json, loads as from_json
+from sqlite3 import connect as connect_sqlite
+
+import pytest
+
+from mystiks.manifests import get_zstd, load_manifest
+from mystiks.writers import HTMLManifestWriter, JSONManifestWriter, ManifestCollector, RatingSorter, \
+    SQLiteManifestWriter, MessagePackManifestWriter
+
+
+SEGMENTS = {
+    '0': b'token = "SECRET-00000001"\n\xff\xfe',
+    '1': b'SECRET-00000002 SECRET-00000003',
+}
+
+
+def create_entry(name, segment_id, capture_start, capture_end, rating):
+    segment = SEGMENTS[segment_id]
+
+    return {
+        'fileName': f'/srv/app/{segment_id}.txt',
+        'groups': [segment[capture_start:capture_end], b'\x00'],
+        'segment': segment_id,
+        'relativeContextStart': 0,
+        'relativeContextEnd': len(segment),
+        'contextStart': 100,
+        'contextEnd': 100 + len(segment),
+        'capture': segment[capture_start:capture_end],
+        'captureStart': 100 + capture_start,
+        'captureEnd': 100 + capture_end,
+        'relativeCaptureStart': capture_start,
+        'relativeCaptureEnd': capture_end,
+        'encoding': 'UTF-8',
+        'pattern': r'SECRET-[0-9]{8}',
+        'name': name,
+        'indicators': [('Capture matches pattern', 1), ('Capture is quoted', rating - 1)],
+        'rating': rating,
+        'idealRating': 4 if name == 'Test Secret' else 2
+    }
+
+
+# The findings are given out of order, with some relative ratings tied, so
+# that the sorting has to be stable.
+FINDINGS = {
+    'a' * 32: create_entry('Test Secret', '0', 9, 24, 2),
+    'b' * 32: create_entry('Test Secret', '1', 0, 15, 4),
+    'c' * 32: create_entry('Other Secret', '1', 16, 31, 1),
+    'd' * 32: create_entry('Other Secret', '1', 16, 31, 2),
+}
+
+
+def write_manifest(writers, is_complete=True):
+    '''
+        This function writes the test manifest out through every given writer,
+        in the same order that a search would. The writers are left open when
+        the manifest isn't complete, as if the search had failed.
+    '''
+    for segment_id, segment in SEGMENTS.items():
+        for writer in writers:
+            writer.write_segment(segment_id, segment)
+
+    with RatingSorter(batch_size=3) as sorting:
+        for uuid, entry in FINDINGS.items():
+            for writer in writers:
+                writer.write_finding(uuid, entry)
+
+            sorting.add(uuid, entry['rating'] / entry['idealRating'])
+
+        if not is_complete:
+            return
+
+        summary = {
+            'descriptions': {'Test Secret': ['A test secret.'], 'Other Secret': ['Another one.']},
+            'sorting': sorting,
+            'duplicateFiles': {'/srv/app/0.txt': ['/srv/app/copy.txt']},
+            'metadata': {'uuid': 'e' * 32, 'name': 'app', 'totalFilesScanned': 3},
+        }
+
+        for writer in writers:
+            writer.write_summary(summary)
+
+    for writer in writers:
+        writer.close()
+
+
+def test_rating_sorter():
+    with RatingSorter(batch_size=2) as sorting:
+        for index, rating in enumerate([0.5, 1, 0.25, 1, 0.5]):
+            sorting.add(str(index), rating)
+
+        # Ties keep the order they were added in, and the sorter can be read
+        # more than once.
+        assert len(sorting) == 5
+        assert list(sorting) == ['1', '3', '0', '4', '2']
+        assert list(sorting) == ['1', '3', '0', '4', '2']
+
+
+def test_manifest_collector():
+    collector = ManifestCollector()
+    write_manifest([collector])
+    manifest = collector.manifest
+
+    # Bytes are encoded as Base64, just as they are in the JSON report.
+    assert manifest['sorting'] == ['b' * 32, 'd' * 32, 'a' * 32, 'c' * 32]
+    assert manifest['findings']['a' * 32]['capture'] == standard_b64encode(b'SECRET-00000001').decode()
+    assert manifest['segments'] == {segment_id: standard_b64encode(segment).decode() for segment_id, segment in SEGMENTS.items()}
+
+
+@pytest.mark.parametrize('indent', [None, '  ', ' ' * 4])
+def test_json_writer_matches_dumps(tmp_path, indent):
+    collector = ManifestCollector()
+    write_manifest([collector, JSONManifestWriter(tmp_path / 'report.json', indent=indent)])
+
+    # Streaming the manifest out gives exactly what dumping it at once would,
+    # which is as compact as possible when it isn't indented.
+    separators = None if indent else (',', ':')
+    assert (tmp_path / 'report.json').read_text() == to_json(collector.manifest, indent=indent, separators=separators)
+
+    manifest = load_manifest(tmp_path / 'report.json')
+    assert manifest['segments'] == SEGMENTS
+    assert manifest['findings']['a' * 32]['capture'] == b'SECRET-00000001'
+
+
+def test_json_writer_without_findings(tmp_path):
+    collector = ManifestCollector()
+    writer = JSONManifestWriter(tmp_path / 'report.json', indent='  ')
+
+    with RatingSorter() as sorting:
+        summary = {'descriptions': {}, 'sorting': sorting, 'duplicateFiles': {}, 'metadata': {}}
+        collector.write_summary(summary)
+        writer.write_summary(summary)
+
+    writer.close()
+    assert (tmp_path / 'report.json').read_text() == to_json(collector.manifest, indent='  ')
+
+
+def test_json_writer_keeps_earlier_report(tmp_path):
+    (tmp_path / 'report.json').write_text('{}')
+    writer = JSONManifestWriter(tmp_path / 'report.json')
+    write_manifest([writer], is_complete=False)
+    writer.close()
+
+    # An incomplete report never replaces the last one, nor is it left behind.
+    assert (tmp_path / 'report.json').read_text() == '{}'
+    assert [path.name for path in tmp_path.iterdir()] == ['report.json']
+
+
+def read_script(path, prefix, suffix=''):
+    script = path.read_text()
+    assert script.startswith(prefix) and script.endswith(suffix)
+    return from_json(script[len(prefix):len(script) - len(suffix)])
+
+
+def test_html_writer_shards(tmp_path):
+    collector = ManifestCollector()
+    (tmp_path / 'shards').mkdir()
+    (tmp_path / 'shards' / '9.js').write_text('')
+    write_manifest([collector, HTMLManifestWriter(tmp_path, shard_size=3)])
+    manifest = from_json(to_json(collector.manifest))
+
+    index = read_script(tmp_path / 'data.js', 'window.manifest=')
+    assert index['totalFindings'] == 4
+    assert index['shards'] == [
+        {'count': 3, 'nameCounts': {'Test Secret': 2, 'Other Secret': 1}},
+        {'count': 1, 'nameCounts': {'Other Secret': 1}},
+    ]
+
+    # The shards hold the findings in order, along with the segments that
+    # they need, and replace any shards from an earlier report.
+    assert sorted(path.name for path in (tmp_path / 'shards').iterdir()) == ['0.js', '1.js']
+    sorting = []
+
+    for shard_index in range(2):
+        shard = read_script(tmp_path / 'shards' / f'{shard_index}.js', f'shards.receiveShard({shard_index},', ');')
+        sorting.extend(shard['sorting'])
+
+        assert list(shard['findings']) == shard['sorting']
+        assert shard['findings'] == {uuid: manifest['findings'][uuid] for uuid in shard['sorting']}
+        assert shard['segments'] == {entry['segment']: manifest['segments'][entry['segment']] for entry in shard['findings'].values()}
+
+    assert sorting == manifest['sorting']
+
+
+def test_sqlite_writer_round_trip(tmp_path):
+    collector = ManifestCollector()
+    write_manifest([collector, SQLiteManifestWriter(tmp_path / 'report.sqlite', batch_size=3)])
+    connection = connect_sqlite(tmp_path / 'report.sqlite')
+
+    # Every finding can be put back together from its rows, with its bytes
+    # stored as they were, and its context cut from its segment.
+    rows = connection.execute('''
+        SELECT findings.uuid, files.name, findings.name, findings.rating, findings.capture, findings.capture_start, contexts.data
+        FROM findings
+        JOIN files ON files.id = findings.file_id
+        JOIN contexts ON contexts.finding_uuid = findings.uuid
+        ORDER BY findings.sort_index
+    ''').fetchall()
+
+    assert [row[0] for row in rows] == collector.manifest['sorting']
+
+    for uuid, file_name, name, rating, capture, capture_start, context in rows:
+        entry = FINDINGS[uuid]
+        assert (file_name, name, rating, capture, capture_start) == \
+            (entry['fileName'], entry['name'], entry['rating'], entry['capture'], entry['captureStart'])
+        assert context == SEGMENTS[entry['segment']]
+
+        groups = connection.execute('SELECT data FROM groups WHERE finding_uuid = ? ORDER BY position', (uuid,)).fetchall()
+        assert [group for group, in groups] == entry['groups']
+
+        indicators = connection.execute('SELECT description, delta FROM indicators WHERE finding_uuid = ? ORDER BY position', (uuid,)).fetchall()
+        assert indicators == entry['indicators']
+
+    assert dict(connection.execute('SELECT key, value FROM metadata')) == {'uuid': '"' + 'e' * 32 + '"', 'name': '"app"', 'totalFilesScanned': '3'}
+    assert connection.execute('SELECT files.name, duplicate_files.name FROM duplicate_files JOIN files ON files.id = duplicate_files.file_id').fetchall() == \
+        [('/srv/app/0.txt', '/srv/app/copy.txt')]
+
+    # Prefix queries on file names are able to use their index.
+    plan = connection.execute("EXPLAIN QUERY PLAN SELECT id FROM files WHERE name GLOB '/srv/app/*'").fetchall()
+    assert any('USING COVERING INDEX' in row[-1] for row in plan)
+
+    connection.close()
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip', 'zstd'])
+def test_msgpack_writer_round_trip(tmp_path, compression):
+    pytest.importorskip('msgpack')
+
+    if compression == 'zstd':
+        try:
+            get_zstd()
+        except ImportError:
+            pytest.skip('Zstandard is not available')
+
+    collector = ManifestCollector()
+    write_manifest([collector, MessagePackManifestWriter(tmp_path / 'report.msgpack', compression)])
+    manifest = load_manifest(tmp_path / 'report.msgpack')
+
+    # Bytes come back raw, and everything else is just as it was written,
+    # except that tuples come back as lists.
+    assert manifest['findings'] == {
+        uuid: {**entry, 'indicators': [list(indicator) for indicator in entry['indicators']]}
+        for uuid, entry in FINDINGS.items()
+    }
+    assert manifest['segments'] == SEGMENTS
+    assert manifest['sorting'] == collector.manifest['sorting']
+    assert {section: manifest[section] for section in ('descriptions', 'duplicateFiles', 'metadata')} == \
+        {section: collector.manifest[section] for section in ('descriptions', 'duplicateFiles', 'metadata')}
+
+
+def test_msgpack_writer_keeps_earlier_report(tmp_path):
+    pytest.importorskip('msgpack')
+
+    (tmp_path / 'report.msgpack').write_bytes(b'')
+    writer = MessagePackManifestWriter(tmp_path / 'report.msgpack')
+    write_manifest([writer], is_complete=False)
+    writer.close()
+
+    assert (tmp_path / 'report.msgpack').read_bytes() == b''
+    assert [path.name for path in tmp_path.iterdir()] == ['report.msgpack']